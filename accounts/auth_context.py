@@ -0,0 +1,262 @@
+from functools import cached_property
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from accounts.models import Organization, OrganizationMember, Profile
+
+
+# =====================================================
+# 🪪 REQUEST AUTH CONTEXT
+# =====================================================
+#
+# What the middleware, context processors and AI access checks need to
+# know about a user's organization state, resolved once per request:
+#
+#   auth_context(user)    memoized on the user object (= per request
+#                         for request.user), also set as
+#                         request.auth_context by the middleware
+#   snapshot              plain values (profile flags, active
+#                         memberships), read on first use and cached per
+#                         user in AUTH_CONTEXT_CACHE for AUTH_CONTEXT_TTL
+#                         when that cache is shared between processes
+#   profile, organization model instances, loaded on demand and only
+#                         memoized for the request
+#
+# Saving or deleting a Profile, OrganizationMember or Organization
+# drops the cached snapshots it affects. Invalidation only reaches the
+# process that made the change in a per-process cache (LocMemCache),
+# and snapshots also decide document access (documents.access), so
+# with one the snapshot is only memoized for the request.
+
+CACHE_KEY = "auth:ctx:v1:{}"
+
+
+def _cache():
+    """
+    The cross-request snapshot cache, or None if it is per-process.
+    """
+    cache = caches[settings.AUTH_CONTEXT_CACHE]
+    return None if isinstance(cache, LocMemCache) else cache
+
+
+def _load_snapshot(user_id):
+    profile = (
+        Profile.objects
+        .filter(user_id=user_id)
+        .values(
+            "role",
+            "is_active",
+            "must_change_password",
+            "organization_id",
+            "organization__is_active",
+        )
+        .first()
+    )
+
+    memberships = list(
+        OrganizationMember.objects
+        .filter(user_id=user_id, is_active=True)
+        .order_by("pk")
+        .values_list("organization_id", "role", "organization__is_active")
+    )
+
+    return {"profile": profile, "memberships": memberships}
+
+
+class AuthContext:
+    """
+    Identity and permission flags of one user. Fields are computed on
+    first access; anonymous users and superusers never touch the
+    database.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def __repr__(self):
+        return f"<AuthContext user={getattr(self.user, 'pk', None)}>"
+
+    @property
+    def is_authenticated(self):
+        return bool(self.user and self.user.is_authenticated)
+
+    @property
+    def is_superuser(self):
+        return self.is_authenticated and self.user.is_superuser
+
+    @cached_property
+    def snapshot(self):
+        if not self.is_authenticated:
+            return {"profile": None, "memberships": []}
+
+        cache = _cache()
+        if cache is None:
+            return _load_snapshot(self.user.pk)
+
+        key = CACHE_KEY.format(self.user.pk)
+
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = _load_snapshot(self.user.pk)
+            cache.set(key, snapshot, settings.AUTH_CONTEXT_TTL)
+        return snapshot
+
+    # =========================
+    # PROFILE
+    # =========================
+    @property
+    def has_profile(self):
+        return self.snapshot["profile"] is not None
+
+    def _profile_value(self, name, default=None):
+        profile = self.snapshot["profile"]
+        return profile[name] if profile else default
+
+    @property
+    def role(self):
+        return self._profile_value("role")
+
+    @property
+    def is_active(self):
+        return self._profile_value("is_active", False)
+
+    @property
+    def must_change_password(self):
+        return self._profile_value("must_change_password", False)
+
+    @cached_property
+    def profile(self):
+        """
+        The Profile instance (None if missing).
+        """
+        if not self.is_authenticated or not self.has_profile:
+            return None
+        try:
+            return self.user.profile
+        except Profile.DoesNotExist:
+            return None
+
+    # =========================
+    # ORGANIZATION
+    # =========================
+    @property
+    def organization_suspended(self):
+        """
+        The profile's organization exists but is inactive.
+        """
+        return (
+            self._profile_value("organization_id") is not None
+            and not self._profile_value("organization__is_active")
+        )
+
+    @property
+    def organization_id(self):
+        """
+        Id of the profile's organization, if active.
+        """
+        if self.organization_suspended:
+            return None
+        return self._profile_value("organization_id")
+
+    @cached_property
+    def organization(self):
+        """
+        The profile's Organization, if active (get_user_organization).
+        """
+        if self.organization_id is None:
+            return None
+        return Organization.objects.filter(pk=self.organization_id).first()
+
+    @property
+    def membership(self):
+        """
+        (organization_id, role, organization_active) of the first active
+        membership, or None.
+        """
+        memberships = self.snapshot["memberships"]
+        return memberships[0] if memberships else None
+
+    @property
+    def member_organization_id(self):
+        """
+        Organization of the first active membership: the one documents,
+        corpus statistics and AI quota are scoped to.
+        """
+        return self.membership[0] if self.membership else None
+
+    @cached_property
+    def member_organization(self):
+        if self.member_organization_id is None:
+            return None
+        return Organization.objects.filter(pk=self.member_organization_id).first()
+
+    # =========================
+    # PERMISSIONS
+    # =========================
+    @cached_property
+    def is_org_admin(self):
+        if not self.is_authenticated:
+            return False
+        if self.is_superuser:
+            return True
+
+        return any(
+            role == OrganizationMember.ROLE_ADMIN and org_active
+            for _, role, org_active in self.snapshot["memberships"]
+        )
+
+    @cached_property
+    def can_manage_documents(self):
+        if not self.is_authenticated:
+            return False
+        if self.is_superuser or self.role == Profile.ROLE_PREMIUM:
+            return True
+        return self.is_org_admin
+
+    @property
+    def can_manage_org_users(self):
+        return self.is_org_admin
+
+    def ai_access(self):
+        """
+        (allowed, error message).
+        """
+        if not self.is_authenticated:
+            return False, "Login required"
+
+        if self.is_superuser:
+            return True, None
+
+        if self.membership is None:
+            return False, "AI access restricted"
+
+        _, _, org_active = self.membership
+        if not org_active:
+            return False, "Organization is inactive"
+
+        return True, None
+
+
+def auth_context(user):
+    """
+    The AuthContext of `user`, memoized on the user object.
+    """
+    if user is None:
+        return AuthContext(None)
+
+    context = getattr(user, "_auth_context", None)
+    if context is None:
+        context = AuthContext(user)
+        user._auth_context = context
+    return context
+
+
+def invalidate_auth_context(*user_ids):
+    """
+    Drop cached snapshots (accounts.signals calls this on changes).
+    """
+    cache = _cache()
+    if cache is not None:
+        cache.delete_many([CACHE_KEY.format(user_id) for user_id in user_ids])
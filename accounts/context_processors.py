@@ -1,32 +1,25 @@
-from accounts.models import Profile
-from accounts.utils import (
-    is_org_admin,
-    can_manage_documents,
-    can_manage_org_users,
-    get_user_organization,
-)
+from django.utils.functional import SimpleLazyObject
+
+from accounts.auth_context import auth_context
 
 
 def user_profile(request):
     """
     Expose the authenticated user's profile to templates.
     Read-only. Never create DB objects here.
+    Loaded only if a template uses them.
     """
-    if request.user.is_authenticated:
-        try:
-            return {
-                "profile": request.user.profile,
-                "organization": get_user_organization(request.user),
-            }
-        except Profile.DoesNotExist:
-            return {
-                "profile": None,
-                "organization": None,
-            }
+    context = auth_context(request.user)
+
+    if not context.is_authenticated:
+        return {
+            "profile": None,
+            "organization": None,
+        }
 
     return {
-        "profile": None,
-        "organization": None,
+        "profile": SimpleLazyObject(lambda: context.profile),
+        "organization": SimpleLazyObject(lambda: context.organization),
     }
 
 
@@ -35,10 +28,10 @@ def permissions_context(request):
     Centralized permission flags for templates.
     Templates should NEVER query models directly.
     """
-    user = request.user
+    context = auth_context(request.user)
 
     return {
-        "is_org_admin": is_org_admin(user),
-        "can_manage_documents": can_manage_documents(user),
-        "can_manage_org_users": can_manage_org_users(user),
+        "is_org_admin": context.is_org_admin,
+        "can_manage_documents": context.can_manage_documents,
+        "can_manage_org_users": context.can_manage_org_users,
     }
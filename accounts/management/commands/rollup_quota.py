@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from accounts.services.quota import rollup_ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold pending quota ledger entries into Organization.api_tokens_used. "
+        "Run it periodically (e.g. every minute from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="Ledger entries applied per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+
+        while applied := rollup_ledger(batch_size=options["batch_size"]):
+            total += applied
+
+        self.stdout.write(f"[QUOTA] rolled up {total} ledger entries")
@@ -1,11 +1,24 @@
 # accounts/middleware.py
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.shortcuts import redirect, render
 from django.urls import resolve
 from django.http import HttpResponseForbidden
 from django.contrib import messages
 
-from accounts.models import Profile, OrganizationMember
+from accounts.auth_context import auth_context
+from accounts.models import Profile
+
+
+def _load_auth_context(request):
+    """
+    request.user and the auth context snapshot: everything the checks
+    need from the database.
+    """
+    context = auth_context(request.user)
+    if context.is_authenticated and not context.is_superuser:
+        context.snapshot  # resolved here, in the caller's thread
+    return context
 
 
 class RolePermissionMiddleware:
@@ -17,35 +30,58 @@ class RolePermissionMiddleware:
     - Role-based route protection
 
     Superusers bypass all restrictions.
+
+    Sets request.auth_context (accounts.auth_context): one lazily
+    resolved, cached view of the user's profile / organization state
+    shared with the context processors and views.
+
+    Async-capable: under ASGI only the user / snapshot load runs in a
+    thread, async views (chat streaming) stay on the event loop.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request.auth_context = context = _load_auth_context(request)
+        return self.check(request, context) or self.get_response(request)
+
+    async def __acall__(self, request):
+        request.auth_context = context = await sync_to_async(_load_auth_context)(request)
+        return self.check(request, context) or await self.get_response(request)
+
+    def check(self, request, context):
+        """
+        The response that stops the request, or None to let it through.
+        Works on the loaded context only (no queries).
+        """
 
         # --------------------------------------------------
         # Allow anonymous users
         # --------------------------------------------------
-        if not request.user.is_authenticated:
-            return self.get_response(request)
-
-        user = request.user
+        if not context.is_authenticated:
+            return None
 
         # --------------------------------------------------
         # SUPERUSER BYPASS
         # --------------------------------------------------
-        if user.is_superuser:
-            return self.get_response(request)
+        if context.is_superuser:
+            return None
 
         # --------------------------------------------------
-        # Load Profile
+        # Profile
         # --------------------------------------------------
-        try:
-            profile = user.profile
-        except Profile.DoesNotExist:
+        if not context.has_profile:
             messages.error(request, "User profile missing.")
-            return redirect("document_list")
+            return redirect("documents:document_list")
 
         resolver = resolve(request.path)
         view_name = resolver.view_name or ""
@@ -59,7 +95,7 @@ class RolePermissionMiddleware:
             "logout",
         }
 
-        if profile.must_change_password and view_name not in allowed_password_views:
+        if context.must_change_password and view_name not in allowed_password_views:
             messages.warning(
                 request,
                 "You must change your password before continuing."
@@ -69,7 +105,7 @@ class RolePermissionMiddleware:
         # --------------------------------------------------
         # USER SUSPENDED
         # --------------------------------------------------
-        if not profile.is_active:
+        if not context.is_active:
             return render(
                 request,
                 "accounts/suspended.html",
@@ -79,7 +115,7 @@ class RolePermissionMiddleware:
         # --------------------------------------------------
         # ORGANIZATION SUSPENDED
         # --------------------------------------------------
-        if profile.organization and not profile.organization.is_active:
+        if context.organization_suspended:
             return render(
                 request,
                 "accounts/org_suspended.html",
@@ -102,7 +138,7 @@ class RolePermissionMiddleware:
         # ORGANIZATION ADMIN ROUTES
         # --------------------------------------------------
         if request.path.startswith("/accounts/org/"):
-            if not profile.is_org_admin:
+            if context.role != Profile.ROLE_ORG_ADMIN:
                 return HttpResponseForbidden(
                     "Organization admin access only."
                 )
@@ -111,21 +147,15 @@ class RolePermissionMiddleware:
         # CHAT / AI ACCESS
         # --------------------------------------------------
         if view_name.startswith("chat_"):
-            member = (
-                OrganizationMember.objects
-                .filter(user=user, is_active=True)
-                .select_related("organization")
-                .first()
-            )
-
-            if not member:
+            if context.membership is None:
                 messages.warning(
                     request,
                     "Join an organization to use AI features."
                 )
-                return redirect("document_list")
+                return redirect("documents:document_list")
 
-            if not member.organization or not member.organization.is_active:
+            _, _, org_active = context.membership
+            if not org_active:
                 return HttpResponseForbidden("Organization inactive")
 
-        return self.get_response(request)
+        return None
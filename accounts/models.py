@@ -241,3 +241,74 @@ class OrganizationInvite(models.Model):
 
     def __str__(self):
         return f"{self.email} → {self.organization.name}"
+
+
+# ============================
+# 🧮 TOKEN USAGE (PER LLM CALL)
+# ============================
+
+class TokenUsage(models.Model):
+    """
+    One row per model call: provider-reported tokens when available,
+    tiktoken counts otherwise (`estimated`).
+    """
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="token_usage"
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="token_usage"
+    )
+
+    model = models.CharField(max_length=100)
+    purpose = models.CharField(max_length=50)
+
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    total_tokens = models.PositiveIntegerField(default=0)
+    reserved_tokens = models.PositiveIntegerField(default=0)
+    estimated = models.BooleanField(default=False)
+
+    latency_ms = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["organization", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.organization} → {self.model} ({self.total_tokens})"
+
+
+# ============================
+# 📒 QUOTA LEDGER (APPEND-ONLY)
+# ============================
+
+class QuotaLedgerEntry(models.Model):
+    """
+    Pending quota adjustment (signed tokens), folded into
+    Organization.api_tokens_used by accounts.services.quota.rollup_ledger.
+    """
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name="quota_ledger"
+    )
+
+    tokens = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.organization} {self.tokens:+d}"
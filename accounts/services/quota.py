@@ -1,31 +1,108 @@
+from collections import defaultdict
+
 from django.db import transaction
-from django.core.exceptions import PermissionDenied
+from django.db.models import F
+from django.db.models.functions import Greatest
 
-from accounts.models import Organization
+from accounts.models import Organization, QuotaLedgerEntry
 
 
 class QuotaExceeded(Exception):
     pass
 
 
-@transaction.atomic
+# =========================
+# HOW THE QUOTA STAYS CONSISTENT WITHOUT ROW LOCKS
+# =========================
+#
+# - consume_tokens() is a single conditional UPDATE
+#   (used + n <= limit). The database applies it atomically, so
+#   concurrent callers can never overspend. The row is locked only for
+#   that statement, never across the model call or the caller's work.
+# - settle_tokens() never touches the organization row. It appends the
+#   difference between reserved and used tokens to QuotaLedgerEntry.
+# - rollup_ledger() folds pending entries into api_tokens_used. It runs
+#   from `manage.py rollup_quota` (cron) and on demand when a
+#   reservation would otherwise be refused.
+
+
+def _try_consume(organization_id, tokens):
+    return Organization.objects.filter(
+        id=organization_id,
+        api_tokens_used__lte=F("api_token_limit") - tokens,
+    ).update(api_tokens_used=F("api_tokens_used") + tokens)
+
+
 def consume_tokens(*, organization: Organization, tokens: int):
     """
-    Deduct tokens safely from organization quota.
+    Deduct tokens from organization quota, or raise QuotaExceeded.
     """
 
-    if not organization:
+    if not organization or tokens <= 0:
         # Global / superuser usage (no quota)
         return
 
-    # Lock row to prevent race condition
-    org = Organization.objects.select_for_update().get(id=organization.id)
+    if _try_consume(organization.id, tokens):
+        return
+
+    # Refunds may still be pending in the ledger: fold them in and retry
+    rollup_ledger(organization=organization)
 
-    if org.api_tokens_used + tokens > org.api_token_limit:
-        raise QuotaExceeded(
-            f"API quota exceeded for {org.name}. "
-            f"Limit={org.api_token_limit}, Used={org.api_tokens_used}"
+    if _try_consume(organization.id, tokens):
+        return
+
+    org = Organization.objects.get(id=organization.id)
+    raise QuotaExceeded(
+        f"API quota exceeded for {org.name}. "
+        f"Limit={org.api_token_limit}, Used={org.api_tokens_used}"
+    )
+
+
+def settle_tokens(*, organization: Organization, reserved: int, used: int):
+    """
+    Replace a reservation made with consume_tokens() by the tokens
+    actually used. Never blocks: the call has already happened, so an
+    overrun is billed even if it crosses the limit.
+    """
+
+    if not organization or reserved == used:
+        return
+
+    QuotaLedgerEntry.objects.create(
+        organization_id=organization.id,
+        tokens=used - reserved,
+    )
+
+
+def rollup_ledger(*, organization: Organization | None = None, batch_size=10_000):
+    """
+    Apply pending ledger entries to api_tokens_used and remove them.
+    Rows claimed by a concurrent rollup are skipped, never applied twice.
+    Returns the number of entries applied.
+    """
+
+    entries = QuotaLedgerEntry.objects.order_by("id")
+    if organization:
+        entries = entries.filter(organization_id=organization.id)
+
+    with transaction.atomic():
+        claimed = list(
+            entries.select_for_update(skip_locked=True)
+            .values_list("id", "organization_id", "tokens")[:batch_size]
         )
+        if not claimed:
+            return 0
+
+        totals = defaultdict(int)
+        for _, organization_id, tokens in claimed:
+            totals[organization_id] += tokens
+
+        for organization_id, tokens in totals.items():
+            if tokens:
+                Organization.objects.filter(id=organization_id).update(
+                    api_tokens_used=Greatest(F("api_tokens_used") + tokens, 0)
+                )
+
+        QuotaLedgerEntry.objects.filter(id__in=[c[0] for c in claimed]).delete()
 
-    org.api_tokens_used += tokens
-    org.save(update_fields=["api_tokens_used"])
+    return len(claimed)
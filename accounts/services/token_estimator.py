@@ -1,3 +1,9 @@
+from functools import lru_cache
+
+import tiktoken
+from django.conf import settings
+
+
 def estimate_tokens(text: str) -> int:
     """
     Rough token estimation.
@@ -6,3 +12,50 @@ def estimate_tokens(text: str) -> int:
     if not text:
         return 0
     return max(1, len(text) // 4)
+
+
+@lru_cache(maxsize=None)
+def get_model_encoding(model=None):
+    """
+    tiktoken encoding of `model`, falling back to CHUNK_ENCODING for
+    unknown models or when the model's encoding can't be loaded.
+    """
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except Exception as e:
+            print(f"[TOKENS] no encoding for {model!r} ({e}); using {settings.CHUNK_ENCODING}")
+    return tiktoken.get_encoding(settings.CHUNK_ENCODING)
+
+
+def count_tokens(text: str, model=None) -> int:
+    """
+    Exact token count of `text` for `model` (tiktoken).
+    """
+    if not text:
+        return 0
+    return len(get_model_encoding(model).encode_ordinary(text))
+
+
+# Chat format overhead (OpenAI cookbook): every message is wrapped in
+# role/separator tokens and the reply is primed with a few more.
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+REPLY_PRIMING_TOKENS = 3
+
+
+def count_message_tokens(messages: list[dict], model=None) -> int:
+    """
+    Prompt tokens a chat completion request with `messages` is billed for.
+    """
+    encoding = get_model_encoding(model)
+    total = REPLY_PRIMING_TOKENS
+
+    for message in messages:
+        total += TOKENS_PER_MESSAGE
+        for key, value in message.items():
+            total += len(encoding.encode_ordinary(str(value)))
+            if key == "name":
+                total += TOKENS_PER_NAME
+
+    return total
@@ -0,0 +1,104 @@
+import time
+
+from django.conf import settings
+
+from accounts.models import TokenUsage
+from accounts.services.quota import consume_tokens, settle_tokens
+from accounts.services.token_estimator import count_message_tokens, count_tokens
+
+
+# =========================
+# RESERVE → CALL → RECORD
+# =========================
+#
+#   reservation = reserve_usage(...)      # before the model call
+#   try:
+#       response = client.chat.completions.create(...)
+#   except Exception:
+#       release_usage(reservation)
+#       raise
+#   record_usage(reservation, usage=response.usage, completion_text=...)
+#
+# The reservation (exact prompt tokens + the completion cap) is taken
+# from the organization quota up front, so concurrent calls can't
+# overspend it; record_usage() then settles it to what the provider
+# reports and writes a TokenUsage row.
+
+
+def reserve_usage(
+    *,
+    organization,
+    user=None,
+    model: str,
+    messages: list[dict],
+    purpose: str,
+    max_completion_tokens=None,
+):
+    """
+    Reserve quota for a chat completion. Raises QuotaExceeded.
+    """
+
+    prompt_tokens = count_message_tokens(messages, model)
+    completion_tokens = max_completion_tokens or settings.CONTEXT_ANSWER_TOKENS
+    reserved = prompt_tokens + completion_tokens
+
+    consume_tokens(organization=organization, tokens=reserved)
+
+    return {
+        "organization": organization,
+        "user": user,
+        "model": model,
+        "purpose": purpose,
+        "prompt_tokens": prompt_tokens,
+        "reserved": reserved,
+        "started": time.perf_counter(),
+    }
+
+
+def release_usage(reservation):
+    """
+    Return a reservation whose call failed before producing output.
+    """
+
+    settle_tokens(
+        organization=reservation["organization"],
+        reserved=reservation["reserved"],
+        used=0,
+    )
+
+
+def record_usage(reservation, *, usage=None, completion_text=""):
+    """
+    Settle a reservation against provider `usage` (falls back to
+    tiktoken counts, e.g. for an interrupted stream) and log the call.
+    """
+
+    if usage is not None:
+        prompt_tokens = usage.prompt_tokens
+        completion_tokens = usage.completion_tokens
+    else:
+        prompt_tokens = reservation["prompt_tokens"]
+        completion_tokens = count_tokens(completion_text, reservation["model"])
+
+    total = prompt_tokens + completion_tokens
+
+    settle_tokens(
+        organization=reservation["organization"],
+        reserved=reservation["reserved"],
+        used=total,
+    )
+
+    user = reservation["user"]
+
+    return TokenUsage.objects.create(
+        organization=reservation["organization"],
+        user=user if user is not None and user.is_authenticated else None,
+        model=reservation["model"],
+        purpose=reservation["purpose"],
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=total,
+        reserved_tokens=reservation["reserved"],
+        estimated=usage is None,
+        latency_ms=round((time.perf_counter() - reservation["started"]) * 1000),
+    )
@@ -1,10 +1,11 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_in
 from django.utils import timezone
 
-from accounts.models import Profile
+from accounts.auth_context import invalidate_auth_context
+from accounts.models import Organization, OrganizationMember, Profile
 from accounts.utils import sync_user_permissions
 
 
@@ -69,3 +70,38 @@ def update_last_login_timestamp(sender, user, request, **kwargs):
     Profile.objects.filter(user=user).update(
         last_login_at=timezone.now()
     )
+
+
+# ============================
+# 🪪 INVALIDATE CACHED AUTH CONTEXT
+# ============================
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=OrganizationMember)
+@receiver(post_delete, sender=OrganizationMember)
+def invalidate_user_auth_context(sender, instance, **kwargs):
+    """
+    Profile / membership changes affect that user's auth context.
+    """
+    invalidate_auth_context(instance.user_id)
+
+
+@receiver(post_save, sender=Organization)
+def invalidate_org_auth_context(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Activating / suspending an organization affects all its users.
+    Deletes cascade to profiles and memberships, covered above.
+    """
+    # is_active is the only organization field the context holds
+    if created or (update_fields is not None and "is_active" not in update_fields):
+        return
+
+    user_ids = set(
+        Profile.objects.filter(organization=instance).values_list("user_id", flat=True)
+    )
+    user_ids.update(
+        OrganizationMember.objects.filter(organization=instance).values_list("user_id", flat=True)
+    )
+    if user_ids:
+        invalidate_auth_context(*user_ids)
@@ -1,3 +1,253 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from accounts.auth_context import auth_context
+from accounts.context_processors import permissions_context, user_profile
+from accounts.middleware import RolePermissionMiddleware
+from accounts.models import Organization, OrganizationMember, QuotaLedgerEntry
+from accounts.utils import is_org_admin
+from accounts.services.quota import (
+    QuotaExceeded,
+    consume_tokens,
+    rollup_ledger,
+    settle_tokens,
+)
+from rag.views import check_ai_access
+
+
+class QuotaLedgerTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Ledger", api_token_limit=1000)
+
+    def test_settlement_is_applied_on_rollup(self):
+        consume_tokens(organization=self.org, tokens=600)
+        settle_tokens(organization=self.org, reserved=600, used=250)
+
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.api_tokens_used, 600)
+
+        self.assertEqual(rollup_ledger(), 1)
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.api_tokens_used, 250)
+        self.assertFalse(QuotaLedgerEntry.objects.exists())
+
+    def test_pending_refund_is_used_before_refusing(self):
+        consume_tokens(organization=self.org, tokens=900)
+        settle_tokens(organization=self.org, reserved=900, used=100)
+
+        consume_tokens(organization=self.org, tokens=800)
+
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.api_tokens_used, 900)
+
+    def test_limit_is_enforced(self):
+        consume_tokens(organization=self.org, tokens=1000)
+
+        with self.assertRaises(QuotaExceeded):
+            consume_tokens(organization=self.org, tokens=1)
+
+
+# Needs a database with real concurrent writers (PostgreSQL)
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class QuotaConcurrencyTests(TransactionTestCase):
+    workers = 16
+    calls_per_worker = 10
+    tokens_per_call = 10
+
+    def test_concurrent_consumers_never_overspend(self):
+        # Room for 125 of the 160 calls
+        org = Organization.objects.create(name="Busy", api_token_limit=1250)
+
+        barrier = threading.Barrier(self.workers)
+        granted, refused, settled, errors = [], [], [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                for call in range(self.calls_per_worker):
+                    try:
+                        consume_tokens(organization=org, tokens=self.tokens_per_call)
+                    except QuotaExceeded:
+                        refused.append(1)
+                    else:
+                        granted.append(1)
+                        # Report usage below the reservation half the time
+                        if call % 2:
+                            settle_tokens(
+                                organization=org,
+                                reserved=self.tokens_per_call,
+                                used=self.tokens_per_call - 5,
+                            )
+                            settled.append(1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(granted) + len(refused), self.workers * self.calls_per_worker)
+
+        org.refresh_from_db()
+        self.assertLessEqual(org.api_tokens_used, org.api_token_limit)
+
+        rollup_ledger()
+        org.refresh_from_db()
+        self.assertEqual(
+            org.api_tokens_used,
+            len(granted) * self.tokens_per_call - 5 * len(settled),
+        )
+
+
+class AuthContextTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A cache shared between processes, as AUTH_CONTEXT_CACHE needs
+        location = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, location, ignore_errors=True)
+
+        shared_cache = override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "auth_context": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": location,
+                },
+            },
+            AUTH_CONTEXT_CACHE="auth_context",
+        )
+        shared_cache.enable()
+        cls.addClassCleanup(shared_cache.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        self.org = Organization.objects.create(name="Context")
+        self.user = User.objects.create_user("ctx@example.com", "ctx@example.com", "pw")
+
+        profile = self.user.profile
+        profile.organization = self.org
+        profile.save()
+
+        self.member = OrganizationMember.objects.create(
+            user=self.user,
+            organization=self.org,
+            role=OrganizationMember.ROLE_ADMIN,
+        )
+
+    def make_request(self):
+        request = RequestFactory().get(reverse("chat_messages", args=[1]))
+        request._messages = CookieStorage(request)
+        # A fresh user object, like the one each request loads
+        request.user = User.objects.get(pk=self.user.pk)
+        return request
+
+    def request(self, request=None):
+        """
+        Middleware + context processors + view access check, as a chat
+        request runs them. Returns what the view saw.
+        """
+        request = request or self.make_request()
+        seen = {}
+
+        def view(request):
+            seen.update(user_profile(request))
+            seen.update(permissions_context(request))
+            seen["access"] = check_ai_access(request.user)
+            return HttpResponse()
+
+        seen["status"] = RolePermissionMiddleware(view)(request).status_code
+        return seen
+
+    def test_warm_request_does_not_query(self):
+        request = self.make_request()
+        with self.assertNumQueries(2):
+            self.request(request)
+
+        # Cached across requests: nothing left to query
+        request = self.make_request()
+        with self.assertNumQueries(0):
+            seen = self.request(request)
+
+        self.assertEqual(seen["status"], 200)
+        self.assertEqual(seen["access"], (True, None))
+        self.assertTrue(seen["is_org_admin"])
+        self.assertTrue(seen["can_manage_documents"])
+
+    @override_settings(AUTH_CONTEXT_CACHE="default")
+    def test_per_process_cache_is_not_used_across_requests(self):
+        for _ in range(2):
+            request = self.make_request()
+            with self.assertNumQueries(2):
+                seen = self.request(request)
+            self.assertEqual(seen["status"], 200)
+
+    def test_membership_change_invalidates(self):
+        self.request()
+
+        self.member.is_active = False
+        self.member.save()
+
+        # Chat routes now redirect non-members
+        self.assertEqual(self.request()["status"], 302)
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(is_org_admin(user))
+        self.assertEqual(check_ai_access(user), (False, "AI access restricted"))
+
+    def test_member_organization_follows_the_membership(self):
+        other = Organization.objects.create(name="Other")
+        profile = self.user.profile
+        profile.organization = other
+        profile.save()
+
+        context = auth_context(User.objects.get(pk=self.user.pk))
+        self.assertEqual(context.organization_id, other.pk)
+        self.assertEqual(context.member_organization_id, self.org.pk)
+        self.assertEqual(context.member_organization, self.org)
+
+    def test_organization_suspension_invalidates(self):
+        self.request()
+
+        self.org.is_active = False
+        self.org.save(update_fields=["is_active"])
+
+        self.assertEqual(self.request()["status"], 403)
+
+    async def test_async_middleware_stays_async(self):
+        async def view(request):
+            return HttpResponse()
+
+        middleware = RolePermissionMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        request = AsyncRequestFactory().get(reverse("chat_messages", args=[1]))
+        request._messages = CookieStorage(request)
+        # Lazy, as AuthenticationMiddleware sets it: loaded in the thread
+        request.user = SimpleLazyObject(lambda: User.objects.get(pk=self.user.pk))
+
+        response = await middleware(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.auth_context.ai_access(), (True, None))
@@ -1,6 +1,7 @@
 # accounts/utils.py
 
 from django.contrib.auth.models import AnonymousUser, Permission
+from accounts.auth_context import auth_context
 from accounts.models import OrganizationMember, Profile
 
 
@@ -83,17 +84,7 @@ def get_user_organization(user):
     """
     Returns user's active organization or None
     """
-    if not user or not user.is_authenticated:
-        return None
-
-    profile = getattr(user, "profile", None)
-    if not profile or not profile.organization:
-        return None
-
-    if not profile.organization.is_active:
-        return None
-
-    return profile.organization
+    return auth_context(user).organization
 
 
 def get_active_org_member(user):
@@ -122,42 +113,23 @@ def get_active_org_member(user):
 def is_org_admin(user):
     """
     TRUE source of org admin authority.
+    Resolved once per request (accounts.auth_context).
     """
-    if not user or not user.is_authenticated:
-        return False
-
-    if user.is_superuser:
-        return True
-
-    return OrganizationMember.objects.filter(
-        user=user,
-        role="admin",
-        is_active=True,
-        organization__is_active=True,
-    ).exists()
+    return auth_context(user).is_org_admin
 
 
 def can_manage_documents(user):
     """
     Premium users AND org admins can manage documents.
     """
-    if not user or not user.is_authenticated:
-        return False
-
-    if user.is_superuser:
-        return True
-
-    if getattr(user.profile, "role", None) == Profile.ROLE_PREMIUM:
-        return True
-
-    return is_org_admin(user)
+    return auth_context(user).can_manage_documents
 
 
 def can_manage_org_users(user):
     """
     Only org admins can manage users in their org.
     """
-    return is_org_admin(user)
+    return auth_context(user).can_manage_org_users
 
 
 # =====================================================
@@ -10,6 +10,7 @@ from accounts.models import (
     AuditLog,
     Profile,
 )
+from accounts.services.quota import rollup_ledger
 from accounts.utils import is_org_admin, get_user_organization
 from documents.models import Document
 
@@ -270,6 +271,10 @@ def company_dashboard(request):
         .aggregate(total=Sum("file_size"))["total"] or 0
     )
 
+    # Fold pending quota adjustments in so the figures are current
+    if rollup_ledger(organization=organization):
+        organization.refresh_from_db(fields=["api_tokens_used"])
+
     api_used = organization.api_tokens_used
     api_limit = organization.api_token_limit
     usage_percent = int((api_used / api_limit) * 100) if api_limit else 0
@@ -0,0 +1,106 @@
+from django.db.models import Q
+
+from accounts.auth_context import auth_context
+from documents.models import Document
+
+
+# =====================================================
+# 🔐 DOCUMENT AUTHORIZATION
+# =====================================================
+#
+# One set of visibility rules for every view and retriever. A user
+# (other than a superuser) can see:
+#   - documents they uploaded
+#   - public documents
+#   - documents of their organization (active membership, from the
+#     request's auth context: no query)
+#
+#   can_view(user, document)        one document: in memory for a loaded
+#                                   Document, one indexed EXISTS for an id
+#   filter_viewable(user, ids)      the viewable subset of ids
+#   get_accessible_documents(user)  everything viewable (lists, scopes)
+
+
+def _organization_id(user):
+    return auth_context(user).member_organization_id
+
+
+def _rules(user):
+    """
+    One Q per visibility rule; a document matching any is viewable.
+    """
+    rules = [Q(uploaded_by=user), Q(is_public=True)]
+
+    organization_id = _organization_id(user)
+    if organization_id is not None:
+        rules.append(Q(organization_id=organization_id))
+    return rules
+
+
+def _viewable_q(user):
+    q = Q()
+    for rule in _rules(user):
+        q |= rule
+    return q
+
+
+def can_view(user, document):
+    """
+    Whether `user` may see `document` (a Document or an id).
+    """
+    if not user or not user.is_authenticated:
+        return False
+
+    if user.is_superuser:
+        return True
+
+    if isinstance(document, Document):
+        organization_id = _organization_id(user)
+        return (
+            document.uploaded_by_id == user.pk
+            or document.is_public
+            or (organization_id is not None and document.organization_id == organization_id)
+        )
+
+    try:
+        doc_id = int(document)
+    except (TypeError, ValueError):
+        return False
+
+    return Document.objects.filter(_viewable_q(user), pk=doc_id).exists()
+
+
+def filter_viewable(user, ids):
+    """
+    The ids among `ids` that `user` may see (lazy values_list: use
+    it as a subquery or evaluate it). Non-numeric ids are dropped.
+    """
+    ids = [int(i) for i in ids if str(i).isdigit()]
+
+    if not user or not user.is_authenticated or not ids:
+        return Document.objects.none().values_list("id", flat=True)
+
+    documents = Document.objects.filter(id__in=ids)
+    if not user.is_superuser:
+        documents = documents.filter(_viewable_q(user))
+    return documents.values_list("id", flat=True)
+
+
+def get_accessible_documents(user):
+    """
+    Returns all documents the user is allowed to see.
+
+    Each rule is its own branch of a UNION ALL, so each one uses its
+    index ((uploaded_by, created_at), (organization, created_at), the
+    partial public index) instead of one OR over the whole table. The
+    result is an `id IN (...)` semi-join: a document matching several
+    branches still comes back once, without DISTINCT.
+    """
+
+    # Superusers see everything
+    if user.is_superuser:
+        return Document.objects.all()
+
+    branches = [Document.objects.filter(rule).values("id") for rule in _rules(user)]
+    visible = branches[0].union(*branches[1:], all=True)
+    return Document.objects.filter(id__in=visible)
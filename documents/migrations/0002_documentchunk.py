@@ -0,0 +1,43 @@
+import django.db.models.deletion
+import pgvector.django
+from django.db import migrations, models
+
+
+def create_chunk_table(apps, schema_editor):
+    """
+    DocumentChunk was created outside of migrations on existing
+    databases; only create the table where it is missing.
+    """
+    connection = schema_editor.connection
+
+    if connection.vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+    if DocumentChunk._meta.db_table not in connection.introspection.table_names():
+        schema_editor.create_model(DocumentChunk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='DocumentChunk',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('content', models.TextField()),
+                        ('embedding', pgvector.django.VectorField(dimensions=1536)),
+                        ('created_at', models.DateTimeField(auto_now_add=True)),
+                        ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='documents.document')),
+                    ],
+                ),
+            ],
+        ),
+        migrations.RunPython(create_chunk_table, migrations.RunPython.noop),
+    ]
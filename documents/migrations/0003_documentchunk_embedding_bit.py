@@ -0,0 +1,61 @@
+import pgvector.django
+from django.db import migrations
+
+
+QUANTIZE_SQL = """
+CREATE OR REPLACE FUNCTION documents_documentchunk_quantize() RETURNS trigger AS $$
+BEGIN
+    NEW.embedding_bit := binary_quantize(NEW.embedding)::bit(1536);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS documents_documentchunk_quantize ON documents_documentchunk;
+CREATE TRIGGER documents_documentchunk_quantize
+BEFORE INSERT OR UPDATE OF embedding ON documents_documentchunk
+FOR EACH ROW EXECUTE FUNCTION documents_documentchunk_quantize();
+
+UPDATE documents_documentchunk
+SET embedding_bit = binary_quantize(embedding)::bit(1536)
+WHERE embedding_bit IS NULL;
+
+CREATE INDEX IF NOT EXISTS documents_documentchunk_embedding_bit_hnsw
+ON documents_documentchunk
+USING hnsw (embedding_bit bit_hamming_ops);
+"""
+
+UNQUANTIZE_SQL = """
+DROP INDEX IF EXISTS documents_documentchunk_embedding_bit_hnsw;
+DROP TRIGGER IF EXISTS documents_documentchunk_quantize ON documents_documentchunk;
+DROP FUNCTION IF EXISTS documents_documentchunk_quantize();
+"""
+
+
+def backfill_quantized(apps, schema_editor):
+    """
+    Keep embedding_bit in sync for every writer (ORM or not) with a
+    trigger, then backfill existing rows. Requires pgvector >= 0.7.
+    """
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(QUANTIZE_SQL)
+
+
+def drop_quantized(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(UNQUANTIZE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_documentchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='embedding_bit',
+            field=pgvector.django.BitField(blank=True, editable=False, length=1536, null=True),
+        ),
+        migrations.RunPython(backfill_quantized, drop_quantized),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    """
+    Materialized paths for existing folders, parents before children.
+    """
+    Folder = apps.get_model("documents", "Folder")
+
+    parents = dict(Folder.objects.values_list("id", "parent_id"))
+    paths = {}
+
+    def path_of(folder_id):
+        if folder_id not in paths:
+            parent_id = parents[folder_id]
+            prefix = path_of(parent_id) if parent_id else ""
+            paths[folder_id] = f"{prefix}{folder_id}/"
+        return paths[folder_id]
+
+    folders = []
+    for folder in Folder.objects.only("id").iterator(chunk_size=500):
+        folder.path = path_of(folder.id)
+        folder.depth = folder.path.count("/") - 1
+        folders.append(folder)
+
+    Folder.objects.bulk_update(folders, ["path", "depth"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_document_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['path'], name='documents_folder_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -1,9 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
+from django.utils.functional import cached_property
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField, SearchVector
-from pgvector.django import VectorField
+from pgvector.django import BitField, VectorField
 
 from accounts.models import Organization
 
@@ -13,6 +16,15 @@ from accounts.models import Organization
 # ============================
 
 class Folder(models.Model):
+    """
+    Folders form a tree (parent). `path` is the materialized path of
+    ids from the root, "<root id>/.../<own id>/", kept up to date on
+    save, so ancestors need no walk and a whole subtree is one indexed
+    prefix filter (path__startswith=folder.path).
+    """
+
+    PATH_SEPARATOR = "/"
+
     name = models.CharField(max_length=255)
 
     uploaded_by = models.ForeignKey(
@@ -38,6 +50,9 @@ class Folder(models.Model):
         on_delete=models.CASCADE,
     )
 
+    path = models.CharField(max_length=1024, blank=True, default="", editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
     is_public = models.BooleanField(default=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -46,29 +61,117 @@ class Folder(models.Model):
     class Meta:
         ordering = ["name"]
         unique_together = ("name", "parent", "uploaded_by", "organization")
+        indexes = [
+            # LIKE 'prefix%' on any collation
+            models.Index(
+                fields=["path"],
+                opclasses=["varchar_pattern_ops"],
+                name="documents_folder_path_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.full_path
 
     @property
+    def ancestor_ids(self):
+        """
+        Ids from the root down to this folder (included).
+        """
+        return [int(i) for i in self.path.split(self.PATH_SEPARATOR) if i]
+
+    def subtree(self):
+        """
+        This folder and all its subfolders.
+        """
+        return Folder.objects.filter(path__startswith=self.path)
+
+    @cached_property
     def full_path(self):
-        parts = [self.name]
-        parent = self.parent
-        while parent:
-            parts.append(parent.name)
-            parent = parent.parent
-        return " / ".join(reversed(parts))
+        names = dict(
+            Folder.objects.filter(id__in=self.ancestor_ids).values_list("id", "name")
+        )
+        names[self.id] = self.name
+        return " / ".join(names[i] for i in self.ancestor_ids if i in names) or self.name
 
     def clean(self):
         if self.parent == self:
             raise ValidationError("Folder cannot be its own parent.")
 
+        if self.parent and self.path and self.parent.path.startswith(self.path):
+            raise ValidationError("Folder cannot be moved into its own subfolder.")
+
         if self.parent and self.parent.organization != self.organization:
             raise ValidationError("Folder organization mismatch.")
 
         if self.parent and self.parent.uploaded_by != self.uploaded_by:
             raise ValidationError("Folder uploaded_by mismatch.")
 
+    def save(self, *args, **kwargs):
+        old_path = self.path
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # The id is only known after the insert
+            parent_path = self.parent.path if self.parent_id else ""
+            path = f"{parent_path}{self.pk}{self.PATH_SEPARATOR}"
+            if path == old_path:
+                return
+
+            depth = path.count(self.PATH_SEPARATOR) - 1
+            type(self).objects.filter(pk=self.pk).update(path=path, depth=depth)
+
+            # Moved: rewrite the subtree's prefix in one statement
+            if old_path:
+                type(self).objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(path), Substr("path", len(old_path) + 1)),
+                    depth=F("depth") + (depth - self.depth),
+                )
+
+        self.path, self.depth = path, depth
+        self.__dict__.pop("full_path", None)
+
+
+def in_subtrees(folders, *, field="folder"):
+    """
+    Q for rows whose `field` folder is one of `folders` or below it:
+    one indexed prefix match per folder.
+    """
+    q = Q(pk__in=[])
+    for folder in folders:
+        q |= Q(**{f"{field}__path__startswith": folder.path})
+    return q
+
+
+def folder_tree(folders):
+    """
+    `folders` (one query) in tree order: each parent followed by its
+    children, siblings by name. Each folder gets `tree_depth` (depth
+    within the list), `has_children` and a precomputed `full_path`.
+    Folders whose parent isn't in `folders` are listed as roots.
+    """
+    folders = list(folders)
+    by_id = {f.id: f for f in folders}
+
+    children = {}
+    for folder in folders:
+        parent_id = folder.parent_id if folder.parent_id in by_id else None
+        children.setdefault(parent_id, []).append(folder)
+
+    ordered = []
+
+    def visit(parent_id, depth, prefix):
+        for folder in sorted(children.get(parent_id, []), key=lambda f: f.name.lower()):
+            folder.tree_depth = depth
+            folder.has_children = folder.id in children
+            folder.full_path = f"{prefix}{folder.name}"
+            ordered.append(folder)
+            visit(folder.id, depth + 1, f"{folder.full_path} / ")
+
+    visit(None, 0, "")
+    return ordered
+
 
 # ============================
 # 📄 DOCUMENT
@@ -112,6 +215,15 @@ class Document(models.Model):
     class Meta:
         indexes = [
             GinIndex(fields=["search_vector"]),
+            # Branches of documents.access.get_accessible_documents,
+            # newest first
+            models.Index(fields=["organization", "created_at"]),
+            models.Index(fields=["uploaded_by", "created_at"]),
+            models.Index(
+                fields=["created_at"],
+                condition=Q(is_public=True),
+                name="documents_public_created_idx",
+            ),
         ]
 
     def __str__(self):
@@ -198,6 +310,10 @@ class DocumentChunk(models.Model):
 
     embedding = VectorField(dimensions=1536)
 
+    # Binary-quantized copy (sign bits) for the fast first search pass.
+    # Maintained by a database trigger, see migration 0003.
+    embedding_bit = BitField(length=1536, null=True, blank=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
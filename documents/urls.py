@@ -22,6 +22,7 @@ urlpatterns = [
 
     # MOVE
     path("move/", views.move_document, name="move_document"),
+    path("folders/move/", views.move_folder, name="move_folder"),
 
     path(
     "toggle-rag/",
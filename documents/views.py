@@ -2,13 +2,15 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponseForbidden, FileResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.contrib.postgres.search import SearchQuery, SearchRank
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.http import require_POST
 
-from documents.models import Document, Folder
+from documents.models import Document, Folder, folder_tree
+from documents.access import can_view
 from documents.utils import get_accessible_documents
 from documents.utils.text_extractor import extract_text_from_file
 from accounts.models import OrganizationMember
@@ -57,12 +59,12 @@ def document_list(request):
     active_folder = None
 
     # =========================
-    # FOLDER FILTER
+    # FOLDER FILTER (folder + subfolders)
     # =========================
-    if folder_id:
+    if folder_id and folder_id.isdigit():
         active_folder = folders.filter(id=folder_id).first()
         if active_folder:
-            documents = documents.filter(folder_id=active_folder.id)
+            documents = documents.filter(folder__path__startswith=active_folder.path)
 
     # =========================
     # SEARCH (Scoped if folder selected)
@@ -79,7 +81,6 @@ def document_list(request):
                 Q(extracted_text__icontains=query)
             )
             .order_by("-rank", "-created_at")
-            .distinct()
         )
     else:
         documents = documents.order_by("-created_at")
@@ -94,7 +95,7 @@ def document_list(request):
         "documents/list.html",
         {
             "documents": documents,
-            "folders": folders,
+            "folders": folder_tree(folders),
             "active_folder": active_folder,
             "query": query,
             "restrict_rag": restrict_rag,
@@ -242,7 +243,7 @@ def document_upload(request):
 def document_preview(request, doc_id):
     document = get_object_or_404(Document, id=doc_id)
 
-    if document not in get_accessible_documents(request.user):
+    if not can_view(request.user, document):
         return HttpResponseForbidden("Not allowed")
 
     return render(request, "documents/preview.html", {"document": document})
@@ -256,7 +257,7 @@ def document_preview(request, doc_id):
 def document_download(request, doc_id):
     document = get_object_or_404(Document, id=doc_id)
 
-    if document not in get_accessible_documents(request.user):
+    if not can_view(request.user, document):
         return HttpResponseForbidden("Not allowed")
 
     return FileResponse(
@@ -276,18 +277,22 @@ def my_documents(request):
     folder_id = request.GET.get("folder")
 
     documents = Document.objects.filter(uploaded_by=user)
-
-    if folder_id:
-        documents = documents.filter(folder_id=folder_id)
-
     folders = Folder.objects.filter(uploaded_by=user)
 
+    if folder_id and folder_id.isdigit():
+        folder = folders.filter(id=folder_id).first()
+        if folder:
+            # Folder + subfolders
+            documents = documents.filter(folder__path__startswith=folder.path)
+        else:
+            documents = documents.none()
+
     return render(
         request,
         "documents/my_documents.html",
         {
             "documents": documents.order_by("-created_at"),
-            "folders": folders,
+            "folders": folder_tree(folders),
             "active_folder": folder_id,
         }
     )
@@ -319,8 +324,19 @@ def delete_document(request, doc_id):
 def create_folder(request):
     if request.method == "POST":
         name = request.POST.get("name", "").strip()
+        parent_id = request.POST.get("parent")
+
+        parent = None
+        if parent_id:
+            parent = get_object_or_404(Folder, id=parent_id, uploaded_by=request.user)
+
         if name:
-            Folder.objects.create(name=name, uploaded_by=request.user)
+            Folder.objects.create(
+                name=name,
+                uploaded_by=request.user,
+                organization=parent.organization if parent else None,
+                parent=parent,
+            )
 
     return redirect("documents:my_documents")
 
@@ -468,3 +484,50 @@ def move_document(request):
     return JsonResponse({"success": True})
 
 
+@login_required
+@require_POST
+def move_folder(request):
+    """
+    Move a folder (with its subtree) under another folder, or to the
+    root without parent_id.
+    """
+    user = request.user
+
+    folder_id = request.POST.get("folder_id")
+    parent_id = request.POST.get("parent_id")
+
+    if not folder_id:
+        return JsonResponse(
+            {"success": False, "error": "Invalid folder."},
+            status=400,
+        )
+
+    folder = get_object_or_404(Folder, id=folder_id, uploaded_by=user)
+
+    parent = None
+    if parent_id:
+        parent = get_object_or_404(Folder, id=parent_id, uploaded_by=user)
+
+    # Same name already at the destination
+    if Folder.objects.filter(
+        uploaded_by=user,
+        parent=parent,
+        name=folder.name
+    ).exclude(id=folder.id).exists():
+        return JsonResponse(
+            {"success": False, "error": "A folder with that name already exists there."},
+            status=400,
+        )
+
+    folder.parent = parent
+    try:
+        folder.clean()
+    except ValidationError as e:
+        return JsonResponse({"success": False, "error": e.messages[0]}, status=400)
+
+    # Rewrites the paths of the whole subtree (Folder.save)
+    folder.save(update_fields=["parent", "updated_at"])
+
+    return JsonResponse({"success": True})
+
+
@@ -0,0 +1,142 @@
+import hashlib
+import re
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from .models import AnswerCacheEntry
+from .llm import get_provider
+from .qa import PROMPT_VERSION
+
+
+def normalize_question(question):
+    """
+    Case, Unicode form, whitespace and trailing punctuation
+    don't change the question.
+    """
+    text = unicodedata.normalize("NFKC", question or "").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!. ")
+
+
+def _digest(*parts):
+    return hashlib.sha256(
+        "\x1f".join(str(p) for p in parts).encode("utf-8")
+    ).hexdigest()
+
+
+def cache_keys(*, organization, question, chunks):
+    """
+    (key, evidence_key, chunk_ids), or None when the chunks can't be
+    identified (e.g. FAISS results without DocumentChunk ids).
+    """
+    chunk_ids = sorted({c.get("chunk_id") for c in chunks} - {None})
+    if not chunk_ids or len(chunk_ids) != len(chunks):
+        return None
+
+    evidence_key = _digest(
+        getattr(organization, "id", None),
+        PROMPT_VERSION,
+        get_provider().model,
+        *chunk_ids,
+    )
+    return _digest(evidence_key, normalize_question(question)), evidence_key, chunk_ids
+
+
+def _fresh_entries():
+    cutoff = timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+    return AnswerCacheEntry.objects.filter(created_at__gte=cutoff)
+
+
+# =========================================================
+# 🔎 LOOKUP
+# =========================================================
+def get_cached_answer(*, organization, question, chunks, query_embedding=None):
+    """
+    Cached Markdown answer or None.
+
+    Exact match on the normalized question first; with a
+    `query_embedding`, then the closest earlier question asked over
+    the same evidence within ANSWER_CACHE_PARAPHRASE_DISTANCE (cosine).
+    """
+    keys = cache_keys(organization=organization, question=question, chunks=chunks)
+    if keys is None:
+        return None
+
+    key, evidence_key, _ = keys
+    entry = _fresh_entries().filter(key=key).only("id", "answer").first()
+
+    max_distance = settings.ANSWER_CACHE_PARAPHRASE_DISTANCE
+    if entry is None and query_embedding is not None and max_distance:
+        entry = (
+            _fresh_entries()
+            .filter(evidence_key=evidence_key, question_embedding__isnull=False)
+            .annotate(distance=CosineDistance("question_embedding", query_embedding))
+            .filter(distance__lte=max_distance)
+            .order_by("distance")
+            .only("id", "answer")
+            .first()
+        )
+
+    if entry is None:
+        return None
+
+    AnswerCacheEntry.objects.filter(id=entry.id).update(
+        hits=F("hits") + 1,
+        last_hit_at=timezone.now(),
+    )
+    print(f"[ANSWER CACHE] hit #{entry.id}")
+    return entry.answer
+
+
+# =========================================================
+# 💾 STORE / INVALIDATE
+# =========================================================
+def store_answer(*, organization, question, chunks, answer, query_embedding=None):
+    keys = cache_keys(organization=organization, question=question, chunks=chunks)
+    if keys is None or not answer:
+        return None
+
+    key, evidence_key, chunk_ids = keys
+
+    try:
+        with transaction.atomic():
+            entry, _ = AnswerCacheEntry.objects.update_or_create(
+                key=key,
+                defaults={
+                    "organization": organization,
+                    "evidence_key": evidence_key,
+                    "question": question,
+                    "question_embedding": query_embedding,
+                    "chunk_ids": chunk_ids,
+                    "answer": answer,
+                    "created_at": timezone.now(),
+                },
+            )
+            entry.documents.set({c["document_id"] for c in chunks})
+    except IntegrityError:
+        # Concurrent store of the same answer
+        return None
+
+    # Expired entries of this organization go on write
+    cutoff = timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+    AnswerCacheEntry.objects.filter(
+        organization=organization,
+        created_at__lt=cutoff,
+    ).delete()
+
+    return entry
+
+
+def invalidate_document(document_id):
+    """
+    Drop every cached answer that used the document.
+    """
+    deleted, _ = AnswerCacheEntry.objects.filter(documents__id=document_id).delete()
+    if deleted:
+        print(f"[ANSWER CACHE] invalidated answers for document {document_id}")
@@ -0,0 +1,242 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+from django.db.models.fields.json import KeyTransform
+
+from .models import CorpusStatistics
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from",
+    "how", "in", "is", "it", "of", "on", "or", "that", "the", "this",
+    "to", "under", "was", "what", "when", "where", "which", "who",
+    "with",
+})
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def query_terms(query):
+    """
+    Unique, non-stopword query tokens in query order.
+    """
+    return [
+        term for term in dict.fromkeys(tokenize(query))
+        if term not in STOPWORDS
+    ]
+
+
+def _json_key(term):
+    """
+    Django reads integer-like JSON keys as array indexes,
+    so numeric terms ("5" in "Section 5") are stored prefixed.
+    """
+    try:
+        int(term)
+    except ValueError:
+        return term
+    return f"#{term}"
+
+
+# =========================================================
+# 📊 CORPUS STATISTICS (INDEX TIME)
+# =========================================================
+def chunk_term_stats(text_chunks):
+    """
+    Chunk-level corpus statistics for a list of chunk texts.
+    Returns (chunk_count, total_tokens, document_frequencies).
+    """
+    document_frequencies = Counter()
+    total_tokens = 0
+
+    for text in text_chunks:
+        total_tokens += len(text.split())
+        document_frequencies.update(set(tokenize(text)))
+
+    return len(text_chunks), total_tokens, document_frequencies
+
+
+def corpus_statistics_id(organization):
+    """
+    Id of the organization's CorpusStatistics row (created if missing).
+    organization=None is the global public corpus.
+    """
+    stats, _ = CorpusStatistics.objects.get_or_create(organization=organization)
+    return stats.pk
+
+
+@transaction.atomic
+def apply_corpus_statistics(
+    stats_id,
+    *,
+    chunk_count,
+    total_tokens,
+    document_frequencies,
+    sign=1,
+):
+    """
+    Add (sign=1) or remove (sign=-1) chunk counts to a CorpusStatistics
+    row. Returns False if the row no longer exists.
+    """
+    stats = CorpusStatistics.objects.select_for_update().filter(pk=stats_id).first()
+    if stats is None:
+        return False
+
+    df = stats.document_frequencies or {}
+    for term, count in document_frequencies.items():
+        key = _json_key(term)
+        value = df.get(key, 0) + sign * count
+        if value > 0:
+            df[key] = value
+        else:
+            df.pop(key, None)
+
+    stats.document_frequencies = df
+    stats.chunk_count = max(0, stats.chunk_count + sign * chunk_count)
+    stats.total_tokens = max(0, stats.total_tokens + sign * total_tokens)
+    stats.save(
+        update_fields=[
+            "document_frequencies",
+            "chunk_count",
+            "total_tokens",
+            "updated_at",
+        ]
+    )
+    return True
+
+
+def update_corpus_statistics(*, organization, text_chunks, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) a list of chunk texts to the
+    organization's BM25 statistics. organization=None is the global
+    public corpus. Indexed documents go through rag.term_index, which
+    records what each one contributed.
+    """
+    chunk_count, total_tokens, frequencies = chunk_term_stats(text_chunks)
+    if not chunk_count:
+        return
+
+    apply_corpus_statistics(
+        corpus_statistics_id(organization),
+        chunk_count=chunk_count,
+        total_tokens=total_tokens,
+        document_frequencies=frequencies,
+        sign=sign,
+    )
+
+
+def load_corpus_statistics(organizations, terms):
+    """
+    Merge statistics of several corpora (e.g. the user's organization
+    and the global public corpus), fetching only the frequencies of
+    `terms` instead of the whole JSON map.
+    """
+    terms = list(terms)
+
+    qs = CorpusStatistics.objects.none()
+    for organization in organizations:
+        if organization is None:
+            qs = qs | CorpusStatistics.objects.filter(organization__isnull=True)
+        else:
+            qs = qs | CorpusStatistics.objects.filter(organization=organization)
+
+    annotations = {
+        f"df_{i}": KeyTransform(_json_key(term), "document_frequencies")
+        for i, term in enumerate(terms)
+    }
+
+    chunk_count = 0
+    total_tokens = 0
+    df = dict.fromkeys(terms, 0)
+
+    for row in qs.annotate(**annotations).values(
+        "chunk_count", "total_tokens", *annotations
+    ):
+        chunk_count += row["chunk_count"]
+        total_tokens += row["total_tokens"]
+        for i, term in enumerate(terms):
+            df[term] += int(row[f"df_{i}"] or 0)
+
+    return chunk_count, total_tokens, df
+
+
+# =========================================================
+# 🔎 BM25 SCORING (QUERY TIME)
+# =========================================================
+def bm25_scores(
+    terms,
+    texts,
+    *,
+    chunk_count,
+    total_tokens,
+    document_frequencies,
+    k1=1.5,
+    b=0.75,
+):
+    """
+    Okapi BM25 score of each text against the query `terms`.
+
+    Lengths and term frequencies are counted the way
+    chunk_term_stats counts them at index time (whitespace-split
+    length, \w+ tokens), so avg_length and each text's length agree.
+    """
+    scores = np.zeros(len(texts), dtype=np.float32)
+    if not terms or not texts:
+        return scores
+
+    corpus_size = max(chunk_count, 1)
+    avg_length = (total_tokens / chunk_count) if chunk_count else 1.0
+
+    idf = {
+        term: math.log(
+            1 + (corpus_size - n + 0.5) / (n + 0.5)
+        )
+        for term, n in (
+            (t, min(document_frequencies.get(t, 0), corpus_size))
+            for t in terms
+        )
+    }
+
+    for i, text in enumerate(texts):
+        length = len(text.split())
+        tokens = tokenize(text)
+        norm = k1 * (1 - b + b * length / avg_length)
+
+        score = 0.0
+        for term in terms:
+            tf = tokens.count(term)
+            if tf:
+                score += idf[term] * tf * (k1 + 1) / (tf + norm)
+
+        scores[i] = score
+
+    return scores
+
+
+def _min_max(values):
+    values = np.asarray(values, dtype=np.float32)
+    if not len(values):
+        return values
+
+    spread = values.max() - values.min()
+    if spread == 0:
+        return np.ones_like(values)
+
+    return (values - values.min()) / spread
+
+
+def blend_scores(distances, bm25, weight=0.3):
+    """
+    Combine L2 distances (lower = better) with BM25 scores
+    (higher = better) into one relevance score in [0, 1].
+    """
+    vector_score = 1.0 - _min_max(distances)
+    lexical_score = _min_max(bm25) if np.any(bm25) else np.zeros_like(vector_score)
+    return (1 - weight) * vector_score + weight * lexical_score
@@ -1,8 +1,7 @@
-import os
-from openai import OpenAI
+from django.conf import settings
 
-from accounts.services.quota import consume_tokens, QuotaExceeded
-from accounts.services.token_estimator import estimate_tokens
+from .context import context_budget, count_prompt_tokens, pack_context
+from .llm import get_provider
 
 from .prompts import (
     REPORT_TEMPLATE,
@@ -10,19 +9,7 @@ from .prompts import (
     REPORTING_SYSTEM_PROMPT,
     LEGAL_SYSTEM_PROMPT,
 )
-
-
-# =========================
-# 🔐 SAFE OPENAI CLIENT
-# =========================
-
-def get_openai_client():
-    api_key = os.getenv("OPENAI_API_KEY")
-
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not configured.")
-
-    return OpenAI(api_key=api_key)
+from .utils import metered_complete
 
 
 # =========================
@@ -48,62 +35,39 @@ def is_legal_document(title, text):
     return any(marker in title for marker in legal_title_markers)
 
 
-# =========================
-# 🔐 TOKEN ENFORCEMENT HELPER
-# =========================
-
-def enforce_quota(*, user, text: str):
-    profile = user.profile
-    organization = profile.organization
-
-    estimated_tokens = estimate_tokens(text)
-
-    try:
-        consume_tokens(
-            organization=organization,
-            tokens=estimated_tokens,
-        )
-    except QuotaExceeded:
-        raise QuotaExceeded(
-            "Your organization has exceeded its API quota. "
-            "Please contact your administrator."
-        )
-
-
 # =========================
 # Q&A MODE
 # =========================
 
 def chat_with_docs(*, user, query, chunk_results):
+    model = get_provider().model
+    chunk_results = pack_context(
+        chunk_results or [],
+        model=model,
+        prompt_tokens=count_prompt_tokens(query, model=model),
+    )
+
     context = "\n\n".join(
         c["text"] for c in chunk_results
-    ) if chunk_results else ""
-
-    enforce_quota(user=user, text=query + context)
-
-    client = get_openai_client()
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.2,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a document assistant. "
-                    "Answer ONLY using the provided context. "
-                    "If the answer is not in the context, say: "
-                    "'I could not find this information in the documents.'"
-                ),
-            },
-            {
-                "role": "user",
-                "content": f"Context:\n{context}\n\nQuestion:\n{query}",
-            },
-        ],
     )
 
-    answer = response.choices[0].message.content.strip()
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a document assistant. "
+                "Answer ONLY using the provided context. "
+                "If the answer is not in the context, say: "
+                "'I could not find this information in the documents.'"
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Context:\n{context}\n\nQuestion:\n{query}",
+        },
+    ]
+
+    answer = metered_complete(user=user, messages=messages, purpose="chat")
 
     if chunk_results:
         confidence = round(
@@ -142,21 +106,21 @@ def chat_with_context(
     prepared_by="System Generated"
 ):
     style_config = STYLE_PRESETS.get(style, STYLE_PRESETS["executive"])
+    model = get_provider().model
+
+    packed = pack_context(
+        retrieved_chunks,
+        model=model,
+        budget=context_budget(
+            model,
+            prompt_tokens=count_prompt_tokens(
+                question, REPORT_TEMPLATE, LEGAL_SYSTEM_PROMPT, model=model
+            ),
+            answer_tokens=settings.REPORT_ANSWER_TOKENS,
+        ),
+    )
 
-    MAX_CHUNKS = 5
-    MAX_CHARS_PER_CHUNK = 2000
-    MAX_SOURCE_CHARS = 8000
-
-    cleaned_chunks = []
-
-    for chunk in retrieved_chunks[:MAX_CHUNKS]:
-        text = (chunk.get("text") or "").strip()
-        if not text:
-            continue
-
-        cleaned_chunks.append(text[:MAX_CHARS_PER_CHUNK])
-
-    source_material = "\n\n".join(cleaned_chunks)[:MAX_SOURCE_CHARS]
+    source_material = "\n\n".join(c["text"] for c in packed)
 
     document_title = (
         retrieved_chunks[0].get("document_title", "")
@@ -164,11 +128,6 @@ def chat_with_context(
         else ""
     )
 
-    enforce_quota(
-        user=user,
-        text=question + source_material
-    )
-
     is_legal = is_legal_document(document_title, source_material)
 
     if is_legal and legal_mode == "enumeration":
@@ -226,15 +185,14 @@ Prepared By:
 {prepared_by}
 """
 
-    client = get_openai_client()
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.2,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+    return metered_complete(
+        user=user,
+        messages=messages,
+        purpose="report",
+        max_tokens=settings.REPORT_ANSWER_TOKENS,
     )
-
-    return response.choices[0].message.content.strip()
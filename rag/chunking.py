@@ -1,3 +1,10 @@
+import re
+from functools import lru_cache
+
+import tiktoken
+from django.conf import settings
+
+
 def chunk_text(text, size=500, overlap=100):
     words = text.split()
     chunks = []
@@ -8,3 +15,204 @@ def chunk_text(text, size=500, overlap=100):
             chunks.append(chunk)
 
     return chunks
+
+
+# =========================================================
+# 🧩 TOKEN-BASED, STRUCTURE-AWARE CHUNKER
+# =========================================================
+
+# Boundary strength before a unit (lower = better place to cut)
+SECTION = 0      # "Section 12", "PART III", "5. Powers of the Bank"
+HEADING = 1      # short upper-case / markdown heading line
+PARAGRAPH = 2    # blank line
+SENTENCE = 3     # sentence start inside a line
+LINE = 4         # wrapped line (PDF extraction)
+TOKEN = 5        # hard split inside an over-long sentence
+
+SECTION_RE = re.compile(
+    r"\s*(?:"
+    r"(?:SECTION|Section|PART|Part|CHAPTER|Chapter|SCHEDULE|Schedule|ARTICLE|Article)"
+    r"\s+[0-9IVXLC]+[A-Z]?\b"
+    r"|\d+[A-Z]?\.\s+[A-Z]"
+    r")"
+)
+LINE_RE = re.compile(r"[^\n]*(?:\n|$)")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=\S)")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name=None):
+    return tiktoken.get_encoding(name or settings.CHUNK_ENCODING)
+
+
+def _line_level(line, previous_blank):
+    stripped = line.strip()
+
+    if SECTION_RE.match(line):
+        return SECTION
+
+    if stripped.startswith("#") or (
+        len(stripped) <= 80
+        and stripped.isupper()
+        and stripped[-1:] not in ".,;:"
+    ):
+        return HEADING
+
+    return PARAGRAPH if previous_blank else LINE
+
+
+def _units(text):
+    """
+    Lazily split text into (start, end, level) spans.
+    Spans are contiguous, so text[start:end] of consecutive units
+    reproduces the original text.
+    """
+    previous_blank = True
+    previous_sentence_end = True
+
+    for match in LINE_RE.finditer(text):
+        start, end = match.span()
+        if start == end:
+            break
+
+        line = match.group()
+        if not line.strip():
+            previous_blank = True
+            yield start, end, PARAGRAPH
+            continue
+
+        level = _line_level(line, previous_blank)
+        if level == LINE and previous_sentence_end:
+            level = SENTENCE
+
+        # Sentence boundaries inside the line
+        cursor = start
+        for sentence in SENTENCE_END_RE.finditer(line):
+            cut = start + sentence.end()
+            yield cursor, cut, level
+            cursor = cut
+            level = SENTENCE
+        yield cursor, end, level
+
+        previous_blank = False
+        previous_sentence_end = line.rstrip()[-1:] in ".!?:;"
+
+
+def _measured_units(text, encoding, max_tokens):
+    """
+    Units with their token counts; units longer than max_tokens are
+    split on token boundaries.
+    """
+    for start, end, level in _units(text):
+        tokens = encoding.encode_ordinary(text[start:end])
+
+        if len(tokens) <= max_tokens:
+            yield start, end, level, len(tokens)
+            continue
+
+        _, offsets = encoding.decode_with_offsets(tokens)
+        for i in range(0, len(tokens), max_tokens):
+            piece_start = start + offsets[i]
+            piece_end = (
+                start + offsets[i + max_tokens]
+                if i + max_tokens < len(tokens)
+                else end
+            )
+            yield (
+                piece_start,
+                piece_end,
+                level if i == 0 else TOKEN,
+                len(tokens[i:i + max_tokens]),
+            )
+
+
+def _best_cut(buffer, min_tokens):
+    """
+    Index in buffer to cut before: the strongest boundary once at
+    least min_tokens are packed (rightmost on ties).
+    """
+    best, best_level = len(buffer), None
+    packed = 0
+
+    for i, (_, _, level, count) in enumerate(buffer):
+        if i and packed >= min_tokens and (best_level is None or level <= best_level):
+            best, best_level = i, level
+        packed += count
+
+    return best
+
+
+def iter_chunks(text, max_tokens=None, overlap_tokens=None, encoding=None):
+    """
+    Stream chunks of at most `max_tokens` tokens (tiktoken) that prefer
+    to end on section, heading, paragraph and sentence boundaries.
+
+    Yields dicts: {"text", "start", "end", "tokens"} where start/end are
+    character offsets into `text`. Consecutive chunks share up to
+    `overlap_tokens` of trailing sentences, never across a section break.
+    Token counts are summed per unit, so they can differ from encoding
+    the chunk as a whole by a token or two.
+    """
+    if not text:
+        return
+
+    max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+    if overlap_tokens is None:
+        overlap_tokens = settings.CHUNK_OVERLAP_TOKENS
+    encoding = encoding or get_encoding()
+    min_tokens = max_tokens // 2
+
+    buffer = []
+
+    def emit(units):
+        start, end = units[0][0], units[-1][1]
+        raw = text[start:end]
+        chunk = raw.strip()
+        if chunk:
+            start += len(raw) - len(raw.lstrip())
+            yield {
+                "text": chunk,
+                "start": start,
+                "end": start + len(chunk),
+                "tokens": sum(u[3] for u in units),
+            }
+
+    def overlap(emitted):
+        carry, carried = [], 0
+        for u in reversed(emitted):
+            if carried + u[3] > overlap_tokens or u[2] == SECTION:
+                break
+            carry.insert(0, u)
+            carried += u[3]
+
+        # Overlap starts on a sentence (or stronger) boundary
+        while carry and carry[0][2] > SENTENCE:
+            carry.pop(0)
+        return carry
+
+    for unit in _measured_units(text, encoding, max_tokens):
+        level, count = unit[2], unit[3]
+        buffered = sum(u[3] for u in buffer)
+        starts_section = level == SECTION and buffered >= min_tokens
+
+        while buffer and (starts_section or buffered + count > max_tokens):
+            cut = len(buffer) if starts_section else _best_cut(buffer, min_tokens)
+            emitted, rest = buffer[:cut], buffer[cut:]
+            yield from emit(emitted)
+
+            carry = []
+            if not starts_section and (not rest or rest[0][2] != SECTION):
+                carry = overlap(emitted)
+
+            rest_tokens = sum(u[3] for u in rest)
+            if sum(u[3] for u in carry) + rest_tokens + count > max_tokens:
+                carry = []
+
+            buffer = carry + rest
+            buffered = sum(u[3] for u in buffer)
+            starts_section = False
+
+        buffer.append(unit)
+
+    if buffer:
+        yield from emit(buffer)
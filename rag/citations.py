@@ -0,0 +1,64 @@
+from documents.models import DocumentChunk
+
+from .models import Citation
+
+
+# =========================================================
+# 📌 CITATIONS
+# =========================================================
+#
+# Assistant messages reference the chunks they were answered from
+# (Citation rows) instead of copying their text into
+# ChatMessage.sources. Text is only needed when a user expands the
+# citations of one message: resolve_citations() loads it for a whole
+# list in one query.
+
+
+def build_citations(message, retrieved):
+    """
+    Unsaved Citation rows for retriever results (best first).
+    Results without a chunk id keep their text as an excerpt.
+    """
+    citations = []
+
+    for rank, result in enumerate(retrieved):
+        chunk_id = result.get("chunk_id")
+        text = result.get("text") or ""
+        citations.append(
+            Citation(
+                message=message,
+                chunk_id=chunk_id,
+                document_id=result.get("document_id"),
+                rank=rank,
+                score=result.get("score"),
+                start=0,
+                end=len(text),
+                excerpt="" if chunk_id else text,
+            )
+        )
+
+    return citations
+
+
+def save_citations(message, retrieved):
+    return Citation.objects.bulk_create(build_citations(message, retrieved))
+
+
+def resolve_citations(citations):
+    """
+    Set `.text` on each citation: the cited range of its chunk (one
+    query for all of them), or the stored excerpt.
+    """
+    chunk_ids = {c.chunk_id for c in citations if c.chunk_id}
+    contents = dict(
+        DocumentChunk.objects.filter(id__in=chunk_ids).values_list("id", "content")
+    ) if chunk_ids else {}
+
+    for citation in citations:
+        content = contents.get(citation.chunk_id)
+        if content is None:
+            citation.text = citation.excerpt
+        else:
+            citation.text = content[citation.start:citation.end]
+
+    return citations
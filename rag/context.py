@@ -0,0 +1,107 @@
+from django.conf import settings
+
+from accounts.services.token_estimator import count_tokens, get_model_encoding
+from .chunking import SENTENCE_END_RE
+
+
+# Tokens for the per-source label and separator ("[S12]\n" + "\n\n")
+SOURCE_OVERHEAD_TOKENS = 8
+
+# Don't bother trimming a chunk into less room than this
+MIN_TRIMMED_TOKENS = 32
+
+
+def context_budget(model, *, prompt_tokens=0, answer_tokens=None):
+    """
+    Tokens left for sources: the model's context window minus the rest
+    of the prompt and the tokens reserved for the answer, capped at
+    CONTEXT_SOURCE_TOKENS.
+    """
+    window = settings.MODEL_CONTEXT_WINDOWS.get(model, settings.MODEL_CONTEXT_WINDOW_DEFAULT)
+    if answer_tokens is None:
+        answer_tokens = settings.CONTEXT_ANSWER_TOKENS
+
+    return max(0, min(settings.CONTEXT_SOURCE_TOKENS, window - answer_tokens - prompt_tokens))
+
+
+def trim_to_sentences(text, max_tokens, encoding):
+    """
+    Longest prefix of `text` made of whole sentences that fits in
+    `max_tokens`, or "" when even the first sentence doesn't fit.
+    """
+    ends = [m.start() for m in SENTENCE_END_RE.finditer(text)]
+
+    best = ""
+    lo, hi = 0, len(ends) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        prefix = text[:ends[mid]]
+        if len(encoding.encode_ordinary(prefix)) <= max_tokens:
+            best = prefix
+            lo = mid + 1
+        else:
+            hi = mid - 1
+
+    return best
+
+
+def pack_context(chunks, *, model, prompt_tokens=0, budget=None, metrics=None):
+    """
+    Greedily pack retrieved chunks into the model's token budget.
+
+    Chunks are taken in the order given (retrievers return them best
+    first). A chunk that doesn't fit is trimmed to whole sentences if a
+    useful amount of room is left, otherwise dropped; later, shorter
+    chunks may still fit.
+
+    Returns copies of the packed chunks (with "text" possibly trimmed,
+    "tokens" added). A report {tokens, budget, packed, trimmed, dropped}
+    is logged and, if a `metrics` dict is passed, stored in
+    metrics["context"].
+    """
+    encoding = get_model_encoding(model)
+    if budget is None:
+        budget = context_budget(model, prompt_tokens=prompt_tokens)
+
+    packed = []
+    used = trimmed = dropped = 0
+
+    for chunk in chunks:
+        text = (chunk.get("text") or "").strip()
+        if not text:
+            continue
+
+        room = budget - used - SOURCE_OVERHEAD_TOKENS
+        tokens = len(encoding.encode_ordinary(text))
+
+        if tokens > room:
+            text = trim_to_sentences(text, room, encoding) if room >= MIN_TRIMMED_TOKENS else ""
+            if not text:
+                dropped += 1
+                continue
+            tokens = len(encoding.encode_ordinary(text))
+            trimmed += 1
+
+        packed.append({**chunk, "text": text, "tokens": tokens})
+        used += tokens + SOURCE_OVERHEAD_TOKENS
+
+    report = {
+        "tokens": used,
+        "budget": budget,
+        "packed": len(packed),
+        "trimmed": trimmed,
+        "dropped": dropped,
+    }
+    if metrics is not None:
+        metrics["context"] = report
+    if trimmed or dropped:
+        print(f"[CONTEXT] {report}")
+
+    return packed
+
+
+def count_prompt_tokens(*texts, model):
+    """
+    Token count of the fixed (non-source) parts of a prompt.
+    """
+    return sum(count_tokens(text, model) for text in texts)
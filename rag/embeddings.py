@@ -1,24 +1,133 @@
+import hashlib
+import math
+from collections import Counter
+from functools import lru_cache
+
 import numpy as np
-import os
-from openai import OpenAI
+from django.conf import settings
+
+from . import resilience, singleflight
+from .bm25 import STOPWORDS, tokenize
+from .llm import get_provider
 
 
-def get_openai_client():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set in environment variables")
-    return OpenAI(api_key=api_key)
+def _embedding_provider():
+    provider = get_provider()
+    resilience.check("embedding")
+    if not provider.embedding_breaker.allow():
+        raise resilience.ProviderUnavailable("Embedding provider is unavailable (circuit open)")
+    return provider
 
 
 def embed_texts(texts):
     if not texts:
         return np.array([])
 
-    client = get_openai_client()  # 🔥 Lazy initialization (safe for production)
+    if settings.EMBEDDING_BACKEND == "local":
+        return local_embed_texts(texts)
+
+    payload = {"model": settings.EMBEDDING_MODEL, "input": list(texts)}
+    provider = _embedding_provider()
+
+    # Same endpoint / credentials / timeouts as chat (rag.llm);
+    # identical concurrent requests share one call, slow query
+    # embeddings are hedged (rag.resilience).
+    def attempt():
+        try:
+            response = provider.with_deadline(provider.client).embeddings.create(**payload)
+        except Exception as e:
+            provider.embedding_breaker.record_error(e)
+            raise
+        provider.embedding_breaker.record(True)
+        return np.array([d.embedding for d in response.data])
+
+    def call():
+        if len(texts) > 1:
+            return attempt()  # indexing batches: latency varies with size
+        return resilience.hedged(
+            attempt, tracker=resilience.embedding_latency, name="embedding"
+        )
+
+    return singleflight.do(singleflight.payload_key("embedding", payload), call)
+
+
+async def aembed_texts(texts):
+    """
+    Async embed_texts: awaits the provider without holding a worker.
+    """
+    if not texts:
+        return np.array([])
+
+    if settings.EMBEDDING_BACKEND == "local":
+        return local_embed_texts(texts)
+
+    payload = {"model": settings.EMBEDDING_MODEL, "input": list(texts)}
+    provider = _embedding_provider()
+
+    async def attempt():
+        try:
+            response = await provider.with_deadline(
+                provider.async_client
+            ).embeddings.create(**payload)
+        except Exception as e:
+            provider.embedding_breaker.record_error(e)
+            raise
+        provider.embedding_breaker.record(True)
+        return np.array([d.embedding for d in response.data])
+
+    async def call():
+        if len(texts) > 1:
+            return await attempt()
+        return await resilience.ahedged(
+            attempt, tracker=resilience.embedding_latency, name="embedding"
+        )
+
+    return await singleflight.ado(singleflight.payload_key("embedding", payload), call)
+
+
+def binary_quantize(embedding):
+    """
+    Sign-bit quantization matching pgvector's binary_quantize():
+    one bit per dimension, 1 when the component is positive.
+    Returns a '0101…' bit string.
+    """
+    bits = (np.asarray(embedding) > 0).astype(np.uint8) + ord("0")
+    return bits.tobytes().decode("ascii")
+
+
+# =========================================================
+# 🧪 LOCAL DETERMINISTIC EMBEDDER (offline / benchmarks)
+# =========================================================
+@lru_cache(maxsize=20_000)
+def _term_vector(term, dim):
+    digest = hashlib.blake2b(term.encode("utf-8"), digest_size=16).digest()
+    rng = np.random.default_rng(int.from_bytes(digest, "little"))
+    return rng.standard_normal(dim).astype(np.float32)
+
+
+def local_embed_texts(texts, dim=None):
+    """
+    Random-projection bag of words: every non-stopword term maps to a
+    fixed, hash-seeded Gaussian direction (weighted 1 + log tf), rows
+    are L2-normalised. Same text → same vector on every machine, no
+    network. Texts sharing rare terms land close together, which is
+    all retrieval tests and benchmarks need.
+    """
+    if not texts:
+        return np.array([])
+
+    dim = dim or settings.EMBEDDING_DIM
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
 
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=texts
-    )
+    for row, text in enumerate(texts):
+        counts = Counter(
+            term for term in tokenize(text) if term not in STOPWORDS
+        )
+        if not counts:
+            continue
+        weights = np.array([1.0 + math.log(tf) for tf in counts.values()], dtype=np.float32)
+        vectors[row] = weights @ np.stack([_term_vector(term, dim) for term in counts])
 
-    return np.array([d.embedding for d in response.data])
\ No newline at end of file
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
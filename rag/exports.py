@@ -0,0 +1,319 @@
+import hashlib
+import tempfile
+import threading
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+from docx import Document as DocxDocument
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, Preformatted, SimpleDocTemplate, Spacer
+
+from .models import ExportJob
+
+
+# =========================================================
+# 📄 CHAT EXPORTS (PDF / DOCX)
+# =========================================================
+#
+# Messages are read with .iterator() and rendered block by block
+# (headings, paragraphs, list items, code) from their stored content:
+#
+#   small export  (≤ EXPORT_INLINE_MAX_MESSAGES)
+#       rendered into a spooled temp file, streamed in the response
+#   large export
+#       ExportJob → rendered by a background thread or
+#       `manage.py run_exports` into a stored file; the user polls a
+#       status page with a download link. Identical exports of an
+#       unchanged session reuse the artifact for EXPORT_ARTIFACT_TTL.
+
+CONTENT_TYPES = {
+    ExportJob.PDF: "application/pdf",
+    ExportJob.DOCX: "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+BLOCK_TAGS = ["h1", "h2", "h3", "h4", "p", "li", "pre", "blockquote"]
+
+# Flowables platypus holds at once while laying out a PDF
+PDF_STORY_WINDOW = 200
+
+
+def export_messages(session, message_ids=None):
+    """
+    Messages to export, oldest first, streamed from the database.
+    """
+    messages = session.messages.order_by("id").only("id", "role", "content", "created_at")
+    if message_ids is not None:
+        messages = messages.filter(id__in=message_ids)
+    return messages.iterator(chunk_size=200)
+
+
+def message_blocks(message):
+    """
+    (kind, text) blocks of a message: "heading", "paragraph",
+    "bullet" or "code". Assistant content is rendered HTML, user
+    content plain text.
+    """
+    if message.role != "assistant":
+        for paragraph in message.content.split("\n\n"):
+            if paragraph.strip():
+                yield "paragraph", paragraph.strip()
+        return
+
+    soup = BeautifulSoup(message.content, "html.parser")
+    blocks = soup.find_all(BLOCK_TAGS)
+
+    if not blocks:
+        text = soup.get_text(" ", strip=True)
+        if text:
+            yield "paragraph", text
+        return
+
+    for block in blocks:
+        # Nested blocks (a <p> inside an <li>) are emitted by their parent
+        if block.find_parent(BLOCK_TAGS):
+            continue
+
+        if block.name == "pre":
+            yield "code", block.get_text()
+            continue
+
+        text = block.get_text(" ", strip=True)
+        if not text:
+            continue
+        if block.name.startswith("h"):
+            yield "heading", text
+        elif block.name == "li":
+            yield "bullet", text
+        else:
+            yield "paragraph", text
+
+
+def _speaker(message):
+    name = "You" if message.role == "user" else "Assistant"
+    return f"{name} · {timezone.localtime(message.created_at):%Y-%m-%d %H:%M}"
+
+
+# =========================
+# PDF (platypus)
+# =========================
+class _StreamedStory(list):
+    """
+    Flowable list that platypus consumes from the front, topped up
+    from a generator so only a window of the document is in memory.
+    """
+
+    def __init__(self, flowables, window=PDF_STORY_WINDOW):
+        super().__init__()
+        self._source = iter(flowables)
+        self._window = window
+        self._fill()
+
+    def _fill(self):
+        while super().__len__() < self._window:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                break
+
+    def __len__(self):
+        self._fill()
+        return super().__len__()
+
+
+def _pdf_flowables(title, messages):
+    styles = getSampleStyleSheet()
+    yield Paragraph(escape(title), styles["Title"])
+
+    for message in messages:
+        yield Spacer(1, 10)
+        yield Paragraph(f"<b>{escape(_speaker(message))}</b>", styles["Heading4"])
+
+        for kind, text in message_blocks(message):
+            if kind == "code":
+                yield Preformatted(text, styles["Code"])
+            elif kind == "heading":
+                yield Paragraph(escape(text), styles["Heading3"])
+            elif kind == "bullet":
+                yield Paragraph(escape(text), styles["Normal"], bulletText="•")
+            else:
+                yield Paragraph(escape(text), styles["Normal"])
+
+
+def write_pdf(out, *, title, messages):
+    SimpleDocTemplate(out, title=title).build(_StreamedStory(_pdf_flowables(title, messages)))
+
+
+# =========================
+# DOCX
+# =========================
+def write_docx(out, *, title, messages):
+    # python-docx keeps the whole document tree in memory; messages are
+    # still streamed, so the queryset never is.
+    doc = DocxDocument()
+    doc.add_heading(title, level=1)
+
+    for message in messages:
+        doc.add_paragraph().add_run(_speaker(message)).bold = True
+
+        for kind, text in message_blocks(message):
+            if kind == "heading":
+                doc.add_heading(text, level=3)
+            elif kind == "bullet":
+                doc.add_paragraph(text, style="List Bullet")
+            else:
+                doc.add_paragraph(text)
+
+    doc.save(out)
+
+
+WRITERS = {ExportJob.PDF: write_pdf, ExportJob.DOCX: write_docx}
+
+
+def render_export(format, *, title, messages):
+    """
+    The rendered export in a temp file (spooled to disk past
+    EXPORT_SPOOL_BYTES), rewound for reading.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_BYTES)
+    WRITERS[format](out, title=title, messages=messages)
+    out.seek(0)
+    return out
+
+
+def export_title(session):
+    return session.title or f"Chat {session.id}"
+
+
+def export_filename(session, format, *, selected=False):
+    name = f"chat_{session.id}_selected" if selected else f"chat_{session.id}"
+    return f"{name}.{format}"
+
+
+# =========================
+# BACKGROUND JOBS
+# =========================
+def _fingerprint(session, format, message_ids):
+    # A new message changes the session's export, so it's part of the key
+    last_id = session.messages.order_by("-id").values_list("id", flat=True).first()
+    selection = ",".join(str(i) for i in sorted(message_ids)) if message_ids is not None else "*"
+    return hashlib.sha256(
+        f"{session.id}:{format}:{selection}:{last_id}".encode()
+    ).hexdigest()
+
+
+def _fresh_jobs():
+    cutoff = timezone.now() - timedelta(seconds=settings.EXPORT_ARTIFACT_TTL)
+    return ExportJob.objects.filter(created_at__gte=cutoff)
+
+
+def request_export(*, user, session, format, message_ids=None):
+    """
+    An ExportJob for this export: a pending, running or finished one
+    for the same unchanged selection, or a new one (queued).
+    """
+    fingerprint = _fingerprint(session, format, message_ids)
+
+    job = (
+        _fresh_jobs()
+        .filter(fingerprint=fingerprint, user=user)
+        .exclude(status=ExportJob.FAILED)
+        .order_by("-id")
+        .first()
+    )
+    if job:
+        return job
+
+    job = ExportJob.objects.create(
+        user=user,
+        session=session,
+        format=format,
+        message_ids=sorted(message_ids) if message_ids is not None else None,
+        fingerprint=fingerprint,
+    )
+
+    if settings.EXPORT_WORKER == "thread":
+        transaction.on_commit(lambda: _start_thread(job.id))
+
+    return job
+
+
+def _start_thread(job_id):
+    def work():
+        try:
+            run_pending_exports(job_ids=[job_id])
+        finally:
+            connection.close()
+
+    threading.Thread(target=work, name=f"export-{job_id}", daemon=True).start()
+
+
+def _claim(job_ids=None):
+    with transaction.atomic():
+        jobs = ExportJob.objects.filter(status=ExportJob.PENDING).order_by("id")
+        if job_ids is not None:
+            jobs = jobs.filter(id__in=job_ids)
+
+        job = jobs.select_for_update(skip_locked=True).select_related("session").first()
+        if job:
+            job.status = ExportJob.RUNNING
+            job.save(update_fields=["status"])
+        return job
+
+
+def run_export(job):
+    """
+    Render a claimed job into its stored file.
+    """
+    try:
+        with render_export(
+            job.format,
+            title=export_title(job.session),
+            messages=export_messages(job.session, job.message_ids),
+        ) as rendered:
+            job.file.save(
+                export_filename(job.session, job.format, selected=job.message_ids is not None),
+                File(rendered),
+                save=False,
+            )
+        job.status = ExportJob.DONE
+    except Exception as e:
+        print(f"[EXPORT] job {job.id} failed: {e}")
+        job.status = ExportJob.FAILED
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["file", "status", "error", "finished_at"])
+    return job
+
+
+def run_pending_exports(*, job_ids=None):
+    """
+    Run pending jobs until none is left; jobs claimed by another worker
+    are skipped. Returns the number run.
+    """
+    count = 0
+    while job := _claim(job_ids):
+        run_export(job)
+        count += 1
+    return count
+
+
+def purge_exports():
+    """
+    Delete jobs (and files) older than EXPORT_ARTIFACT_TTL.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.EXPORT_ARTIFACT_TTL)
+    expired = ExportJob.objects.filter(created_at__lt=cutoff).exclude(status=ExportJob.RUNNING)
+
+    count = 0
+    for job in expired.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        count += 1
+    return count
@@ -1,6 +1,7 @@
 import faiss
 import os
 import pickle
+import shutil
 import numpy as np
 from django.conf import settings
 
@@ -34,6 +35,114 @@ def save_index(name, index, chunks):
         pickle.dump(chunks, f)
 
 
+# =========================
+# 🧹 GARBAGE COLLECTION
+# =========================
+
+def list_index_names():
+    """
+    Every namespace currently stored under FAISS_INDEX_DIR.
+    """
+    base = settings.FAISS_INDEX_DIR
+    if not os.path.isdir(base):
+        return []
+
+    return sorted(
+        entry.name for entry in os.scandir(base)
+        if entry.is_dir()
+    )
+
+
+def get_index_size(name):
+    """
+    Bytes used on disk by one index namespace.
+    """
+    _, _, base = get_index_paths(name)
+    if not os.path.isdir(base):
+        return 0
+
+    return sum(
+        entry.stat().st_size
+        for entry in os.scandir(base)
+        if entry.is_file()
+    )
+
+
+def delete_index(name):
+    """
+    Remove an index namespace from disk.
+    Returns the number of bytes reclaimed.
+    """
+    _, _, base = get_index_paths(name)
+    reclaimed = get_index_size(name)
+    shutil.rmtree(base, ignore_errors=True)
+    return reclaimed
+
+
+def compact_index(name, live_doc_ids, threshold=0.2, dry_run=False):
+    """
+    Drop vectors whose document no longer exists.
+
+    A namespace is only rewritten when its tombstone ratio
+    (dead vectors / total vectors) reaches `threshold`.
+    Fully dead namespaces are deleted outright.
+    """
+    index_path, _, _ = get_index_paths(name)
+
+    report = {
+        "name": name,
+        "vectors": 0,
+        "tombstones": 0,
+        "action": "kept",
+        "bytes_reclaimed": 0,
+    }
+
+    if not os.path.exists(index_path):
+        report["action"] = "skipped"
+        return report
+
+    index, chunks = load_or_create_index(name)
+
+    dead = [
+        i for i, chunk in enumerate(chunks)
+        if chunk.get("doc_id") not in live_doc_ids
+    ]
+
+    total = index.ntotal
+    report["vectors"] = total
+    report["tombstones"] = len(dead)
+
+    ratio = len(dead) / total if total else 1.0
+    if not dead and total:
+        return report
+    if ratio < threshold:
+        return report
+
+    before = get_index_size(name)
+
+    if len(dead) >= total:
+        report["action"] = "deleted"
+        if not dry_run:
+            delete_index(name)
+        report["bytes_reclaimed"] = before
+        return report
+
+    report["action"] = "compacted"
+    if dry_run:
+        return report
+
+    # IndexFlat ids are positions, so remove_ids keeps the
+    # surviving vectors aligned with the filtered chunk list.
+    index.remove_ids(np.array(dead, dtype="int64"))
+
+    dead_set = set(dead)
+    chunks = [c for i, c in enumerate(chunks) if i not in dead_set]
+
+    save_index(name, index, chunks)
+    report["bytes_reclaimed"] = max(0, before - get_index_size(name))
+    return report
+
+
 
 FAISS_INDEX_DIR = settings.FAISS_INDEX_DIR
 
@@ -1,7 +1,8 @@
 import numpy as np
 from .faiss_utils import load_or_create_index, save_index
-from .chunking import chunk_text
+from .chunking import iter_chunks
 from .embeddings import embed_texts
+from .term_index import build_term_index, count_in_corpus
 
 
 def index_document(doc):
@@ -10,8 +11,13 @@ def index_document(doc):
 
     index, chunks = load_or_create_index(index_name)
 
-    # Split into chunks
-    text_chunks = chunk_text(doc.extracted_text)
+    # Split into token-bounded, structure-aware chunks
+    spans = list(iter_chunks(doc.extracted_text))
+    text_chunks = [span["text"] for span in spans]
+
+    # Postings for single-document chat (no embeddings needed)
+    term_index = build_term_index(doc, spans=spans)
+
     if not text_chunks:
         print("[INDEXING STOPPED] No chunks generated.")
         return
@@ -26,13 +32,18 @@ def index_document(doc):
     index.add(np.array(embeddings))
 
     # Store metadata
-    for text in text_chunks:
+    for span in spans:
         chunks.append({
-            "text": text,
+            "text": span["text"],
+            "start": span["start"],
+            "end": span["end"],
             "doc_id": doc.id,
             "doc_name": doc.file.name.split("/")[-1],
         })
 
     save_index(index_name, index, chunks)
 
+    # BM25 corpus statistics for lexical reranking
+    count_in_corpus(term_index, doc.organization)
+
     print(f"[INDEX SUCCESS] {len(text_chunks)} chunks indexed into '{index_name}'")
\ No newline at end of file
@@ -0,0 +1,403 @@
+import asyncio
+import weakref
+from functools import cached_property, lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from openai import AsyncOpenAI, OpenAI
+
+from accounts.services.usage import record_usage, release_usage, reserve_usage
+
+from . import resilience, singleflight
+
+
+# =========================================================
+# 🔌 LLM PROVIDERS
+# =========================================================
+#
+# Every chat completion goes through an LLMProvider configured in
+# settings.LLM_PROVIDERS (model, base URL, timeout, retries, streaming),
+# so the app can be pointed at any OpenAI-compatible endpoint, e.g.
+# `manage.py fake_openai_server` for load tests.
+#
+# Calls are metered: quota is reserved before the request and settled
+# against the reported usage afterwards (accounts.services.usage).
+# Identical concurrent calls are coalesced (rag.singleflight); the sync
+# stream() is not, it serves no request path.
+#
+# Each provider has a circuit breaker (rag.resilience). While it is
+# open, calls go to the entry's FALLBACK provider (a cheaper model) if
+# one is configured, else fail fast with ProviderUnavailable. Under a
+# request deadline, timeouts shrink to the time left.
+
+
+class LLMProvider:
+    """
+    OpenAI-compatible chat completions for one LLM_PROVIDERS entry.
+    """
+
+    def __init__(
+        self,
+        name,
+        *,
+        model,
+        base_url=None,
+        api_key=None,
+        timeout=60,
+        max_retries=2,
+        streaming=True,
+        fallback=None,
+    ):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.streaming = streaming
+        self.fallback = fallback
+        self.breaker = resilience.make_breaker(name)
+        # Embeddings have no fallback (another model = another vector space)
+        self.embedding_breaker = resilience.make_breaker(f"{name}:embeddings")
+
+        # One pooled async client per event loop (httpx clients are loop-bound)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def __repr__(self):
+        return f"<LLMProvider {self.name}: {self.model} @ {self.base_url or 'api.openai.com'}>"
+
+    def _client_options(self):
+        if not self.api_key:
+            raise RuntimeError(f"No API key configured for LLM provider {self.name!r}")
+        return {
+            "api_key": self.api_key,
+            "base_url": self.base_url,
+            "timeout": self.timeout,
+            "max_retries": self.max_retries,
+        }
+
+    @cached_property
+    def client(self) -> OpenAI:
+        return OpenAI(**self._client_options())
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+
+        if client is None:
+            client = AsyncOpenAI(**self._client_options())
+            self._async_clients[loop] = client
+
+        return client
+
+    @property
+    def degraded(self):
+        """
+        True while the breaker is not closed (answers may come from the
+        fallback model).
+        """
+        return self.breaker.state != resilience.CircuitBreaker.CLOSED
+
+    def with_deadline(self, client):
+        """
+        `client` with timeout / retries bounded by the current deadline.
+        """
+        if resilience.remaining() is None:
+            return client
+        return client.with_options(
+            **resilience.request_options(timeout=self.timeout, max_retries=self.max_retries)
+        )
+
+    def _route(self):
+        """
+        The provider to call: this one, or its fallback while this
+        breaker is open. Raises ProviderUnavailable.
+        """
+        if self.breaker.allow():
+            return self
+
+        if self.fallback:
+            fallback = get_provider(self.fallback)
+            if fallback.breaker.allow():
+                print(f"[LLM] {self.name} circuit open, using {fallback.name} ({fallback.model})")
+                return fallback
+
+        raise resilience.ProviderUnavailable(
+            f"LLM provider {self.name!r} is unavailable (circuit open)"
+        )
+
+    def _request(self, messages, max_tokens, temperature, **extra):
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **extra,
+        }
+
+    def _flight_key(self, request, organization):
+        # Same payload for the same organization (billed once)
+        return singleflight.payload_key(
+            "completion",
+            {**request, "organization": getattr(organization, "id", None)},
+        )
+
+    def _reserve(self, messages, max_tokens, user, organization, purpose):
+        return reserve_usage(
+            organization=organization,
+            user=user,
+            model=self.model,
+            messages=messages,
+            purpose=purpose,
+            max_completion_tokens=max_tokens,
+        )
+
+    # =========================
+    # SYNC
+    # =========================
+    def complete(
+        self,
+        messages,
+        *,
+        max_tokens,
+        temperature=0,
+        user=None,
+        organization=None,
+        purpose="chat",
+    ) -> str:
+        """
+        Completion text (stripped). Raises QuotaExceeded,
+        ProviderUnavailable, DeadlineExceeded.
+        Identical concurrent calls share one request (rag.singleflight).
+        """
+        provider = self._route()
+        request = provider._request(messages, max_tokens, temperature)
+
+        def call():
+            reservation = provider._reserve(messages, max_tokens, user, organization, purpose)
+
+            try:
+                response = provider.with_deadline(provider.client).chat.completions.create(**request)
+            except Exception as e:
+                release_usage(reservation)
+                provider.breaker.record_error(e)
+                raise
+            provider.breaker.record(True)
+
+            text = (response.choices[0].message.content or "").strip()
+            record_usage(reservation, usage=response.usage, completion_text=text)
+            return text
+
+        return singleflight.do(provider._flight_key(request, organization), call)
+
+    def stream(
+        self,
+        messages,
+        *,
+        max_tokens,
+        temperature=0,
+        user=None,
+        organization=None,
+        purpose="chat",
+    ):
+        """
+        Yields completion text deltas. Usage is recorded when the stream
+        ends, also when it is abandoned. With streaming disabled the
+        whole completion arrives as one delta.
+        """
+        if not self.streaming:
+            yield self.complete(
+                messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                user=user,
+                organization=organization,
+                purpose=purpose,
+            )
+            return
+
+        provider = self._route()
+        reservation = provider._reserve(messages, max_tokens, user, organization, purpose)
+
+        try:
+            response = provider.with_deadline(provider.client).chat.completions.create(
+                **provider._request(
+                    messages,
+                    max_tokens,
+                    temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+            )
+        except Exception as e:
+            release_usage(reservation)
+            provider.breaker.record_error(e)
+            raise
+
+        parts = []
+        usage = None
+
+        try:
+            for chunk in response:
+                # The final chunk carries usage and no choices
+                usage = getattr(chunk, "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+                resilience.check("generation")
+            provider.breaker.record(True)
+        except Exception as e:
+            provider.breaker.record_error(e)
+            raise
+        finally:
+            record_usage(reservation, usage=usage, completion_text="".join(parts))
+
+    # =========================
+    # ASYNC (ASGI chat path)
+    # =========================
+    async def acomplete(
+        self,
+        messages,
+        *,
+        max_tokens,
+        temperature=0,
+        user=None,
+        organization=None,
+        purpose="chat",
+    ) -> str:
+        """
+        Async complete() (AsyncOpenAI).
+        """
+        provider = self._route()
+        request = provider._request(messages, max_tokens, temperature)
+
+        async def call():
+            reservation = await sync_to_async(provider._reserve)(
+                messages, max_tokens, user, organization, purpose
+            )
+
+            try:
+                response = await provider.with_deadline(
+                    provider.async_client
+                ).chat.completions.create(**request)
+            except Exception as e:
+                await sync_to_async(release_usage)(reservation)
+                provider.breaker.record_error(e)
+                raise
+            provider.breaker.record(True)
+
+            text = (response.choices[0].message.content or "").strip()
+            await sync_to_async(record_usage)(
+                reservation, usage=response.usage, completion_text=text
+            )
+            return text
+
+        return await singleflight.ado(provider._flight_key(request, organization), call)
+
+    async def astream(
+        self,
+        messages,
+        *,
+        max_tokens,
+        temperature=0,
+        user=None,
+        organization=None,
+        purpose="chat",
+    ):
+        """
+        Async stream(): yields completion text deltas. Identical
+        concurrent streams share one upstream stream (rag.singleflight).
+        """
+        if not self.streaming:
+            yield await self.acomplete(
+                messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                user=user,
+                organization=organization,
+                purpose=purpose,
+            )
+            return
+
+        provider = self._route()
+        request = provider._request(
+            messages,
+            max_tokens,
+            temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        async def upstream():
+            reservation = await sync_to_async(provider._reserve)(
+                messages, max_tokens, user, organization, purpose
+            )
+
+            try:
+                response = await provider.with_deadline(
+                    provider.async_client
+                ).chat.completions.create(**request)
+            except Exception as e:
+                await sync_to_async(release_usage)(reservation)
+                provider.breaker.record_error(e)
+                raise
+
+            parts = []
+            usage = None
+
+            try:
+                async for chunk in response:
+                    usage = getattr(chunk, "usage", None) or usage
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+                    # A shared stream runs under its first caller's deadline
+                    resilience.check("generation")
+                provider.breaker.record(True)
+            except Exception as e:
+                provider.breaker.record_error(e)
+                raise
+            finally:
+                await sync_to_async(record_usage)(
+                    reservation, usage=usage, completion_text="".join(parts)
+                )
+
+        async for delta in singleflight.astream(
+            provider._flight_key(request, organization), upstream
+        ):
+            yield delta
+
+
+@lru_cache(maxsize=None)
+def get_provider(name="default") -> LLMProvider:
+    """
+    The LLMProvider configured as settings.LLM_PROVIDERS[name].
+    """
+    try:
+        config = settings.LLM_PROVIDERS[name]
+    except KeyError:
+        raise RuntimeError(f"LLM provider {name!r} is not configured in LLM_PROVIDERS")
+
+    return LLMProvider(
+        name,
+        model=config["MODEL"],
+        base_url=config.get("BASE_URL"),
+        api_key=config.get("API_KEY"),
+        timeout=config.get("TIMEOUT", 60),
+        max_retries=config.get("MAX_RETRIES", 2),
+        streaming=config.get("STREAMING", True),
+        fallback=config.get("FALLBACK"),
+    )
+
+
+@receiver(setting_changed)
+def _reset_providers(*, setting, **kwargs):
+    # override_settings(LLM_PROVIDERS=...) in tests and benchmarks;
+    # breakers are built with the provider
+    if setting == "LLM_PROVIDERS" or setting.startswith("LLM_BREAKER_"):
+        get_provider.cache_clear()
@@ -0,0 +1,120 @@
+import json
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rag.chunking import chunk_text, get_encoding, iter_chunks
+
+
+WORDS = (
+    "the bank shall may minister licence institution provided capital "
+    "reserve deposit person financial act under subsection paragraph "
+    "regulation prescribed authority director board liability penalty "
+    "offence court order notice period year application approval"
+).split()
+
+
+def synthetic_statute(pages, chars_per_page=3000, seed=0):
+    """
+    Deterministic statute-like text: PARTs, numbered sections,
+    wrapped lines and sentences of varying length.
+    """
+    rnd = random.Random(seed)
+    target = pages * chars_per_page
+
+    out = []
+    size = 0
+    part = section = 0
+
+    while size < target:
+        if section % 25 == 0:
+            part += 1
+            heading = f"PART {part}\nGENERAL PROVISIONS\n"
+            out.append(heading)
+            size += len(heading)
+
+        section += 1
+        sentences = [
+            " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(6, 40))).capitalize() + "."
+            for _ in range(rnd.randint(3, 25))
+        ]
+
+        lines, line = [], ""
+        for word in " ".join(sentences).split():
+            if len(line) + len(word) > 80:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        lines.append(line)
+
+        block = f"{section}. Powers of the Bank\n" + "\n".join(lines) + "\n"
+        out.append(block)
+        size += len(block)
+
+    return "".join(out)
+
+
+def _token_stats(counts):
+    counts = np.asarray(counts)
+    return {
+        "chunks": int(len(counts)),
+        "mean": round(float(counts.mean()), 1),
+        "std": round(float(counts.std()), 1),
+        "min": int(counts.min()),
+        "max": int(counts.max()),
+    }
+
+
+class Command(BaseCommand):
+    help = "Throughput and chunk-size benchmark: word chunker vs token chunker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=1000)
+        parser.add_argument("--file", help="Benchmark a text file instead of synthetic text.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            with open(options["file"], encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+        else:
+            text = synthetic_statute(options["pages"], seed=options["seed"])
+
+        encoding = get_encoding()
+        megabytes = len(text.encode("utf-8")) / 1_000_000
+
+        started = time.perf_counter()
+        legacy = chunk_text(text)
+        legacy_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        chunks = list(iter_chunks(text, encoding=encoding))
+        token_s = time.perf_counter() - started
+
+        def clean_end(texts):
+            ends = [t.rstrip()[-1:] in ".!?" for t in texts]
+            return round(sum(ends) / len(ends), 3) if ends else 0.0
+
+        report = {
+            "pages": options["pages"] if not options["file"] else None,
+            "megabytes": round(megabytes, 2),
+            "word_chunker": {
+                "seconds": round(legacy_s, 3),
+                "mb_per_s": round(megabytes / legacy_s, 2) if legacy_s else None,
+                "tokens": _token_stats(
+                    [len(encoding.encode_ordinary(c)) for c in legacy]
+                ),
+                "sentence_end_ratio": clean_end(legacy),
+            },
+            "token_chunker": {
+                "seconds": round(token_s, 3),
+                "mb_per_s": round(megabytes / token_s, 2) if token_s else None,
+                "tokens": _token_stats([c["tokens"] for c in chunks]),
+                "sentence_end_ratio": clean_end([c["text"] for c in chunks]),
+            },
+        }
+
+        self.stdout.write(json.dumps(report, indent=2))
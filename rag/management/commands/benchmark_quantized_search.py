@@ -0,0 +1,137 @@
+import json
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models import Document, DocumentChunk
+from rag.retriever import search_chunks
+
+
+def _percentile(values, pct):
+    return round(float(np.percentile(values, pct)), 3) if values else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare binary-quantized two-stage search against exact search: "
+        "recall@k and latency over queries sampled from DocumentChunk, "
+        "unscoped and scoped to the sampled chunk's document."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument(
+            "--candidates",
+            type=int,
+            default=settings.RETRIEVAL_QUANTIZED_CANDIDATES,
+            help="First-pass candidates rescored with exact distance.",
+        )
+        parser.add_argument(
+            "--noise",
+            type=float,
+            default=0.05,
+            help="Gaussian noise added to sampled chunk embeddings.",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        rng = np.random.default_rng(options["seed"])
+
+        sample = list(
+            DocumentChunk.objects
+            .order_by("?")
+            .values_list("embedding", "document_id")[:options["queries"]]
+        )
+        if not sample:
+            raise CommandError("No DocumentChunk rows to benchmark against.")
+
+        recalls = []
+        rescored = []
+        exact_ms = []
+        quantized_ms = []
+        scoped = {"recalls": [], "rescored": [], "fallbacks": 0}
+
+        for embedding, document_id in sample:
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query + rng.normal(0, options["noise"], query.shape)
+
+            started = time.perf_counter()
+            exact = list(search_chunks(query, k).values_list("id", flat=True))
+            exact_ms.append((time.perf_counter() - started) * 1000)
+
+            metrics = {}
+            started = time.perf_counter()
+            approx = list(
+                search_chunks(
+                    query,
+                    k,
+                    quantized=True,
+                    candidates=options["candidates"],
+                    metrics=metrics,
+                ).values_list("id", flat=True)
+            )
+            quantized_ms.append((time.perf_counter() - started) * 1000)
+            rescored.append(metrics["rescored"])
+
+            if exact:
+                recalls.append(len(set(exact) & set(approx)) / len(exact))
+
+            # Scoped, as chat searches one document or a capped set
+            documents = Document.objects.filter(pk=document_id)
+            exact = list(
+                search_chunks(query, k, documents=documents).values_list("id", flat=True)
+            )
+            metrics = {}
+            approx = list(
+                search_chunks(
+                    query,
+                    k,
+                    documents=documents,
+                    quantized=True,
+                    candidates=options["candidates"],
+                    metrics=metrics,
+                ).values_list("id", flat=True)
+            )
+            scoped["rescored"].append(metrics["rescored"])
+            scoped["fallbacks"] += metrics["quantized_fallback"]
+            if exact:
+                scoped["recalls"].append(len(set(exact) & set(approx)) / len(exact))
+
+        report = {
+            "queries": len(sample),
+            "k": k,
+            "candidates": options["candidates"],
+            # First-pass rows actually rescored (can fall short of
+            # `candidates` when the HNSW scan returns fewer)
+            "rescored": {
+                "min": int(min(rescored)),
+                "mean": round(float(np.mean(rescored)), 1),
+            },
+            f"recall@{k}": round(float(np.mean(recalls)), 4) if recalls else 0.0,
+            "scoped": {
+                f"recall@{k}": (
+                    round(float(np.mean(scoped["recalls"])), 4)
+                    if scoped["recalls"] else 0.0
+                ),
+                "rescored": {
+                    "min": int(min(scoped["rescored"])),
+                    "mean": round(float(np.mean(scoped["rescored"])), 1),
+                },
+                # Queries whose first pass left fewer than k candidates
+                "exact_fallbacks": scoped["fallbacks"],
+            },
+            "exact_ms": {
+                "p50": _percentile(exact_ms, 50),
+                "p95": _percentile(exact_ms, 95),
+            },
+            "quantized_ms": {
+                "p50": _percentile(quantized_ms, 50),
+                "p95": _percentile(quantized_ms, 95),
+            },
+        }
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,399 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVector
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from documents.models import Document, DocumentChunk
+from rag.bm25 import update_corpus_statistics
+from rag.embeddings import local_embed_texts
+from rag.retriever import retrieve_chunks, retrieve_chunks_many
+from rag.utils import retrieve_documents_for_chat
+
+
+BENCHMARK_EMAIL = "retrieval-benchmark@example.com"
+SYLLABLES = (
+    "ka ro mi te sa nu lo vi da pe zo ri ga ne tu bo fa li ke mo "
+    "sen tar vel dor mun kas pil ron gat hen"
+).split()
+VOCABULARY_SIZE = 5000
+WORDS_PER_CHUNK = (60, 100)
+
+
+# =========================================================
+# 🧪 SYNTHETIC CORPUS (planted answers)
+# =========================================================
+def _words(rng, count, syllables, exclude=()):
+    words, seen = [], set(exclude)
+    while len(words) < count:
+        word = "".join(rng.choice(SYLLABLES, syllables))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+class SyntheticCorpus:
+    """
+    Reproducible corpus of `size` chunks of Zipf-distributed filler.
+
+    Each query plants one answer sentence in a target chunk and two
+    hard negatives (same first needle, different second term) in other
+    chunks, so the answer is findable but not trivially so.
+    """
+
+    def __init__(self, size, queries, chunks_per_document, seed=0):
+        if size < 3 * queries:
+            raise CommandError("Corpus needs at least 3 chunks per query.")
+
+        self.size = size
+        self.chunks_per_document = chunks_per_document
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        self.vocabulary = np.array(_words(rng, VOCABULARY_SIZE, 3))
+        ranks = np.arange(1, VOCABULARY_SIZE + 1)
+        self.probabilities = (1 / ranks ** 1.1) / (1 / ranks ** 1.1).sum()
+
+        needles = _words(rng, 2 * queries, 4, exclude=self.vocabulary)
+        positions = rng.choice(size, 3 * queries, replace=False)
+
+        self.planted = {}
+        self.questions = []
+        for q in range(queries):
+            first, second = needles[2 * q], needles[2 * q + 1]
+            target = int(positions[q])
+            self.planted[target] = f"The {first} {second} limit is {q + 7} units."
+            for negative in positions[queries + 2 * q:queries + 2 * q + 2]:
+                other = rng.choice(self.vocabulary)
+                self.planted[int(negative)] = f"The {first} {other} limit is {q + 3} units."
+            self.questions.append({
+                "question": f"What is the {first} {second} limit?",
+                "chunk_index": target,
+            })
+
+    @property
+    def documents(self):
+        return -(-self.size // self.chunks_per_document)
+
+    def title(self, number):
+        return f"bench s{self.seed} n{self.size} q{len(self.questions)} #{number}"
+
+    def chunk_texts(self, number):
+        """
+        Chunk texts of document `number`; independent of batching.
+        """
+        rng = np.random.default_rng([self.seed, number])
+        first = number * self.chunks_per_document
+        last = min(first + self.chunks_per_document, self.size)
+
+        texts = []
+        for index in range(first, last):
+            words = rng.choice(
+                self.vocabulary,
+                rng.integers(*WORDS_PER_CHUNK),
+                p=self.probabilities,
+            )
+            sentences = [
+                " ".join(words[i:i + 12]).capitalize() + "."
+                for i in range(0, len(words), 12)
+            ]
+            if index in self.planted:
+                sentences.insert(
+                    int(rng.integers(0, len(sentences) + 1)),
+                    self.planted[index],
+                )
+            texts.append(" ".join(sentences))
+        return texts
+
+
+def _corpus_loaded(corpus):
+    return (
+        DocumentChunk.objects.count() == corpus.size
+        and Document.objects.filter(pk=1, title=corpus.title(0)).exists()
+    )
+
+
+def _load_corpus(corpus, user, stdout, batch_documents=20):
+    """
+    (Re)load the corpus into empty tables. Ids restart at 1 and rows are
+    inserted in order, so chunk index i is DocumentChunk id i + 1.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"TRUNCATE {DocumentChunk._meta.db_table}, {Document._meta.db_table} "
+            "RESTART IDENTITY CASCADE"
+        )
+        cursor.execute("DELETE FROM rag_corpusstatistics")
+
+    for first in range(0, corpus.documents, batch_documents):
+        numbers = range(first, min(first + batch_documents, corpus.documents))
+        texts = {number: corpus.chunk_texts(number) for number in numbers}
+
+        documents = Document.objects.bulk_create([
+            Document(
+                uploaded_by=user,
+                file=f"benchmark/{number}.txt",
+                title=corpus.title(number),
+                extracted_text="\n\n".join(texts[number]),
+            )
+            for number in numbers
+        ])
+
+        chunks = [
+            DocumentChunk(document=document, content=text)
+            for document, number in zip(documents, numbers)
+            for text in texts[number]
+        ]
+        embeddings = local_embed_texts([chunk.content for chunk in chunks])
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk.embedding = embedding
+        DocumentChunk.objects.bulk_create(chunks, batch_size=1000)
+        update_corpus_statistics(
+            organization=None,
+            text_chunks=[chunk.content for chunk in chunks],
+        )
+
+        stdout.write(f"[BENCH] loaded {numbers[-1] + 1}/{corpus.documents} documents")
+
+    Document.objects.update(search_vector=SearchVector("extracted_text"))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {DocumentChunk._meta.db_table}")
+        cursor.execute(f"ANALYZE {Document._meta.db_table}")
+
+
+# =========================================================
+# 🔍 RETRIEVERS UNDER TEST
+# =========================================================
+def _timed(search, questions):
+    hits, latencies = [], []
+    for question in questions:
+        started = time.perf_counter()
+        hits.append(search(question))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return hits, latencies
+
+
+def _chunk_retriever(**flags):
+    def run(user, questions, k):
+        return _timed(
+            lambda question: [
+                r["chunk_id"] for r in retrieve_chunks(user, question, k=k, **flags)
+            ],
+            questions,
+        )
+    return run
+
+
+def _batch_retriever(user, questions, k, batch_size=32):
+    hits, latencies = [], []
+    for first in range(0, len(questions), batch_size):
+        batch = questions[first:first + batch_size]
+        started = time.perf_counter()
+        results = retrieve_chunks_many(user, batch, k=k)
+        # Amortized per-query latency
+        elapsed = (time.perf_counter() - started) * 1000 / len(batch)
+        hits.extend([r["chunk_id"] for r in rows] for rows in results)
+        latencies.extend([elapsed] * len(batch))
+    return hits, latencies
+
+
+def _fts_retriever(user, questions, k):
+    return _timed(
+        lambda question: list(
+            retrieve_documents_for_chat(user=user, question=question, limit=k)
+            .values_list("id", flat=True)
+        ),
+        questions,
+    )
+
+
+# name → (runner, granularity)
+RETRIEVERS = {
+    "vector": (_chunk_retriever(diversify=False, rerank=False, quantized=False), "chunk"),
+    "vector_mmr": (_chunk_retriever(diversify=True, rerank=False, quantized=False), "chunk"),
+    "vector_bm25": (_chunk_retriever(diversify=False, rerank=True, quantized=False), "chunk"),
+    "quantized": (_chunk_retriever(diversify=False, rerank=False, quantized=True), "chunk"),
+    "batch": (_batch_retriever, "chunk"),
+    "fts": (_fts_retriever, "document"),
+}
+
+
+# =========================================================
+# 📊 METRICS
+# =========================================================
+def _percentile(values, pct):
+    return round(float(np.percentile(values, pct)), 3) if values else 0.0
+
+
+def score(hits, expected, latencies, k):
+    ranks = [
+        results.index(answer) + 1 if answer in results[:k] else None
+        for results, answer in zip(hits, expected)
+    ]
+    return {
+        f"recall@{k}": round(float(np.mean([r is not None for r in ranks])), 4),
+        "mrr": round(float(np.mean([1 / r if r else 0.0 for r in ranks])), 4),
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+        },
+    }
+
+
+def _flatten(metrics, prefix=""):
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def diff_reports(baseline, report):
+    """
+    Per size / retriever / metric: {"baseline", "current", "delta"}.
+    """
+    changes = {}
+    for size, retrievers in report["results"].items():
+        for name, metrics in retrievers.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if not old:
+                continue
+            old = dict(_flatten(old))
+            for metric, value in _flatten(metrics):
+                if metric in old and isinstance(value, (int, float)):
+                    changes[f"{size}.{name}.{metric}"] = {
+                        "baseline": old[metric],
+                        "current": value,
+                        "delta": round(value - old[metric], 4),
+                    }
+    return changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Retrieval quality (recall@k, MRR) and latency (p50/p95/p99) on a "
+        "reproducible synthetic corpus with planted answers, built in a "
+        "throwaway test database with the local deterministic embedder."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[10_000],
+            help="Corpus sizes in chunks, e.g. 10000 100000 1000000.",
+        )
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--chunks-per-document", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--max-documents",
+            type=int,
+            default=0,
+            help="RETRIEVAL_MAX_DOCUMENTS during the run (default 0: search "
+                 "the whole corpus).",
+        )
+        parser.add_argument(
+            "--retrievers",
+            nargs="+",
+            choices=sorted(RETRIEVERS),
+            default=list(RETRIEVERS),
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--baseline", help="Previous report to diff against.")
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the benchmark database (reuses a matching corpus).",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The retrieval benchmark needs PostgreSQL + pgvector.")
+
+        baseline = None
+        if options["baseline"]:
+            baseline = json.loads(Path(options["baseline"]).read_text())
+
+        report = {
+            "config": {
+                "embedder": "local",
+                "k": options["k"],
+                "queries": options["queries"],
+                "chunks_per_document": options["chunks_per_document"],
+                "seed": options["seed"],
+                "max_documents": options["max_documents"],
+            },
+            "results": {},
+            "build_s": {},
+        }
+
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options["keepdb"]
+        )
+        try:
+            with override_settings(
+                EMBEDDING_BACKEND="local",
+                RETRIEVAL_MAX_DOCUMENTS=options["max_documents"],
+            ):
+                self._run(options, report)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"]
+            )
+
+        if baseline:
+            report["diff"] = diff_reports(baseline, report)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            Path(options["output"]).write_text(output)
+        self.stdout.write(output)
+
+    def _run(self, options, report):
+        k = options["k"]
+        user, _ = User.objects.get_or_create(
+            username=BENCHMARK_EMAIL, defaults={"email": BENCHMARK_EMAIL}
+        )
+
+        for size in options["sizes"]:
+            corpus = SyntheticCorpus(
+                size,
+                options["queries"],
+                options["chunks_per_document"],
+                seed=options["seed"],
+            )
+
+            started = time.perf_counter()
+            if not _corpus_loaded(corpus):
+                _load_corpus(corpus, user, self.stdout)
+            report["build_s"][str(size)] = round(time.perf_counter() - started, 2)
+
+            questions = [q["question"] for q in corpus.questions]
+            chunk_ids = [q["chunk_index"] + 1 for q in corpus.questions]
+            document_ids = [
+                q["chunk_index"] // corpus.chunks_per_document + 1
+                for q in corpus.questions
+            ]
+
+            results = report["results"][str(size)] = {}
+            for name in options["retrievers"]:
+                runner, granularity = RETRIEVERS[name]
+                hits, latencies = runner(user, questions, k)
+                expected = chunk_ids if granularity == "chunk" else document_ids
+                results[name] = {
+                    "granularity": granularity,
+                    **score(hits, expected, latencies, k),
+                }
+                self.stdout.write(f"[BENCH] {size} {name}: {results[name]}")
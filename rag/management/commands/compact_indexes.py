@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.models import Document
+from rag.faiss_utils import compact_index, list_index_names, load_or_create_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove vectors of deleted documents from FAISS namespaces and "
+        "rebuild namespaces whose tombstone ratio exceeds the threshold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=settings.FAISS_COMPACTION_THRESHOLD,
+            help="Minimum dead/total vector ratio before a namespace is rebuilt.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be reclaimed without touching disk.",
+        )
+
+    def handle(self, *args, **options):
+        threshold = options["threshold"]
+        dry_run = options["dry_run"]
+
+        total_reclaimed = 0
+
+        for name in list_index_names():
+            _, chunks = load_or_create_index(name)
+
+            referenced = {c.get("doc_id") for c in chunks}
+            live_doc_ids = set(
+                Document.objects
+                .filter(id__in=[i for i in referenced if i is not None])
+                .values_list("id", flat=True)
+            )
+
+            report = compact_index(
+                name,
+                live_doc_ids,
+                threshold=threshold,
+                dry_run=dry_run,
+            )
+            total_reclaimed += report["bytes_reclaimed"]
+
+            self.stdout.write(
+                f"{report['name']}: {report['action']} "
+                f"({report['tombstones']}/{report['vectors']} tombstones, "
+                f"{report['bytes_reclaimed']} bytes)"
+            )
+
+        prefix = "Would reclaim" if dry_run else "Reclaimed"
+        self.stdout.write(
+            self.style.SUCCESS(f"{prefix} {total_reclaimed} bytes")
+        )
@@ -0,0 +1,409 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from accounts.services.token_estimator import (
+    count_message_tokens,
+    count_tokens,
+    get_model_encoding,
+)
+from rag.embeddings import local_embed_texts
+
+
+QUESTION_RE = re.compile(r"QUESTION:\s*(.+?)(?:\n\s*\n|\Z)", re.S)
+
+
+def fake_answer(messages):
+    """
+    Deterministic Markdown answer echoing the question and citing S1.
+    """
+    prompt = messages[-1]["content"] if messages else ""
+    match = QUESTION_RE.search(prompt)
+    question = (match.group(1) if match else prompt).strip()[:200]
+    return (
+        "## Answer\n\n"
+        f"- Stand-in answer to: {question}\n"
+        "- Generated locally by fake_openai_server (S1).\n"
+    )
+
+
+def fake_rewrite(prompt):
+    """
+    Stand-in for rag.memory's query rewrite: short follow-ups are
+    prefixed with the previous user question.
+    """
+    question = prompt.rsplit("LATEST QUESTION:", 1)[1].strip()
+    previous = re.findall(r"^USER: (.+)$", prompt, re.M)
+    if previous and len(question.split()) <= 4:
+        return f"{previous[-1]} {question}"
+    return question
+
+
+def fake_summary(prompt):
+    """
+    Stand-in for rag.memory's rolling summary: previous summary plus
+    the new user questions, capped at 60 words.
+    """
+    summary = re.search(r"SUMMARY SO FAR:\n(.*?)\n\nNEW MESSAGES:", prompt, re.S).group(1)
+    asked = re.findall(r"^USER: (.+)$", prompt, re.M)
+    words = ("" if summary == "(empty)" else summary).split()
+    words += " ".join(f"Asked: {q}" for q in asked).split()
+    return " ".join(words[-60:])
+
+
+def fake_completion(messages):
+    prompt = messages[-1]["content"] if messages else ""
+    if "LATEST QUESTION:" in prompt:
+        return fake_rewrite(prompt)
+    if "NEW MESSAGES:" in prompt:
+        return fake_summary(prompt)
+    return fake_answer(messages)
+
+
+FILLER = "- Further stand-in detail to lengthen the answer (S1).\n"
+
+
+def pad_answer(answer, tokens, model):
+    """
+    Lengthen `answer` with filler bullets to about `tokens` tokens.
+    """
+    missing = tokens - count_tokens(answer, model)
+    if missing <= 0:
+        return answer
+    return answer + FILLER * math.ceil(missing / count_tokens(FILLER, model))
+
+
+def truncate_tokens(text, max_tokens, model):
+    encoding = get_model_encoding(model)
+    tokens = encoding.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text, "stop"
+    return encoding.decode(tokens[:max_tokens]), "length"
+
+
+def _words(text):
+    return re.findall(r"\S+\s*", text)
+
+
+class Latency:
+    """
+    Latency distribution in milliseconds:
+    fixed | uniform (mean ± jitter) | exponential | lognormal (sigma=jitter).
+    """
+
+    def __init__(self, mean_ms=0, dist="fixed", jitter=0.0, rng=None):
+        self.mean_ms = mean_ms
+        self.dist = dist
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        """Seconds."""
+        if self.mean_ms <= 0:
+            return 0.0
+
+        if self.dist == "uniform":
+            ms = self.rng.uniform(self.mean_ms - self.jitter, self.mean_ms + self.jitter)
+        elif self.dist == "exponential":
+            ms = self.rng.expovariate(1 / self.mean_ms)
+        elif self.dist == "lognormal":
+            # Parameterized so the distribution's mean is mean_ms
+            sigma = self.jitter or 0.5
+            ms = self.rng.lognormvariate(math.log(self.mean_ms) - sigma ** 2 / 2, sigma)
+        else:
+            ms = self.mean_ms
+
+        return max(0.0, ms) / 1000
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Just enough of the OpenAI REST API for the app:
+    POST /v1/chat/completions (plain and stream=True) and /v1/embeddings,
+    plus GET /stats with request / fault / token counters.
+
+    Class attributes are the load profile (set by the command).
+    """
+
+    token_delay = 0.03                  # seconds per streamed token
+    latency = Latency()                 # before the first token / response
+    embedding_latency = Latency()
+    answer_tokens = 0                   # pad answers to this length
+    error_rate = 0.0                    # HTTP 500
+    rate_limit_rate = 0.0               # HTTP 429 + Retry-After
+    timeout_rate = 0.0                  # hang for hang_seconds
+    disconnect_rate = 0.0               # drop streams half-way
+    hang_seconds = 120.0
+    rng = random.Random()
+
+    stats = Counter()
+    stats_lock = threading.Lock()
+
+    def log_message(self, fmt, *args):
+        print(f"[FAKE OPENAI] {fmt % args}")
+
+    def _count(self, **counts):
+        with self.stats_lock:
+            self.stats.update(counts)
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, kind, message, headers=None):
+        self._json(status, {"error": {"message": message, "type": kind, "code": kind}}, headers)
+
+    def _inject_fault(self):
+        """
+        Maybe answer with an injected failure. Returns True if it did.
+        """
+        roll = self.rng.random()
+
+        if roll < self.error_rate:
+            self._count(injected_500=1)
+            self._error(500, "server_error", "Injected server error")
+            return True
+        roll -= self.error_rate
+
+        if roll < self.rate_limit_rate:
+            self._count(injected_429=1)
+            self._error(429, "rate_limit_exceeded", "Injected rate limit", {"Retry-After": "1"})
+            return True
+        roll -= self.rate_limit_rate
+
+        if roll < self.timeout_rate:
+            self._count(injected_timeout=1)
+            time.sleep(self.hang_seconds)
+            self._error(504, "timeout", "Injected timeout")
+            return True
+
+        return False
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.stats_lock:
+                return self._json(200, dict(self.stats))
+        self._error(404, "not_found", f"Unknown path {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.endswith("/chat/completions"):
+            self._count(chat_requests=1)
+            if not self._inject_fault():
+                self._chat(request)
+            return
+        if self.path.endswith("/embeddings"):
+            self._count(embedding_requests=1)
+            if not self._inject_fault():
+                self._embeddings(request)
+            return
+
+        self._error(404, "not_found", f"Unknown path {self.path}")
+
+    def _chat(self, request):
+        model = request.get("model", "fake")
+        answer = fake_completion(request.get("messages", []))
+        if self.answer_tokens:
+            answer = pad_answer(answer, self.answer_tokens, model)
+
+        finish_reason = "stop"
+        if request.get("max_tokens"):
+            answer, finish_reason = truncate_tokens(answer, request["max_tokens"], model)
+
+        words = _words(answer)
+        usage = {
+            "prompt_tokens": count_message_tokens(request.get("messages", []), model),
+            "completion_tokens": count_tokens(answer, model),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self._count(prompt_tokens=usage["prompt_tokens"], completion_tokens=usage["completion_tokens"])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        time.sleep(self.latency.sample())
+
+        if not request.get("stream"):
+            time.sleep(self.token_delay * usage["completion_tokens"])
+            return self._json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send(delta, finish_reason=None, **extra):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if delta is None else [{
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": finish_reason,
+                }],
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        # Injected disconnects drop the stream half-way
+        cut = len(words) // 2 if self.rng.random() < self.disconnect_rate else None
+
+        send({"role": "assistant", "content": ""})
+        for i, word in enumerate(words):
+            if i == cut:
+                self._count(injected_disconnect=1)
+                self.close_connection = True
+                return
+            time.sleep(self.token_delay * count_tokens(word, model))
+            send({"content": word})
+        send({}, finish_reason=finish_reason)
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send(None, usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _embeddings(self, request):
+        texts = request.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+
+        time.sleep(self.embedding_latency.sample())
+
+        vectors = local_embed_texts(texts)
+        tokens = sum(count_tokens(t) for t in texts)
+        self._count(embedding_tokens=tokens)
+        self._json(200, {
+            "object": "list",
+            "model": request.get("model", "fake"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector.tolist()}
+                for i, vector in enumerate(vectors)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local OpenAI-compatible stand-in (chat completions with "
+        "streaming, embeddings) for offline development and load tests. "
+        "Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8001/v1. "
+        "Latency, token rate and fault injection are configurable; "
+        "GET /stats returns counters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8001)
+        parser.add_argument(
+            "--token-delay",
+            type=float,
+            default=30,
+            help="Milliseconds per streamed token.",
+        )
+        parser.add_argument(
+            "--tokens-per-second",
+            type=float,
+            help="Completion token rate (overrides --token-delay).",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0,
+            help="Mean milliseconds before the first token / response.",
+        )
+        parser.add_argument(
+            "--latency-dist",
+            choices=["fixed", "uniform", "exponential", "lognormal"],
+            default="fixed",
+        )
+        parser.add_argument(
+            "--latency-jitter",
+            type=float,
+            default=0,
+            help="± milliseconds for uniform, sigma for lognormal (default 0.5).",
+        )
+        parser.add_argument(
+            "--embedding-latency",
+            type=float,
+            default=0,
+            help="Mean milliseconds per embeddings request (same distribution).",
+        )
+        parser.add_argument(
+            "--answer-tokens",
+            type=int,
+            default=0,
+            help="Pad answers to about this many tokens (0 = natural length).",
+        )
+        parser.add_argument("--error-rate", type=float, default=0, help="Share of requests answered with HTTP 500.")
+        parser.add_argument("--rate-limit-rate", type=float, default=0, help="Share answered with HTTP 429.")
+        parser.add_argument("--timeout-rate", type=float, default=0, help="Share that hang for --hang-seconds.")
+        parser.add_argument("--disconnect-rate", type=float, default=0, help="Share of streams dropped half-way.")
+        parser.add_argument("--hang-seconds", type=float, default=120)
+        parser.add_argument("--seed", type=int, help="Seed latency and fault sampling.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        handler = FakeOpenAIHandler
+
+        handler.token_delay = (
+            1 / options["tokens_per_second"]
+            if options["tokens_per_second"]
+            else options["token_delay"] / 1000
+        )
+        handler.latency = Latency(
+            options["latency"], options["latency_dist"], options["latency_jitter"], rng
+        )
+        handler.embedding_latency = Latency(
+            options["embedding_latency"], options["latency_dist"], options["latency_jitter"], rng
+        )
+        handler.answer_tokens = options["answer_tokens"]
+        handler.error_rate = options["error_rate"]
+        handler.rate_limit_rate = options["rate_limit_rate"]
+        handler.timeout_rate = options["timeout_rate"]
+        handler.disconnect_rate = options["disconnect_rate"]
+        handler.hang_seconds = options["hang_seconds"]
+        handler.rng = rng
+
+        server = ThreadingHTTPServer((options["host"], options["port"]), handler)
+        server.daemon_threads = True
+
+        self.stdout.write(
+            f"[FAKE OPENAI] listening on http://{options['host']}:{options['port']}/v1"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"[FAKE OPENAI] stats: {dict(handler.stats)}")
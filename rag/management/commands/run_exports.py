@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rag.exports import purge_exports, run_pending_exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Render pending chat exports (ExportJob) and delete expired ones. "
+        "Run it from cron, or as a worker with --loop "
+        "(set EXPORT_WORKER=command to stop rendering in request threads)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new jobs instead of exiting.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds between polls with --loop.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            ran = run_pending_exports()
+            purged = purge_exports()
+            if ran or purged or not options["loop"]:
+                self.stdout.write(f"[EXPORT] rendered {ran} exports, purged {purged}")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,250 @@
+from asgiref.sync import sync_to_async
+from bs4 import BeautifulSoup
+from django.conf import settings
+
+from accounts.services.token_estimator import count_tokens, get_model_encoding
+
+from .llm import get_provider
+
+
+# =========================================================
+# 🧠 CONVERSATION MEMORY
+# =========================================================
+#
+# Each turn sees a bounded view of the session:
+#
+#   summary                         last CHAT_MEMORY_TURNS turns
+#   (ChatSession.summary)           (verbatim, clipped per message)
+#   ──────────────────────────────  ─────────────────────────────
+#   ... older messages, folded in   user / assistant / user / ...
+#       once they leave the window
+#
+# The memory is used to rewrite the new question into a standalone
+# one, which drives retrieval and the answer. Prompt size stays flat:
+# the summary is capped and only the few messages that just slid out of
+# the window are folded into it per turn.
+
+# Completion caps for the two memory calls
+REWRITE_MAX_TOKENS = 128
+
+# Never fold more than this many messages in one go (long legacy sessions)
+MAX_FOLD_MESSAGES = 20
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and "
+    "a document assistant. Merge the new messages into the summary.\n"
+    "- Keep document names, section numbers, entities and open questions.\n"
+    "- Drop pleasantries and formatting.\n"
+    "- Write at most {words} words of plain text."
+)
+
+REWRITE_SYSTEM_PROMPT = (
+    "Rewrite the user's latest question as a standalone search query, "
+    "resolving pronouns and references (\"it\", \"that act\", \"section 5?\") "
+    "from the conversation. Keep the user's wording otherwise. "
+    "If the question is already standalone, return it unchanged. "
+    "Reply with the query only."
+)
+
+
+def _message_text(message):
+    # Assistant messages are stored as rendered HTML
+    if message.role == "assistant":
+        return BeautifulSoup(message.content, "html.parser").get_text(" ", strip=True)
+    return message.content.strip()
+
+
+def _clip(text, max_tokens):
+    encoding = get_model_encoding(get_provider().model)
+    tokens = encoding.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]).rstrip() + " …"
+
+
+def _transcript(messages):
+    return "\n".join(
+        f"{m.role.upper()}: {_clip(_message_text(m), settings.CHAT_MEMORY_MESSAGE_TOKENS)}"
+        for m in messages
+    )
+
+
+def load_memory(session, *, before_id=None):
+    """
+    Conversation state before message `before_id`:
+    {"summary", "turns" (window, oldest first), "fold" (messages that
+    left the window and are not in the summary yet)}.
+    """
+    messages = session.messages.all()
+    if before_id is not None:
+        messages = messages.filter(id__lt=before_id)
+
+    window = list(messages.order_by("-id")[:settings.CHAT_MEMORY_TURNS * 2])[::-1]
+
+    fold = []
+    if window:
+        older = messages.filter(id__lt=window[0].id)
+        if session.summarized_through_id:
+            older = older.filter(id__gt=session.summarized_through_id)
+        fold = list(older.order_by("-id")[:MAX_FOLD_MESSAGES])[::-1]
+
+    return {"summary": session.summary, "turns": window, "fold": fold}
+
+
+def _summary_messages(summary, fold):
+    return [
+        {
+            "role": "system",
+            "content": SUMMARY_SYSTEM_PROMPT.format(
+                words=settings.CHAT_MEMORY_SUMMARY_TOKENS * 3 // 4
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"SUMMARY SO FAR:\n{summary or '(empty)'}\n\n"
+                f"NEW MESSAGES:\n{_transcript(fold)}"
+            ),
+        },
+    ]
+
+
+def _rewrite_messages(question, memory):
+    parts = []
+    if memory["summary"]:
+        parts.append(f"EARLIER CONVERSATION (SUMMARY):\n{memory['summary']}")
+    if memory["turns"]:
+        parts.append(f"RECENT MESSAGES:\n{_transcript(memory['turns'])}")
+    parts.append(f"LATEST QUESTION:\n{question}")
+
+    return [
+        {"role": "system", "content": REWRITE_SYSTEM_PROMPT},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+
+def _needs_rewrite(memory):
+    # The onboarding message alone is no conversation
+    return bool(memory["summary"]) or any(m.role == "user" for m in memory["turns"])
+
+
+def _save_summary(session, summary, fold):
+    session.summary = summary
+    session.summarized_through_id = fold[-1].id
+    session.save(update_fields=["summary", "summarized_through"])
+
+
+def _report(metrics, memory, question, standalone):
+    if metrics is None:
+        return
+    model = get_provider().model
+    metrics["memory"] = {
+        "turns": len(memory["turns"]),
+        "folded": len(memory["fold"]),
+        "summary_tokens": count_tokens(memory["summary"], model),
+        "prompt_tokens": count_tokens(
+            _rewrite_messages(question, memory)[1]["content"], model
+        ),
+    }
+    if standalone != question:
+        metrics["standalone_query"] = standalone
+
+
+# =========================
+# ENTRY POINTS
+# =========================
+def contextualize_question(
+    session,
+    question: str,
+    *,
+    before_id=None,
+    user=None,
+    organization=None,
+    metrics=None,
+) -> str:
+    """
+    Standalone version of `question` given the session's memory
+    (messages before `before_id`), folding messages that left the
+    window into ChatSession.summary first. Falls back to `question`
+    (and the old summary) when a model call fails.
+    """
+    if not settings.CHAT_MEMORY_TURNS:
+        return question
+
+    memory = load_memory(session, before_id=before_id)
+    call = {"user": user, "organization": organization}
+
+    if memory["fold"]:
+        try:
+            summary = get_provider().complete(
+                _summary_messages(memory["summary"], memory["fold"]),
+                max_tokens=settings.CHAT_MEMORY_SUMMARY_TOKENS,
+                purpose="memory_summary",
+                **call,
+            )
+            _save_summary(session, summary, memory["fold"])
+            memory["summary"] = summary
+        except Exception as e:
+            print(f"[MEMORY] summary update failed: {e}")
+
+    standalone = question
+    if _needs_rewrite(memory):
+        try:
+            standalone = get_provider().complete(
+                _rewrite_messages(question, memory),
+                max_tokens=REWRITE_MAX_TOKENS,
+                purpose="query_rewrite",
+                **call,
+            ) or question
+        except Exception as e:
+            print(f"[MEMORY] question rewrite failed: {e}")
+
+    _report(metrics, memory, question, standalone)
+    return standalone
+
+
+async def acontextualize_question(
+    session,
+    question: str,
+    *,
+    before_id=None,
+    user=None,
+    organization=None,
+    metrics=None,
+) -> str:
+    """
+    Async contextualize_question (AsyncOpenAI).
+    """
+    if not settings.CHAT_MEMORY_TURNS:
+        return question
+
+    memory = await sync_to_async(load_memory)(session, before_id=before_id)
+    call = {"user": user, "organization": organization}
+
+    if memory["fold"]:
+        try:
+            summary = await get_provider().acomplete(
+                _summary_messages(memory["summary"], memory["fold"]),
+                max_tokens=settings.CHAT_MEMORY_SUMMARY_TOKENS,
+                purpose="memory_summary",
+                **call,
+            )
+            await sync_to_async(_save_summary)(session, summary, memory["fold"])
+            memory["summary"] = summary
+        except Exception as e:
+            print(f"[MEMORY] summary update failed: {e}")
+
+    standalone = question
+    if _needs_rewrite(memory):
+        try:
+            standalone = await get_provider().acomplete(
+                _rewrite_messages(question, memory),
+                max_tokens=REWRITE_MAX_TOKENS,
+                purpose="query_rewrite",
+                **call,
+            ) or question
+        except Exception as e:
+            print(f"[MEMORY] question rewrite failed: {e}")
+
+    _report(metrics, memory, question, standalone)
+    return standalone
@@ -0,0 +1,23 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_documentchunk_embedding_bit'),
+        ('rag', '0002_corpusstatistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentTermIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunks', models.JSONField(default=list)),
+                ('postings', models.JSONField(default=dict)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='term_index', to='documents.document')),
+            ],
+        ),
+    ]
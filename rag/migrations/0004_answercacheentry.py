@@ -0,0 +1,32 @@
+import django.db.models.deletion
+import pgvector.django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('documents', '0003_documentchunk_embedding_bit'),
+        ('rag', '0003_documenttermindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('evidence_key', models.CharField(db_index=True, max_length=64)),
+                ('question', models.TextField()),
+                ('question_embedding', pgvector.django.VectorField(blank=True, dimensions=1536, null=True)),
+                ('chunk_ids', models.JSONField(default=list)),
+                ('answer', models.TextField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('documents', models.ManyToManyField(related_name='+', to='documents.document')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='answer_cache', to='accounts.organization')),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_documentchunk_embedding_bit'),
+        ('rag', '0006_chatmessage_session_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Citation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField(blank=True, null=True)),
+                ('start', models.PositiveIntegerField(default=0)),
+                ('end', models.PositiveIntegerField(blank=True, null=True)),
+                ('excerpt', models.TextField(blank=True, default='')),
+                ('chunk', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.documentchunk')),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.document')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='citations', to='rag.chatmessage')),
+            ],
+            options={
+                'ordering': ['message', 'rank'],
+            },
+        ),
+    ]
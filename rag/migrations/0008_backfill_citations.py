@@ -0,0 +1,95 @@
+from django.db import migrations
+
+
+BATCH_SIZE = 500
+
+
+def _batches(queryset):
+    batch = []
+    for item in queryset.iterator(chunk_size=BATCH_SIZE):
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def forwards(apps, schema_editor):
+    """
+    Replace sources["chunks"] (copied chunk texts) with Citation rows.
+    Texts are matched back to DocumentChunk rows of the message's
+    source documents; unmatched texts are kept as excerpts.
+    """
+    ChatMessage = apps.get_model("rag", "ChatMessage")
+    Citation = apps.get_model("rag", "Citation")
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+
+    messages = ChatMessage.objects.filter(
+        role="assistant", sources__has_key="chunks"
+    ).order_by("id")
+
+    for batch in _batches(messages):
+        texts = {t for m in batch for t in m.sources.get("chunks") or []}
+        document_ids = {
+            d["id"] for m in batch for d in m.sources.get("documents") or [] if d.get("id")
+        }
+
+        chunks = {}
+        if texts and document_ids:
+            for chunk_id, document_id, content in DocumentChunk.objects.filter(
+                document_id__in=document_ids, content__in=texts
+            ).values_list("id", "document_id", "content"):
+                chunks.setdefault(content, (chunk_id, document_id))
+
+        citations = []
+        for message in batch:
+            single_document = [d.get("id") for d in message.sources.get("documents") or []]
+            for rank, text in enumerate(message.sources.pop("chunks") or []):
+                chunk_id, document_id = chunks.get(text, (None, None))
+                if document_id is None and len(single_document) == 1:
+                    document_id = single_document[0]
+                citations.append(
+                    Citation(
+                        message_id=message.id,
+                        chunk_id=chunk_id,
+                        document_id=document_id,
+                        rank=rank,
+                        start=0,
+                        end=len(text),
+                        excerpt="" if chunk_id else text,
+                    )
+                )
+
+        Citation.objects.bulk_create(citations, batch_size=BATCH_SIZE)
+        ChatMessage.objects.bulk_update(batch, ["sources"], batch_size=BATCH_SIZE)
+
+
+def backwards(apps, schema_editor):
+    ChatMessage = apps.get_model("rag", "ChatMessage")
+    Citation = apps.get_model("rag", "Citation")
+
+    citations = Citation.objects.select_related("chunk").order_by("message_id", "rank")
+    texts = {}
+    for citation in citations.iterator(chunk_size=BATCH_SIZE):
+        text = citation.chunk.content[citation.start:citation.end] if citation.chunk else citation.excerpt
+        texts.setdefault(citation.message_id, []).append(text)
+
+    messages = ChatMessage.objects.filter(id__in=texts).order_by("id")
+    for batch in _batches(messages):
+        for message in batch:
+            message.sources = {**(message.sources or {}), "chunks": texts[message.id]}
+        ChatMessage.objects.bulk_update(batch, ["sources"], batch_size=BATCH_SIZE)
+
+    Citation.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0007_citation'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
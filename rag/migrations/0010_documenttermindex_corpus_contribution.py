@@ -0,0 +1,22 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0009_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documenttermindex',
+            name='total_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='documenttermindex',
+            name='counted_in',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='rag.corpusstatistics'),
+        ),
+    ]
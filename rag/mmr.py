@@ -0,0 +1,65 @@
+import numpy as np
+
+
+# =========================================================
+# 🔹 MAXIMAL MARGINAL RELEVANCE
+# =========================================================
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mmr_select(
+    query_embedding,
+    candidate_embeddings,
+    k=5,
+    lambda_mult=0.5,
+    dedup_threshold=0.95,
+    relevance=None,
+):
+    """
+    Pick up to `k` candidate indices balancing relevance and diversity.
+
+    - lambda_mult = 1.0 → pure relevance, 0.0 → pure diversity
+    - Candidates whose cosine similarity to an already selected
+      candidate is >= dedup_threshold are dropped entirely.
+    - `relevance` overrides the query cosine similarity
+      (e.g. with reranker scores).
+
+    Returns indices into `candidate_embeddings`, in selection order.
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.ndim != 2 or len(candidates) == 0 or k <= 0:
+        return []
+
+    candidates = _normalize(candidates)
+
+    if relevance is None:
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        relevance = candidates @ query
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+    similarity = candidates @ candidates.T
+
+    remaining = np.ones(len(candidates), dtype=bool)
+    max_similarity = np.zeros(len(candidates), dtype=np.float32)
+    selected = []
+
+    while len(selected) < k and remaining.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~remaining] = -np.inf
+
+        best = int(np.argmax(scores))
+        selected.append(best)
+        remaining[best] = False
+
+        if len(selected) == 1:
+            max_similarity = similarity[best].copy()
+        else:
+            np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+        # Near-duplicate suppression
+        remaining &= similarity[best] < dedup_threshold
+
+    return selected
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 #from django.db import models
+from pgvector.django import VectorField
+
 from documents.models import Document
 
 
@@ -26,6 +28,17 @@ class ChatSession(models.Model):
         blank=True
     )
 
+    # 🧠 Rolling summary of messages older than the memory window
+    # (rag.memory); summarized_through is the last message folded in.
+    summary = models.TextField(blank=True, default="")
+    summarized_through = models.ForeignKey(
+        "ChatMessage",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
+
     def __str__(self):
         return self.title or f"Chat {self.id}"
 
@@ -75,6 +88,10 @@ class ChatMessage(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Keyset pagination: newest messages of a session, then older
+            models.Index(fields=["session", "-id"]),
+        ]
 
     def __str__(self):
         return f"{self.role} message in chat {self.session.id}"
@@ -82,6 +99,96 @@ class ChatMessage(models.Model):
 
 
 
+# =====================================================
+# 📌 CITATIONS (RETRIEVED CHUNKS OF AN ANSWER)
+# =====================================================
+class Citation(models.Model):
+    """
+    A chunk an assistant message was answered from, by reference:
+    the text stays in DocumentChunk and is loaded in bulk only when a
+    citation is expanded (rag.citations.resolve_citations).
+    """
+    message = models.ForeignKey(
+        ChatMessage,
+        on_delete=models.CASCADE,
+        related_name="citations",
+    )
+    chunk = models.ForeignKey(
+        "documents.DocumentChunk",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+
+    rank = models.PositiveSmallIntegerField()        # 0 = best retrieved
+    score = models.FloatField(null=True, blank=True)  # retriever distance, lower = better
+
+    # Cited character range of the chunk's content
+    start = models.PositiveIntegerField(default=0)
+    end = models.PositiveIntegerField(null=True, blank=True)
+
+    # Only for passages no chunk could be found for (legacy / FAISS)
+    excerpt = models.TextField(blank=True, default="")
+
+    class Meta:
+        ordering = ["message", "rank"]
+
+    def __str__(self):
+        return f"Citation {self.rank} of message {self.message_id}"
+
+
+# =====================================================
+# 📄 CHAT EXPORT JOBS
+# =====================================================
+class ExportJob(models.Model):
+    """
+    A large chat export rendered in the background (rag.exports);
+    the file is kept for EXPORT_ARTIFACT_TTL and reused by identical
+    requests.
+    """
+    PDF, DOCX = "pdf", "docx"
+    FORMAT_CHOICES = ((PDF, "PDF"), (DOCX, "Word"))
+
+    PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    session = models.ForeignKey(
+        ChatSession,
+        on_delete=models.CASCADE,
+        related_name="exports",
+    )
+
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    message_ids = models.JSONField(null=True, blank=True)  # None = whole session
+
+    # sha256(session, format, selection, last message id)
+    fingerprint = models.CharField(max_length=64, db_index=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    file = models.FileField(upload_to="exports/", blank=True)
+    error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Export {self.format} of chat {self.session_id} ({self.status})"
+
+
 class Embedding(models.Model):
     document = models.ForeignKey(
         Document,
@@ -95,3 +202,112 @@ class Embedding(models.Model):
     def __str__(self):
         return f"Embedding(doc={self.document_id})"
 
+
+
+# =====================================================
+# 📊 BM25 CORPUS STATISTICS
+# =====================================================
+class CorpusStatistics(models.Model):
+    """
+    Chunk-level term statistics per organization, maintained at
+    index time. organization=None holds the global public corpus.
+    """
+    organization = models.OneToOneField(
+        "accounts.Organization",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="corpus_statistics",
+    )
+
+    chunk_count = models.PositiveIntegerField(default=0)
+    total_tokens = models.PositiveBigIntegerField(default=0)
+
+    # term → number of chunks containing it
+    document_frequencies = models.JSONField(default=dict)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Corpus stats ({self.organization or 'global'})"
+
+
+# =====================================================
+# 🗂 PER-DOCUMENT TERM INDEX
+# =====================================================
+class DocumentTermIndex(models.Model):
+    """
+    Chunk offsets and term → chunk postings for one document,
+    computed once at ingest for single-document chat.
+    """
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        related_name="term_index",
+    )
+
+    # [[start, end], ...] character offsets into Document.extracted_text
+    chunks = models.JSONField(default=list)
+
+    # term → [chunk position, ...]
+    postings = models.JSONField(default=dict)
+
+    # Whitespace tokens over all chunks (as counted by rag.bm25)
+    total_tokens = models.PositiveIntegerField(default=0)
+
+    # The BM25 corpus these chunks were added to once indexing
+    # succeeded (None: not counted), so deleting or re-indexing the
+    # document subtracts exactly that
+    counted_in = models.ForeignKey(
+        CorpusStatistics,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Term index (doc={self.document_id})"
+
+
+# =====================================================
+# 💾 ANSWER CACHE
+# =====================================================
+class AnswerCacheEntry(models.Model):
+    """
+    A generated RAG answer, reusable when the same organization asks
+    the same (normalized) question over the same retrieved chunks with
+    the same prompt version. Deleted when a contributing document
+    changes (rag.signals).
+    """
+    organization = models.ForeignKey(
+        "accounts.Organization",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="answer_cache",
+    )
+
+    # sha256(org, prompt version, model, chunk ids, normalized question)
+    key = models.CharField(max_length=64, unique=True)
+
+    # sha256(org, prompt version, model, chunk ids): paraphrase lookups
+    # only consider entries built from the same evidence
+    evidence_key = models.CharField(max_length=64, db_index=True)
+
+    question = models.TextField()
+    question_embedding = VectorField(dimensions=1536, null=True, blank=True)
+
+    chunk_ids = models.JSONField(default=list)
+    documents = models.ManyToManyField(Document, related_name="+")
+
+    answer = models.TextField()
+
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Cached answer ({self.organization or 'global'}): {self.question[:50]}"
@@ -1,43 +1,44 @@
-import os
-from openai import OpenAI
+from django.conf import settings
 
+from .context import count_prompt_tokens, pack_context
+from .llm import get_provider
 
-def get_openai_client() -> OpenAI:
-    """
-    Lazily initialize OpenAI client.
-    Prevents Django from crashing at import time.
-    """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set")
-    return OpenAI(api_key=api_key)
 
+# Bump whenever build_rag_messages() changes: cached answers
+# (rag.answer_cache) are keyed by it.
+PROMPT_VERSION = "rag-answer-v2"
 
-def rag_answer_from_chunks(
+RAG_USER_TEMPLATE = """
+SOURCES:
+{sources}
+
+QUESTION:
+{question}
+
+INSTRUCTIONS:
+- Structure the answer clearly
+- Prefer lists over prose
+- If listing items (e.g. sections), list them cleanly
+"""
+
+NO_ANSWER = (
+    "## Answer\n\n"
+    "The document does not contain enough information "
+    "to answer this question."
+)
+
+
+def build_rag_messages(
     *,
     question: str,
     chunks: list[dict],
-) -> str:
+    metrics=None,
+) -> list[dict]:
     """
-    LOW-LEVEL RAG EXECUTOR.
-    Uses ONLY provided chunks.
-    Returns CLEAN, STRUCTURED MARKDOWN.
+    Chat messages (system + user) for a RAG answer over `chunks`,
+    packed into the answer model's token budget (rag.context).
     """
-
-    if not chunks:
-        return (
-            "## Answer\n\n"
-            "The document does not contain enough information "
-            "to answer this question."
-        )
-
-    # =========================
-    # PREPARE SOURCES
-    # =========================
-    sources_text = "\n\n".join(
-        f"[S{i + 1}]\n{c['text']}"
-        for i, c in enumerate(chunks)
-    )
+    model = get_provider().model
 
     # =========================
     # SYSTEM PROMPT (STRICT + CLEAN OUTPUT)
@@ -61,41 +62,213 @@ def rag_answer_from_chunks(
 )
 
     # =========================
-    # USER PROMPT
+    # PREPARE SOURCES (TOKEN BUDGET)
     # =========================
-    user_prompt = f"""
-SOURCES:
-{sources_text}
-
-QUESTION:
-{question}
+    chunks = pack_context(
+        chunks,
+        model=model,
+        prompt_tokens=count_prompt_tokens(
+            system_prompt,
+            RAG_USER_TEMPLATE.format(sources="", question=question),
+            model=model,
+        ),
+        metrics=metrics,
+    )
 
-INSTRUCTIONS:
-- Structure the answer clearly
-- Prefer lists over prose
-- If listing items (e.g. sections), list them cleanly
-"""
+    sources_text = "\n\n".join(
+        f"[S{i + 1}]\n{c['text']}"
+        for i, c in enumerate(chunks)
+    )
 
     # =========================
-    # OPENAI CALL (LAZY INIT)
+    # USER PROMPT
     # =========================
-    client = get_openai_client()
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-    )
+    user_prompt = RAG_USER_TEMPLATE.format(sources=sources_text, question=question)
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _answer_kwargs(*, question, chunks, user, organization, metrics, purpose):
+    return {
+        "messages": build_rag_messages(question=question, chunks=chunks, metrics=metrics),
+        "max_tokens": settings.CONTEXT_ANSWER_TOKENS,
+        "temperature": 0,
+        "user": user,
+        "organization": organization,
+        "purpose": purpose,
+    }
+
+
+def _with_heading(answer):
+    if not answer.startswith("##"):
+        answer = "## Answer\n\n" + answer
+    return answer
+
+
+class _HeadingStream:
+    """
+    Applies the "## Answer" heading cleanup to a stream of deltas:
+    holds back the first characters until we know whether the answer
+    opens with a heading.
+    """
+
+    def __init__(self):
+        self.head = ""
+        self.started = False
+
+    def feed(self, delta):
+        if self.started:
+            return [delta]
 
-    answer = response.choices[0].message.content.strip()
+        self.head += delta
+        if len(self.head.lstrip()) < 2:
+            return []
+
+        self.started = True
+        delta = self.head.lstrip()
+        return [delta] if delta.startswith("##") else ["## Answer\n\n", delta]
+
+    def close(self):
+        if not self.started and self.head.strip():
+            return ["## Answer\n\n" + self.head.strip()]
+        return []
+
+
+def rag_answer_from_chunks(
+    *,
+    question: str,
+    chunks: list[dict],
+    user=None,
+    organization=None,
+    metrics=None,
+) -> str:
+    """
+    LOW-LEVEL RAG EXECUTOR.
+    Uses ONLY provided chunks.
+    Returns CLEAN, STRUCTURED MARKDOWN.
+    Raises QuotaExceeded.
+    """
+
+    if not chunks:
+        return NO_ANSWER
+
+    answer = get_provider().complete(
+        **_answer_kwargs(
+            question=question,
+            chunks=chunks,
+            user=user,
+            organization=organization,
+            metrics=metrics,
+            purpose="answer",
+        )
+    )
 
     # =========================
     # FINAL SANITY CLEANUP
     # =========================
-    if not answer.startswith("##"):
-        answer = "## Answer\n\n" + answer
+    return _with_heading(answer)
 
-    return answer
+
+def stream_rag_answer(
+    *,
+    question: str,
+    chunks: list[dict],
+    user=None,
+    organization=None,
+    metrics=None,
+):
+    """
+    Streaming variant of rag_answer_from_chunks.
+    Yields Markdown text deltas as the model produces them; joined,
+    they equal the non-streamed answer (same heading cleanup).
+    """
+
+    if not chunks:
+        yield NO_ANSWER
+        return
+
+    heading = _HeadingStream()
+
+    for delta in get_provider().stream(
+        **_answer_kwargs(
+            question=question,
+            chunks=chunks,
+            user=user,
+            organization=organization,
+            metrics=metrics,
+            purpose="answer_stream",
+        )
+    ):
+        yield from heading.feed(delta)
+
+    yield from heading.close()
+
+
+# =========================
+# ASYNC VARIANTS (ASGI chat path)
+# =========================
+async def arag_answer_from_chunks(
+    *,
+    question: str,
+    chunks: list[dict],
+    user=None,
+    organization=None,
+    metrics=None,
+) -> str:
+    """
+    Async rag_answer_from_chunks (AsyncOpenAI).
+    """
+
+    if not chunks:
+        return NO_ANSWER
+
+    answer = await get_provider().acomplete(
+        **_answer_kwargs(
+            question=question,
+            chunks=chunks,
+            user=user,
+            organization=organization,
+            metrics=metrics,
+            purpose="answer",
+        )
+    )
+
+    return _with_heading(answer)
+
+
+async def astream_rag_answer(
+    *,
+    question: str,
+    chunks: list[dict],
+    user=None,
+    organization=None,
+    metrics=None,
+):
+    """
+    Async stream_rag_answer: yields Markdown deltas.
+    """
+
+    if not chunks:
+        yield NO_ANSWER
+        return
+
+    heading = _HeadingStream()
+
+    async for delta in get_provider().astream(
+        **_answer_kwargs(
+            question=question,
+            chunks=chunks,
+            user=user,
+            organization=organization,
+            metrics=metrics,
+            purpose="answer_stream",
+        )
+    ):
+        for part in heading.feed(delta):
+            yield part
+
+    for part in heading.close():
+        yield part
@@ -1,10 +1,59 @@
-from rag.qa import rag_answer_from_chunks
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from rag.answer_cache import get_cached_answer, store_answer
+from rag.llm import get_provider
+from rag.qa import (
+    arag_answer_from_chunks,
+    astream_rag_answer,
+    rag_answer_from_chunks,
+    stream_rag_answer,
+)
+
+
+# All entry points accept `organization` / `query_embedding` for the
+# answer cache and an optional `metrics` dict that records
+# "answer_cache": "hit" | "miss" and the context packing report.
+# Model calls are metered against `organization`'s quota for `user`
+# (accounts.services.usage); they raise QuotaExceeded, cache hits are free.
+# They also raise rag.resilience.ProviderUnavailable / DeadlineExceeded.
+
+
+def _cache_lookup(question, chunks, organization, query_embedding, metrics):
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+
+    cached = get_cached_answer(
+        organization=organization,
+        question=question,
+        chunks=chunks,
+        query_embedding=query_embedding,
+    )
+    if metrics is not None:
+        metrics["answer_cache"] = "miss" if cached is None else "hit"
+    return cached
+
+
+def _cache_store(question, chunks, organization, query_embedding, answer):
+    # Answers from the fallback model are not worth keeping for a week
+    if settings.ANSWER_CACHE_ENABLED and not get_provider().degraded:
+        store_answer(
+            organization=organization,
+            question=question,
+            chunks=chunks,
+            answer=answer,
+            query_embedding=query_embedding,
+        )
 
 
 def rag_answer(
     *,
     question: str,
     chunks: list,
+    user=None,
+    organization=None,
+    query_embedding=None,
+    metrics=None,
 ):
     """
     HIGH-LEVEL RAG ANSWER.
@@ -12,9 +61,124 @@ def rag_answer(
     Returns MARKDOWN.
     """
 
+    cached = _cache_lookup(question, chunks, organization, query_embedding, metrics)
+    if cached is not None:
+        return cached
+
     answer_md = rag_answer_from_chunks(
         question=question,
         chunks=chunks,
+        user=user,
+        organization=organization,
+        metrics=metrics,
+    )
+
+    _cache_store(question, chunks, organization, query_embedding, answer_md)
+
+    return answer_md
+
+
+def rag_answer_stream(
+    *,
+    question: str,
+    chunks: list,
+    user=None,
+    organization=None,
+    query_embedding=None,
+    metrics=None,
+):
+    """
+    Streaming RAG answer.
+    Yields MARKDOWN deltas (a cached answer arrives as one delta).
+    """
+
+    cached = _cache_lookup(question, chunks, organization, query_embedding, metrics)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    for delta in stream_rag_answer(
+        question=question,
+        chunks=chunks,
+        user=user,
+        organization=organization,
+        metrics=metrics,
+    ):
+        parts.append(delta)
+        yield delta
+
+    # Only complete answers are cached
+    _cache_store(question, chunks, organization, query_embedding, "".join(parts))
+
+
+async def arag_answer(
+    *,
+    question: str,
+    chunks: list,
+    user=None,
+    organization=None,
+    query_embedding=None,
+    metrics=None,
+):
+    """
+    Async RAG answer (ASGI). Returns MARKDOWN.
+    """
+
+    cached = await sync_to_async(_cache_lookup)(
+        question, chunks, organization, query_embedding, metrics
+    )
+    if cached is not None:
+        return cached
+
+    answer_md = await arag_answer_from_chunks(
+        question=question,
+        chunks=chunks,
+        user=user,
+        organization=organization,
+        metrics=metrics,
     )
 
-    return answer_md
\ No newline at end of file
+    await sync_to_async(_cache_store)(
+        question, chunks, organization, query_embedding, answer_md
+    )
+
+    return answer_md
+
+
+async def arag_answer_stream(
+    *,
+    question: str,
+    chunks: list,
+    user=None,
+    organization=None,
+    query_embedding=None,
+    metrics=None,
+):
+    """
+    Async streaming RAG answer.
+    Yields MARKDOWN deltas (a cached answer arrives as one delta).
+    """
+
+    cached = await sync_to_async(_cache_lookup)(
+        question, chunks, organization, query_embedding, metrics
+    )
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for delta in astream_rag_answer(
+        question=question,
+        chunks=chunks,
+        user=user,
+        organization=organization,
+        metrics=metrics,
+    ):
+        parts.append(delta)
+        yield delta
+
+    # Only complete answers are cached
+    await sync_to_async(_cache_store)(
+        question, chunks, organization, query_embedding, "".join(parts)
+    )
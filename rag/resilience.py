@@ -0,0 +1,400 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent import futures
+from contextlib import contextmanager, suppress
+
+import numpy as np
+import openai
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+
+# =========================================================
+# ⏱️ DEADLINES, HEDGING, CIRCUIT BREAKING
+# =========================================================
+#
+# A chat turn gets one time budget (CHAT_DEADLINE) that every stage
+# draws from:
+#
+#   embed ──► retrieve ──► generate
+#   timeout = what is left of the budget, never the full provider
+#   timeout; a stage that starts with nothing left fails fast with
+#   DeadlineExceeded.
+#
+# Embedding calls are hedged: when the first attempt is slower than the
+# recent p95, a second identical attempt is fired and the first answer
+# wins. Chat calls go through a per-provider CircuitBreaker that fails
+# fast (or falls back to a cheaper model, see rag.llm) while the
+# upstream error rate is high.
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+# =========================
+# DEADLINES
+# =========================
+_deadline = contextvars.ContextVar("rag_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds=None, *, until=None):
+    """
+    Run the block under a deadline: `seconds` from now, or the absolute
+    time.monotonic() value `until`. Nested deadlines only ever tighten.
+    Follows the context into sync_to_async threads and tasks.
+    """
+    expires = until if until is not None else time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires = min(expires, current)
+
+    token = _deadline.set(expires)
+    try:
+        yield expires
+    finally:
+        # Async generators may be finalized from another context
+        with suppress(ValueError):
+            _deadline.reset(token)
+
+
+def remaining():
+    """
+    Seconds left before the current deadline (None: no deadline).
+    """
+    expires = _deadline.get()
+    if expires is None:
+        return None
+    return max(expires - time.monotonic(), 0.0)
+
+
+def check(stage):
+    """
+    Raise DeadlineExceeded if the current deadline has passed.
+    """
+    if remaining() == 0:
+        raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+def request_options(*, timeout, max_retries):
+    """
+    OpenAI client options for one call: the timeout is capped by the
+    deadline, and SDK retries (whose backoff would overrun it) are off
+    while a deadline is active.
+    """
+    left = remaining()
+    if left is None:
+        return {"timeout": timeout, "max_retries": max_retries}
+    if left == 0:
+        raise DeadlineExceeded("Deadline exceeded before provider call")
+    return {"timeout": min(timeout, left), "max_retries": 0}
+
+
+@contextmanager
+def statement_timeout(stage):
+    """
+    Bound the queries of the block by the deadline (PostgreSQL
+    statement_timeout, transaction-local). A cancelled query raises
+    DeadlineExceeded.
+    """
+    left = remaining()
+    if left is None or connection.vendor != "postgresql":
+        yield
+        return
+
+    check(stage)
+    # Inside an outer transaction SET LOCAL would outlive the block
+    nested = connection.in_atomic_block
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL statement_timeout = {max(int(left * 1000), 1)}")
+            yield
+            if nested:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = DEFAULT")
+    except OperationalError as e:
+        # 57014 = query_canceled
+        cause = e.__cause__
+        sqlstate = getattr(cause, "pgcode", None) or getattr(
+            getattr(cause, "diag", None), "sqlstate", None
+        )
+        if sqlstate == "57014":
+            raise DeadlineExceeded(f"Deadline exceeded during {stage}") from e
+        raise
+
+
+# =========================
+# HEDGED REQUESTS
+# =========================
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies (seconds).
+    """
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q):
+        with self.lock:
+            if len(self.samples) < settings.EMBEDDING_HEDGE_MIN_SAMPLES:
+                return None
+            return float(np.percentile(self.samples, q))
+
+
+embedding_latency = LatencyTracker()
+
+_hedge_pool = futures.ThreadPoolExecutor(
+    max_workers=settings.EMBEDDING_HEDGE_WORKERS, thread_name_prefix="hedge"
+)
+# Free workers: an attempt queued behind busy ones would only add latency
+_hedge_slots = threading.BoundedSemaphore(settings.EMBEDDING_HEDGE_WORKERS)
+
+
+def _hedge_delay(tracker):
+    if not settings.EMBEDDING_HEDGE_ENABLED:
+        return None
+
+    p = tracker.percentile(settings.EMBEDDING_HEDGE_PERCENTILE)
+    if p is None:
+        return None
+
+    delay = max(p, settings.EMBEDDING_HEDGE_MIN_DELAY)
+    left = remaining()
+    if left is not None and delay >= left:
+        return None  # no time for a second attempt to help
+    return delay
+
+
+def _timed(fn, tracker):
+    started = time.monotonic()
+    result = fn()
+    tracker.add(time.monotonic() - started)
+    return result
+
+
+def _hedge_submit(fn, tracker):
+    """
+    Run fn in a free hedge worker (None: every worker is busy).
+    """
+    slots = _hedge_slots
+    if not slots.acquire(blocking=False):
+        return None
+
+    # Attempts run in pool threads: carry the deadline along
+    attempt = _hedge_pool.submit(contextvars.copy_context().run, _timed, fn, tracker)
+    attempt.add_done_callback(lambda _: slots.release())
+    return attempt
+
+
+def hedged(fn, *, tracker, name="call"):
+    """
+    fn(), with a second concurrent attempt if the first one is still
+    running after the tracker's p95 latency. The first success wins;
+    the other attempt is left to finish in the background. Without a
+    free hedge worker the call simply runs unhedged.
+    """
+    delay = _hedge_delay(tracker)
+    if delay is None:
+        return _timed(fn, tracker)
+
+    first = _hedge_submit(fn, tracker)
+    if first is None:
+        return _timed(fn, tracker)
+    try:
+        return first.result(timeout=delay)
+    except futures.TimeoutError:
+        pass
+
+    second = _hedge_submit(fn, tracker)
+    if second is None:
+        print(f"[HEDGE] {name} slower than {delay * 1000:.0f} ms, no free worker to hedge")
+        pending = {first}
+    else:
+        print(f"[HEDGE] {name} slower than {delay * 1000:.0f} ms, sending a second attempt")
+        pending = {first, second}
+    error = None
+
+    while pending:
+        done, pending = futures.wait(
+            pending, timeout=remaining(), return_when=futures.FIRST_COMPLETED
+        )
+        if not done:
+            raise DeadlineExceeded(f"Deadline exceeded during {name}")
+        for attempt in done:
+            if attempt.exception() is None:
+                return attempt.result()
+            error = attempt.exception()
+
+    raise error
+
+
+async def ahedged(fn, *, tracker, name="call"):
+    """
+    Async hedged(): `fn` is an async callable. The losing attempt is
+    cancelled.
+    """
+    async def timed():
+        started = time.monotonic()
+        result = await fn()
+        tracker.add(time.monotonic() - started)
+        return result
+
+    delay = _hedge_delay(tracker)
+    if delay is None:
+        return await timed()
+
+    first = asyncio.ensure_future(timed())
+    attempts = {first}
+
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if done:
+            return first.result()
+
+        print(f"[HEDGE] {name} slower than {delay * 1000:.0f} ms, sending a second attempt")
+        attempts.add(asyncio.ensure_future(timed()))
+        pending = set(attempts)
+        error = None
+
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceeded(f"Deadline exceeded during {name}")
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+                error = attempt.exception()
+        raise error
+    finally:
+        # Also when the caller is cancelled
+        for attempt in attempts:
+            attempt.cancel()
+
+
+# =========================
+# CIRCUIT BREAKER
+# =========================
+def is_upstream_failure(error):
+    """
+    Errors that say the provider is unhealthy (not the request):
+    timeouts, connection errors, 429 and 5xx.
+    """
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    closed ──(error rate ≥ threshold)──► open ──(cooldown)──► half-open
+       ▲                                                         │
+       └──────────────(probe succeeds)──── probe fails: open ◄───┘
+
+    The error rate is measured over the last `window` seconds, once at
+    least `min_calls` outcomes were recorded. Half-open lets one probe
+    through per cooldown.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, *, window, min_calls, error_rate, cooldown):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+
+        self.state = self.CLOSED
+        self.outcomes = deque()  # (time, ok)
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<CircuitBreaker {self.name}: {self.state}>"
+
+    def allow(self):
+        """
+        Whether a call may go upstream now.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and now - self.opened_at < self.cooldown:
+                return False
+            if self.state == self.HALF_OPEN and now - self.probe_at < self.cooldown:
+                return False
+
+            # Cooled down (or the last probe never reported): probe
+            self.state = self.HALF_OPEN
+            self.probe_at = now
+            return True
+
+    def record(self, ok):
+        now = time.monotonic()
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                if ok:
+                    self.state = self.CLOSED
+                    self.outcomes.clear()
+                    print(f"[BREAKER] {self.name} closed")
+                else:
+                    self._open(now)
+                return
+
+            self.outcomes.append((now, ok))
+            while self.outcomes and self.outcomes[0][0] < now - self.window:
+                self.outcomes.popleft()
+
+            if self.state == self.CLOSED and len(self.outcomes) >= self.min_calls:
+                failures = sum(1 for _, success in self.outcomes if not success)
+                if failures / len(self.outcomes) >= self.error_rate:
+                    self._open(now)
+
+    def record_error(self, error):
+        """
+        Record a failed call. A timeout caused by the request deadline
+        running out is not the provider's fault: it is re-raised as
+        DeadlineExceeded instead.
+        """
+        if isinstance(error, openai.APITimeoutError) and remaining() == 0:
+            raise DeadlineExceeded("Deadline exceeded during provider call") from error
+
+        # Bad requests / quota refusals say nothing about the provider
+        if is_upstream_failure(error):
+            self.record(False)
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.outcomes.clear()
+        print(f"[BREAKER] {self.name} open for {self.cooldown}s")
+
+
+def make_breaker(name):
+    return CircuitBreaker(
+        name,
+        window=settings.LLM_BREAKER_WINDOW,
+        min_calls=settings.LLM_BREAKER_MIN_CALLS,
+        error_rate=settings.LLM_BREAKER_ERROR_RATE,
+        cooldown=settings.LLM_BREAKER_COOLDOWN,
+    )
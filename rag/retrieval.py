@@ -1,5 +1,6 @@
-from django.db.models import Q
-from documents.models import Document
+from documents.access import can_view
+
+from .term_index import load_term_index, search_term_index
 
 
 def retrieve_chunks_for_chat(
@@ -8,10 +9,10 @@ def retrieve_chunks_for_chat(
     question,
     document=None,
     max_chunks=6,
-    chunk_size=800,
 ):
     """
-    In-memory RAG chunking using Document.extracted_text
+    Single-document RAG using the document's precomputed term index
+    (chunk offsets + term postings built at ingest)
     with STRICT access control.
     """
 
@@ -21,37 +22,24 @@ def retrieve_chunks_for_chat(
     if not document:
         return []
 
-    allowed = Document.objects.filter(
-        Q(id=document.id),
-        Q(uploaded_by=user) | Q(is_public=True)
-    ).exists()
-
-    if not allowed:
+    if not can_view(user, document):
         return []  # HARD STOP — prevents leaks
 
     if not document.extracted_text:
         return []
 
     # =========================
-    # 🧠 CHUNKING
+    # 🧠 POSTINGS LOOKUP
     # =========================
-    text = document.extracted_text
-    words = text.split()
-
-    chunks = []
-    start = 0
+    index = load_term_index(document)
+    positions = search_term_index(index, question, limit=max_chunks)
 
-    while start < len(words) and len(chunks) < max_chunks:
-        end = start + chunk_size
-        chunk_text = " ".join(words[start:end])
-
-        # Basic relevance filter
-        if any(w.lower() in chunk_text.lower() for w in question.split()):
-            chunks.append({
-                "text": chunk_text,
-                "document_title": document.title,
-            })
-
-        start = end
+    text = document.extracted_text
 
-    return chunks
+    return [
+        {
+            "text": text[start:end],
+            "document_title": document.title,
+        }
+        for start, end in (index["chunks"][p] for p in positions)
+    ]
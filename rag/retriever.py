@@ -1,8 +1,124 @@
-from django.db.models import Q
-from pgvector.django import L2Distance
+import time
 
-from documents.models import Document, DocumentChunk
-from .embeddings import embed_texts
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Value
+from django.db.models.functions import Cast
+from pgvector.django import BitField, HammingDistance, L2Distance
+
+from accounts.auth_context import auth_context
+from documents.access import filter_viewable, get_accessible_documents
+from documents.models import Document, DocumentChunk, Folder, in_subtrees
+from .bm25 import blend_scores, bm25_scores, load_corpus_statistics, query_terms
+from .embeddings import binary_quantize, embed_texts
+from .mmr import mmr_select
+from .resilience import statement_timeout
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def _accessible_documents(user, document_ids=None, folder_ids=None, public_only=False):
+    """
+    Documents a retrieval call may search (shared by all retrievers),
+    by the same rules as every view (documents.access).
+    """
+    if document_ids:
+        docs_qs = Document.objects.filter(id__in=filter_viewable(user, document_ids))
+    else:
+        docs_qs = get_accessible_documents(user)
+
+    if public_only:
+        docs_qs = docs_qs.filter(is_public=True)
+
+    if folder_ids:
+        # Subfolders included
+        docs_qs = docs_qs.filter(in_subtrees(Folder.objects.filter(id__in=folder_ids)))
+
+    # Limit number of docs searched (scalability); 0 = all
+    if settings.RETRIEVAL_MAX_DOCUMENTS:
+        docs_qs = docs_qs[:settings.RETRIEVAL_MAX_DOCUMENTS]
+    return docs_qs
+
+
+# pgvector's upper bound for hnsw.ef_search
+HNSW_MAX_EF_SEARCH = 1000
+
+
+def _quantized_candidates(query_embedding, chunks, candidates):
+    """
+    Ids of the `candidates` chunks nearest by Hamming distance.
+
+    An HNSW scan returns at most hnsw.ef_search rows (pgvector default:
+    40), so it is raised to the candidate count for this query only.
+    """
+    query_bits = Cast(
+        Value(binary_quantize(query_embedding)),
+        BitField(length=len(query_embedding)),
+    )
+    first_pass = (
+        chunks
+        .annotate(hamming=HammingDistance("embedding_bit", query_bits))
+        .order_by("hamming")
+        .values_list("id", flat=True)[:candidates]
+    )
+
+    # Inside an outer transaction SET LOCAL would outlive the block
+    nested = connection.in_atomic_block
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            ef_search = min(int(candidates), HNSW_MAX_EF_SEARCH)
+            cursor.execute(f"SET LOCAL hnsw.ef_search = {ef_search}")
+        ids = list(first_pass)
+        if nested:
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL hnsw.ef_search = DEFAULT")
+    return ids
+
+
+def search_chunks(
+    query_embedding,
+    limit,
+    documents=None,
+    quantized=False,
+    candidates=None,
+    metrics=None,
+):
+    """
+    Nearest DocumentChunks by exact L2 distance, annotated `distance`.
+
+    With `quantized`, a first pass ranks chunks by Hamming distance on
+    the binary-quantized `embedding_bit` column and only the best
+    `candidates` (default: RETRIEVAL_QUANTIZED_CANDIDATES, at most
+    HNSW_MAX_EF_SEARCH through the index) are rescored with full
+    precision; the first pass runs immediately and the number of ids it
+    returned is written to `metrics["rescored"]`.
+
+    The index returns global neighbours and the `documents` filter
+    applies afterwards, so a narrow scope can leave fewer than `limit`
+    candidates: the search then falls back to exact
+    (`metrics["quantized_fallback"]`).
+    """
+    chunks = DocumentChunk.objects.all()
+    if documents is not None:
+        chunks = chunks.filter(document__in=documents)
+
+    if quantized:
+        candidates = candidates or settings.RETRIEVAL_QUANTIZED_CANDIDATES
+        ids = _quantized_candidates(query_embedding, chunks, max(limit, candidates))
+        fallback = len(ids) < limit
+        if metrics is not None:
+            metrics["rescored"] = len(ids)
+            metrics["quantized_fallback"] = fallback
+        if not fallback:
+            chunks = DocumentChunk.objects.filter(id__in=ids)
+
+    return (
+        chunks
+        .annotate(distance=L2Distance("embedding", query_embedding))
+        .order_by("distance")[:limit]
+    )
 
 
 # =========================================================
@@ -15,54 +131,145 @@ def retrieve_chunks(
     document_ids=None,
     folder_ids=None,
     public_only=False,
+    diversify=None,
+    rerank=None,
+    quantized=None,
+    metrics=None,
+    query_embedding=None,
 ):
     """
     Semantic retrieval using pgvector (PostgreSQL).
 
     Modes:
-    - Context mode: document_ids or folder_ids provided
+    - Context mode: document_ids or folder_ids provided (folders
+      include their subfolders)
     - Global mode: no context provided (auto-search all accessible docs)
+
+    Optional stages:
+    - `quantized` (default: settings.RETRIEVAL_QUANTIZED_SEARCH) runs a
+      binary-quantized Hamming first pass before exact rescoring.
+    - `rerank` (default: settings.RETRIEVAL_BM25_ENABLED) blends a
+      BM25 score over the top RETRIEVAL_RERANK_CANDIDATES with the
+      vector distance.
+    - `diversify` (default: settings.RETRIEVAL_MMR_ENABLED) re-selects
+      k candidates with MMR, dropping near-duplicate passages.
+
+    If a `metrics` dict is passed, per-stage latencies (ms) are
+    written into it. A precomputed `query_embedding` skips the
+    embedding call (the async chat path embeds concurrently).
+    Under a request deadline (rag.resilience) the vector search is
+    cancelled when time runs out.
     """
 
+    if diversify is None:
+        diversify = settings.RETRIEVAL_MMR_ENABLED
+    if rerank is None:
+        rerank = settings.RETRIEVAL_BM25_ENABLED
+    if quantized is None:
+        quantized = settings.RETRIEVAL_QUANTIZED_SEARCH
+    if metrics is None:
+        metrics = {}
+
     # -----------------------------------------------------
     # 🔹 Embed Query
     # -----------------------------------------------------
-    query_embedding = embed_texts([query])[0]
+    if query_embedding is None:
+        started = time.perf_counter()
+        query_embedding = embed_texts([query])[0]
+        metrics["embed_ms"] = _elapsed_ms(started)
 
     # -----------------------------------------------------
     # 🔐 Accessible Documents
     # -----------------------------------------------------
-    docs_qs = Document.objects.filter(
-        Q(is_public=True) | Q(uploaded_by=user)
+    docs_qs = _accessible_documents(
+        user,
+        document_ids=document_ids,
+        folder_ids=folder_ids,
+        public_only=public_only,
     )
 
-    if public_only:
-        docs_qs = docs_qs.filter(is_public=True)
+    # -----------------------------------------------------
+    # 🔍 Vector Similarity Search (Across Chunks)
+    # -----------------------------------------------------
+    fetch_k = k
+    if diversify:
+        fetch_k = max(fetch_k, k * settings.RETRIEVAL_MMR_FETCH_MULTIPLIER)
+    if rerank:
+        fetch_k = max(fetch_k, settings.RETRIEVAL_RERANK_CANDIDATES)
 
-    if document_ids:
-        docs_qs = docs_qs.filter(id__in=document_ids)
+    started = time.perf_counter()
+    with statement_timeout("retrieval"):
+        chunks = list(
+            search_chunks(
+                query_embedding,
+                fetch_k,
+                documents=docs_qs,
+                quantized=quantized,
+                metrics=metrics,
+            ).select_related("document")
+        )
+    metrics["search_ms"] = _elapsed_ms(started)
+    metrics["candidates"] = len(chunks)
 
-    if folder_ids:
-        docs_qs = docs_qs.filter(folder_id__in=folder_ids)
+    relevance = None
+
+    # -----------------------------------------------------
+    # 📚 BM25 Rerank (lexical + vector blend)
+    # -----------------------------------------------------
+    if rerank and len(chunks) > 1:
+        terms = query_terms(query)
+
+        started = time.perf_counter()
+        # The organization documents are scoped to (documents.access)
+        organization_id = auth_context(user).member_organization_id
+        chunk_count, total_tokens, df = load_corpus_statistics(
+            [organization_id, None] if organization_id is not None else [None],
+            terms,
+        )
+        metrics["rerank_stats_ms"] = _elapsed_ms(started)
 
-    # Optional: limit number of docs searched (scalability)
-    docs_qs = docs_qs[:50]
+        started = time.perf_counter()
+        lexical = bm25_scores(
+            terms,
+            [chunk.content for chunk in chunks],
+            chunk_count=chunk_count,
+            total_tokens=total_tokens,
+            document_frequencies=df,
+        )
+        relevance = blend_scores(
+            [chunk.distance for chunk in chunks],
+            lexical,
+            weight=settings.RETRIEVAL_BM25_WEIGHT,
+        )
+        order = sorted(range(len(chunks)), key=lambda i: -relevance[i])
+        chunks = [chunks[i] for i in order]
+        relevance = relevance[order]
+        metrics["rerank_ms"] = _elapsed_ms(started)
 
     # -----------------------------------------------------
-    # 🔍 Vector Similarity Search (Across Chunks)
+    # 🧬 Diversify (MMR + near-duplicate suppression)
     # -----------------------------------------------------
-    chunks = (
-        DocumentChunk.objects
-        .filter(document__in=docs_qs)
-        .annotate(distance=L2Distance("embedding", query_embedding))
-        .order_by("distance")[:k]
-    )
+    if diversify and len(chunks) > 1:
+        started = time.perf_counter()
+        selected = mmr_select(
+            query_embedding,
+            [chunk.embedding for chunk in chunks],
+            k=k,
+            lambda_mult=settings.RETRIEVAL_MMR_LAMBDA,
+            dedup_threshold=settings.RETRIEVAL_DEDUP_THRESHOLD,
+            relevance=relevance,
+        )
+        chunks = [chunks[i] for i in selected]
+        metrics["mmr_ms"] = _elapsed_ms(started)
+
+    chunks = chunks[:k]
 
     # -----------------------------------------------------
     # 🔁 Format Results
     # -----------------------------------------------------
     results = [
         {
+            "chunk_id": chunk.id,
             "text": chunk.content,
             "document_id": chunk.document.id,
             "document_title": chunk.document.display_name,
@@ -74,6 +281,110 @@ def retrieve_chunks(
     return results
 
 
+# =========================================================
+# 🔹 BATCH RETRIEVER (many queries, one round trip)
+# =========================================================
+def retrieve_chunks_many(
+    user,
+    queries,
+    k=5,
+    document_ids=None,
+    folder_ids=None,
+    public_only=False,
+    metrics=None,
+):
+    """
+    Top-k retrieval for many queries at once.
+
+    - One batched embedding call for all queries
+    - Access control evaluated once and shared by every query
+    - One SQL statement: a LATERAL top-k subquery per query
+
+    Returns one result list per query, in input order, using the
+    same result format as retrieve_chunks (no rerank / MMR stage).
+    """
+    if metrics is None:
+        metrics = {}
+
+    queries = list(queries)
+    if not queries:
+        return []
+
+    # -----------------------------------------------------
+    # 🔹 Embed all queries (single provider call)
+    # -----------------------------------------------------
+    started = time.perf_counter()
+    query_embeddings = embed_texts(queries)
+    metrics["embed_ms"] = _elapsed_ms(started)
+
+    # -----------------------------------------------------
+    # 🔐 Shared access control
+    # -----------------------------------------------------
+    started = time.perf_counter()
+    documents = {
+        doc.id: doc
+        for doc in _accessible_documents(
+            user,
+            document_ids=document_ids,
+            folder_ids=folder_ids,
+            public_only=public_only,
+        ).only("id", "title", "file")
+    }
+    metrics["access_ms"] = _elapsed_ms(started)
+
+    results = [[] for _ in queries]
+    if not documents:
+        return results
+
+    # -----------------------------------------------------
+    # 🔍 LATERAL top-k per query
+    # -----------------------------------------------------
+    embedding_field = DocumentChunk._meta.get_field("embedding")
+    vectors = [embedding_field.get_prep_value(e) for e in query_embeddings]
+
+    # MATERIALIZED: parse each query vector once, not once per scanned row
+    sql = f"""
+        WITH q AS MATERIALIZED (
+            SELECT (ord - 1)::int AS position, embedding::vector AS embedding
+            FROM unnest(%s::text[]) WITH ORDINALITY AS u(embedding, ord)
+        )
+        SELECT q.position, c.id, c.document_id, c.content, c.distance
+        FROM q
+        CROSS JOIN LATERAL (
+            SELECT dc.id,
+                   dc.document_id,
+                   dc.content,
+                   dc.embedding <-> q.embedding AS distance
+            FROM {DocumentChunk._meta.db_table} dc
+            WHERE dc.document_id = ANY(%s)
+            ORDER BY dc.embedding <-> q.embedding
+            LIMIT %s
+        ) c
+        ORDER BY q.position, c.distance
+    """
+
+    started = time.perf_counter()
+    with statement_timeout("retrieval"), connection.cursor() as cursor:
+        cursor.execute(sql, [vectors, list(documents), k])
+        rows = cursor.fetchall()
+    metrics["search_ms"] = _elapsed_ms(started)
+
+    # -----------------------------------------------------
+    # 🔁 Format Results
+    # -----------------------------------------------------
+    for position, chunk_id, document_id, content, distance in rows:
+        document = documents[document_id]
+        results[position].append({
+            "chunk_id": chunk_id,
+            "text": content,
+            "document_id": document.id,
+            "document_title": document.display_name,
+            "score": float(distance),  # Lower = better
+        })
+
+    return results
+
+
 # =========================================================
 # 🔹 TEXT-ONLY HELPER
 # =========================================================
@@ -82,4 +393,4 @@ def retrieve_chunk_texts(**kwargs):
     Returns only chunk text.
     Useful for simple RAG pipelines.
     """
-    return [r["text"] for r in retrieve_chunks(**kwargs)]
\ No newline at end of file
+    return [r["text"] for r in retrieve_chunks(**kwargs)]
@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from documents.models import Document, DocumentChunk
+from rag.answer_cache import invalidate_document
+from rag.faiss_utils import delete_index
+from rag.models import DocumentTermIndex
+from rag.term_index import uncount_from_corpus
+
+
+# ============================
+# 🧹 DROP PER-DOCUMENT INDEX
+# ============================
+
+@receiver(post_delete, sender=Document)
+def drop_document_index(sender, instance, **kwargs):
+    """
+    Remove the `doc_{id}` FAISS namespace once the Document is gone.
+    Shared namespaces are rebuilt later by `compact_indexes`.
+    """
+    index_name = f"doc_{instance.id}"
+
+    def _drop():
+        reclaimed = delete_index(index_name)
+        if reclaimed:
+            print(f"[INDEX GC] '{index_name}' removed ({reclaimed} bytes)")
+
+    transaction.on_commit(_drop)
+
+
+# ============================
+# 📊 BM25 CORPUS STATISTICS
+# ============================
+
+@receiver(post_delete, sender=DocumentTermIndex)
+def remove_document_statistics(sender, instance, **kwargs):
+    """
+    Subtract what the deleted document (its term index cascades with
+    it) contributed to its corpus statistics, if it was counted.
+    """
+    uncount_from_corpus(instance)
+
+
+# ============================
+# 💾 ANSWER CACHE INVALIDATION
+# ============================
+
+@receiver(post_save, sender=Document)
+@receiver(pre_delete, sender=Document)
+def invalidate_document_answers(sender, instance, **kwargs):
+    """
+    Cached answers built from a changed (or deleted) document are stale.
+    pre_delete: the cache's document links cascade away with the row.
+    """
+    invalidate_document(instance.id)
+
+
+@receiver(post_save, sender=DocumentChunk)
+def invalidate_chunk_answers(sender, instance, **kwargs):
+    invalidate_document(instance.document_id)
@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import json
+import math
+import threading
+import time
+import weakref
+from collections import Counter
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from . import resilience
+
+
+# =========================================================
+# 🛬 SINGLE-FLIGHT REQUEST COALESCING
+# =========================================================
+#
+# Identical upstream calls that are in flight at the same time (a team
+# asking the same starter question together) share one call:
+#
+#   do(key, fn)            threads in this process
+#   ado(key, fn)           tasks on this event loop (ASGI)
+#   astream(key, fn)       async streams: followers replay the leader's
+#                          deltas as they arrive
+#
+# Keys hash the exact provider payload (payload_key). With
+# SINGLE_FLIGHT_CACHE set to a shared cache alias (Redis, database
+# cache, ...), do()/ado() also coalesce across processes: one process
+# holds a lock key while it calls, the others wait for its result.
+#
+# Counters (stats()): "<kind>.calls" went upstream, "<kind>.coalesced"
+# were served by another caller's call.
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(kind, outcome):
+    with _stats_lock:
+        _stats[f"{kind}.{outcome}"] += 1
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def payload_key(kind, payload):
+    """
+    Stable key for an upstream request: kind + sha256 of the JSON payload.
+    """
+    body = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return f"{kind}:{hashlib.sha256(body.encode()).hexdigest()}"
+
+
+def _kind(key):
+    return key.split(":", 1)[0]
+
+
+def _log_coalesced(key, waiting):
+    print(f"[SINGLE FLIGHT] coalesced {_kind(key)} ({waiting} waiting)")
+
+
+def _wait_limit():
+    """
+    Seconds a follower may wait for another caller's result: the
+    request deadline (rag.resilience) or SINGLE_FLIGHT_TIMEOUT.
+    """
+    left = resilience.remaining()
+    timeout = settings.SINGLE_FLIGHT_TIMEOUT
+    return timeout if left is None else min(left, timeout)
+
+
+# =========================
+# THREADS
+# =========================
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiting = 0
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def do(key, fn):
+    """
+    fn() once per key among concurrent callers; all get its result
+    (or its exception). A follower waits at most _wait_limit(): past
+    the request deadline it raises DeadlineExceeded, past
+    SINGLE_FLIGHT_TIMEOUT it calls fn() itself.
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return fn()
+
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+        else:
+            call.waiting += 1
+
+    if not leader:
+        _count(_kind(key), "coalesced")
+        _log_coalesced(key, call.waiting)
+        if not call.done.wait(_wait_limit()):
+            resilience.check(f"coalesced {_kind(key)}")
+            _count(_kind(key), "calls")
+            return fn()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _shared(key, fn)
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+
+
+# =========================
+# ASYNC (per event loop)
+# =========================
+_async_calls = weakref.WeakKeyDictionary()
+
+
+def _loop_calls():
+    loop = asyncio.get_running_loop()
+    return _async_calls.setdefault(loop, {})
+
+
+def _forget(calls, key, call):
+    if calls.get(key) is call:
+        del calls[key]
+
+
+async def ado(key, fn):
+    """
+    Async do(): `fn` is an async callable. The call runs as its own
+    task, so a caller that goes away doesn't cancel it for the others.
+    Followers wait at most _wait_limit(), as in do().
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await fn()
+
+    calls = _loop_calls()
+    task = calls.get(key)
+
+    if task is None:
+        task = calls[key] = asyncio.get_running_loop().create_task(_ashared(key, fn))
+        task.add_done_callback(lambda t: _forget(calls, key, t))
+        # Retrieve the exception even if every caller went away
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task)
+
+    _count(_kind(key), "coalesced")
+    _log_coalesced(key, "async")
+
+    # Followers wait as long as do()'s
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), _wait_limit())
+    except asyncio.TimeoutError:
+        resilience.check(f"coalesced {_kind(key)}")
+        _count(_kind(key), "calls")
+        return await fn()
+
+
+class _SharedStream:
+    """
+    Deltas of one upstream stream, pumped by a task and replayed to
+    every subscriber. The task is cancelled once no one is listening.
+    """
+
+    def __init__(self, key, fn):
+        self.key = key
+        self.parts = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task = asyncio.get_running_loop().create_task(self._pump(fn))
+
+    async def _pump(self, fn):
+        try:
+            async for delta in fn():
+                async with self.changed:
+                    self.parts.append(delta)
+                    self.changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Shared stream abandoned")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            _forget(_loop_calls(), self.key, self)
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def subscribe(self):
+        self.subscribers += 1
+        sent = 0
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(
+                        lambda: len(self.parts) > sent or self.done
+                    )
+                    pending = self.parts[sent:]
+
+                for delta in pending:
+                    yield delta
+                sent += len(pending)
+
+                if self.done and sent == len(self.parts):
+                    break
+
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                self.task.cancel()
+
+
+async def astream(key, fn):
+    """
+    Async generator of `fn()`'s deltas, shared by concurrent callers
+    with the same key. Late joiners first receive what was already
+    streamed.
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        async for delta in fn():
+            yield delta
+        return
+
+    calls = _loop_calls()
+    stream = calls.get(key)
+
+    if stream is None:
+        _count(_kind(key), "calls")
+        stream = calls[key] = _SharedStream(key, fn)
+    else:
+        _count(_kind(key), "coalesced")
+        _log_coalesced(key, stream.subscribers)
+
+    async for delta in stream.subscribe():
+        yield delta
+
+
+# =========================
+# ACROSS PROCESSES (shared cache)
+# =========================
+def _cache():
+    alias = settings.SINGLE_FLIGHT_CACHE
+    return caches[alias] if alias else None
+
+
+def _shared(key, fn):
+    """
+    fn() unless another process is already computing `key`; then wait
+    for its result (up to SINGLE_FLIGHT_TIMEOUT, else compute locally).
+    """
+    cache = _cache()
+    if cache is None:
+        _count(_kind(key), "calls")
+        return fn()
+
+    lock_key, result_key = f"sf:lock:{key}", f"sf:result:{key}"
+    timeout = settings.SINGLE_FLIGHT_TIMEOUT
+
+    locked = cache.add(lock_key, 1, timeout)
+    if not locked:
+        deadline = time.monotonic() + _wait_limit()
+        while time.monotonic() < deadline:
+            # Lock first: the holder publishes before it unlocks
+            held = cache.get(lock_key) is not None
+            hit = cache.get(result_key)
+            if hit is not None:
+                _count(_kind(key), "coalesced")
+                _log_coalesced(key, "cross-process")
+                return hit[0]
+            if not held:
+                break  # holder failed or finished without publishing
+            time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+    _count(_kind(key), "calls")
+    try:
+        result = fn()
+        if locked:
+            # Kept just long enough for waiters to pick it up; Redis and
+            # Memcached backends truncate timeouts to whole seconds
+            cache.set(
+                result_key,
+                (result,),
+                max(1, math.ceil(settings.SINGLE_FLIGHT_POLL_INTERVAL * 10)),
+            )
+        return result
+    finally:
+        # Never drop a lock another process holds
+        if locked:
+            cache.delete(lock_key)
+
+
+async def _ashared(key, fn):
+    if _cache() is None:
+        _count(_kind(key), "calls")
+        return await fn()
+
+    # Cache clients are sync: hold the cross-process wait in a thread,
+    # but run the call itself on the loop.
+    return await sync_to_async(_shared, thread_sensitive=False)(
+        key, async_to_sync(fn)
+    )
@@ -0,0 +1,163 @@
+import math
+from collections import OrderedDict
+
+from django.db import transaction
+
+from .bm25 import (
+    apply_corpus_statistics,
+    corpus_statistics_id,
+    query_terms,
+    tokenize,
+)
+from .chunking import iter_chunks
+from .models import DocumentTermIndex
+
+
+# Parsed indexes kept per process: document_id → (built_at, index)
+_CACHE = OrderedDict()
+_CACHE_SIZE = 64
+
+
+# =========================================================
+# 🏗 BUILD (INGEST TIME)
+# =========================================================
+@transaction.atomic
+def build_term_index(document, spans=None):
+    """
+    Chunk a document once and store chunk offsets plus a
+    term → chunk postings map.
+    `spans` may be passed in when the caller already chunked the text.
+
+    A previous index counted in the BM25 corpus is subtracted first;
+    the new one is counted by count_in_corpus once indexing succeeds.
+    """
+    if spans is None:
+        spans = list(iter_chunks(document.extracted_text or ""))
+
+    postings = {}
+    for i, span in enumerate(spans):
+        for term in set(tokenize(span["text"])):
+            postings.setdefault(term, []).append(i)
+
+    previous = DocumentTermIndex.objects.filter(document=document).first()
+    if previous is not None:
+        uncount_from_corpus(previous)
+
+    term_index, _ = DocumentTermIndex.objects.update_or_create(
+        document=document,
+        defaults={
+            "chunks": [[span["start"], span["end"]] for span in spans],
+            "postings": postings,
+            "total_tokens": sum(len(span["text"].split()) for span in spans),
+            "counted_in": None,
+        },
+    )
+    return term_index
+
+
+def load_term_index(document):
+    """
+    Parsed term index for a document, cached per process and
+    rebuilt lazily for documents ingested before it existed.
+    """
+    built_at = (
+        DocumentTermIndex.objects
+        .filter(document_id=document.id)
+        .values_list("built_at", flat=True)
+        .first()
+    )
+
+    cached = _CACHE.get(document.id)
+    if cached and built_at is not None and cached[0] == built_at:
+        _CACHE.move_to_end(document.id)
+        return cached[1]
+
+    if built_at is None:
+        term_index = build_term_index(document)
+    else:
+        term_index = DocumentTermIndex.objects.get(document_id=document.id)
+
+    index = {
+        "chunks": term_index.chunks,
+        "postings": term_index.postings,
+    }
+
+    _CACHE[document.id] = (term_index.built_at, index)
+    if len(_CACHE) > _CACHE_SIZE:
+        _CACHE.popitem(last=False)
+
+    return index
+
+
+# =========================================================
+# 📊 BM25 CORPUS CONTRIBUTION
+# =========================================================
+def _contribution(term_index):
+    """
+    What the document's chunks add to CorpusStatistics: the postings
+    hold, per term, the chunks containing it (its chunk frequency).
+    """
+    return {
+        "chunk_count": len(term_index.chunks),
+        "total_tokens": term_index.total_tokens,
+        "document_frequencies": {
+            term: len(positions) for term, positions in term_index.postings.items()
+        },
+    }
+
+
+def count_in_corpus(term_index, organization):
+    """
+    Add an indexed document to the organization's BM25 statistics
+    (organization=None: the global public corpus) and record where.
+    """
+    if term_index.counted_in_id is not None or not term_index.chunks:
+        return
+
+    stats_id = corpus_statistics_id(organization)
+    apply_corpus_statistics(stats_id, **_contribution(term_index))
+
+    term_index.counted_in_id = stats_id
+    term_index.save(update_fields=["counted_in"])
+
+
+def uncount_from_corpus(term_index):
+    """
+    Subtract exactly what count_in_corpus added (deletes, re-indexing).
+    """
+    if term_index.counted_in_id is None:
+        return
+
+    apply_corpus_statistics(
+        term_index.counted_in_id,
+        sign=-1,
+        **_contribution(term_index),
+    )
+    term_index.counted_in_id = None
+
+
+# =========================================================
+# 🔎 QUERY
+# =========================================================
+def search_term_index(index, question, limit=6):
+    """
+    Rank chunks by the query terms they contain.
+    Chunks matching more (and rarer) terms come first.
+    Returns chunk positions, best first.
+    """
+    postings = index["postings"]
+    chunk_count = len(index["chunks"])
+    if not chunk_count:
+        return []
+
+    scores = {}
+    for term in query_terms(question):
+        hits = postings.get(term)
+        if not hits:
+            continue
+
+        idf = math.log(1 + chunk_count / len(hits))
+        for position in hits:
+            scores[position] = scores.get(position, 0.0) + idf
+
+    return sorted(scores, key=lambda p: (-scores[p], p))[:limit]
@@ -1,3 +1,749 @@
-from django.test import TestCase
+import importlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+import openai
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import Organization, OrganizationMember
+from accounts.services.token_estimator import get_model_encoding
+from documents.models import Document, DocumentChunk
+from rag.bm25 import update_corpus_statistics
+from rag import resilience, singleflight
+from rag.chunking import get_encoding, iter_chunks
+from rag.citations import build_citations, resolve_citations, save_citations
+from rag.context import SOURCE_OVERHEAD_TOKENS, context_budget, pack_context
+from rag.embeddings import local_embed_texts
+from rag.management.commands.fake_openai_server import FakeOpenAIHandler
+from rag.mmr import mmr_select
+from rag.resilience import CircuitBreaker, DeadlineExceeded, LatencyTracker, deadline
+from rag.models import (
+    ChatMessage,
+    ChatSession,
+    Citation,
+    CorpusStatistics,
+    DocumentTermIndex,
+)
+from rag.term_index import (
+    build_term_index,
+    count_in_corpus,
+    load_term_index,
+    search_term_index,
+)
+from rag.views import _answer_events
+
+
+# Document.save() builds a PostgreSQL search vector
+postgresql_only = skipUnless(connection.vendor == "postgresql", "needs PostgreSQL")
+
+
+def _spans(*texts):
+    spans, start = [], 0
+    for text in texts:
+        spans.append({"text": text, "start": start, "end": start + len(text)})
+        start += len(text) + 2
+    return spans
+
+
+class MMRSelectTests(SimpleTestCase):
+    query = [1.0, 0.0, 0.0]
+
+    def test_near_duplicates_are_dropped(self):
+        candidates = [
+            [1.0, 0.0, 0.0],
+            [0.999, 0.01, 0.0],  # duplicate of the first
+            [0.6, 0.8, 0.0],
+        ]
+        self.assertEqual(
+            mmr_select(self.query, candidates, k=3, dedup_threshold=0.95),
+            [0, 2],
+        )
+
+    def test_lambda_one_is_relevance_order(self):
+        candidates = [[0.2, 1.0, 0.0], [1.0, 0.1, 0.0], [0.7, 0.7, 0.0]]
+        self.assertEqual(
+            mmr_select(self.query, candidates, k=3, lambda_mult=1.0, dedup_threshold=1.1),
+            [1, 2, 0],
+        )
+
+    def test_diversity_beats_a_close_second(self):
+        candidates = [
+            [1.0, 0.1, 0.0],
+            [1.0, 0.35, 0.0],  # more relevant, but close to the first
+            [1.0, -0.1, 0.5],
+        ]
+        self.assertEqual(
+            mmr_select(self.query, candidates, k=2, lambda_mult=1.0, dedup_threshold=1.1),
+            [0, 1],
+        )
+        self.assertEqual(
+            mmr_select(self.query, candidates, k=2, lambda_mult=0.5, dedup_threshold=1.1),
+            [0, 2],
+        )
+
+    def test_relevance_overrides_query_similarity(self):
+        candidates = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+        self.assertEqual(
+            mmr_select(self.query, candidates, k=1, relevance=[0.1, 0.9]),
+            [1],
+        )
+
+    def test_empty_input(self):
+        self.assertEqual(mmr_select(self.query, [], k=3), [])
+        self.assertEqual(mmr_select(self.query, [[1.0, 0.0, 0.0]], k=0), [])
+
+
+@postgresql_only
+class CorpusContributionTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Corpus")
+        # Another document's chunks, already in the corpus
+        update_corpus_statistics(
+            organization=self.org,
+            text_chunks=["alpha beta", "gamma"],
+        )
+        user = User.objects.create_user("corpus@example.com", "corpus@example.com", "pw")
+        self.document = Document.objects.create(
+            uploaded_by=user,
+            organization=self.org,
+            file="documents/corpus.txt",
+            extracted_text="alpha delta\n\nalpha",
+        )
+
+    def stats(self):
+        stats = CorpusStatistics.objects.get(organization=self.org)
+        return stats.chunk_count, stats.total_tokens, stats.document_frequencies
+
+    def index(self):
+        term_index = build_term_index(self.document, spans=_spans("alpha delta", "alpha"))
+        count_in_corpus(term_index, self.org)
+        return term_index
+
+    def test_index_adds_its_chunks(self):
+        self.index()
+        self.assertEqual(
+            self.stats(),
+            (4, 6, {"alpha": 3, "beta": 1, "gamma": 1, "delta": 1}),
+        )
+
+    def test_reindex_replaces_the_contribution(self):
+        self.index()
+        self.index()
+        self.assertEqual(self.stats()[:2], (4, 6))
+        self.assertEqual(self.stats()[2]["alpha"], 3)
+
+    def test_delete_subtracts_exactly_the_contribution(self):
+        self.index()
+        self.document.delete()
+        self.assertEqual(self.stats(), (2, 3, {"alpha": 1, "beta": 1, "gamma": 1}))
+
+    def test_uncounted_document_leaves_statistics_alone(self):
+        # Indexing stopped before the corpus was updated
+        build_term_index(self.document, spans=_spans("alpha delta", "alpha"))
+        self.document.delete()
+        self.assertEqual(self.stats(), (2, 3, {"alpha": 1, "beta": 1, "gamma": 1}))
+
+
+class IterChunksTests(SimpleTestCase):
+    def sample(self, clauses=60):
+        sections = []
+        for number in range(1, 7):
+            sentences = " ".join(
+                f"Clause {number}.{i} sets the fee for item {i} at {i * 10} units."
+                for i in range(1, clauses)
+            )
+            sections.append(f"Section {number}\n\n{sentences}\n")
+        return "\n".join(sections)
+
+    def test_offsets_point_into_the_text(self):
+        text = self.sample()
+        for chunk in iter_chunks(text):
+            self.assertEqual(text[chunk["start"]:chunk["end"]], chunk["text"])
+
+    def test_chunks_stay_within_the_token_cap(self):
+        encoding = get_encoding()
+        chunks = list(iter_chunks(self.sample()))
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(chunk["tokens"], 512)
+            # Per-unit counts may differ from the whole by a token or two
+            self.assertLessEqual(len(encoding.encode_ordinary(chunk["text"])), 512 + 2)
+
+    def test_overlong_sentence_is_split_on_tokens(self):
+        text = "word " * 2000
+        chunks = list(iter_chunks(text, max_tokens=100, overlap_tokens=0))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk["tokens"] <= 100 for chunk in chunks))
+        self.assertEqual(" ".join(c["text"] for c in chunks).split(), text.split())
+
+    def test_sections_start_new_chunks(self):
+        # Sections between half the cap and the cap: one chunk each
+        chunks = list(iter_chunks(self.sample(clauses=25)))
+        self.assertEqual(
+            [c["text"].split("\n")[0] for c in chunks],
+            [f"Section {number}" for number in range(1, 7)],
+        )
+
+    def test_empty_text(self):
+        self.assertEqual(list(iter_chunks("")), [])
+
+
+class SearchTermIndexTests(SimpleTestCase):
+    index = {
+        "chunks": [[0, 10], [12, 20], [22, 30], [32, 40]],
+        "postings": {
+            "fee": [0, 1, 2],
+            "licence": [1],
+            "bank": [2, 3],
+        },
+    }
+
+    def test_rarer_and_more_terms_rank_first(self):
+        self.assertEqual(
+            search_term_index(self.index, "What is the licence fee of a bank?"),
+            [1, 2, 3, 0],
+        )
+
+    def test_limit_and_misses(self):
+        self.assertEqual(search_term_index(self.index, "bank fee", limit=1), [2])
+        self.assertEqual(search_term_index(self.index, "the unknown"), [])
+
+
+@postgresql_only
+class TermIndexTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("terms@example.com", "terms@example.com", "pw")
+        self.document = Document.objects.create(
+            uploaded_by=user,
+            file="documents/terms.txt",
+            extracted_text="The fee is due.\n\nThe bank pays the fee twice: fee.",
+        )
+
+    def test_postings_list_each_chunk_once(self):
+        term_index = build_term_index(
+            self.document,
+            spans=_spans("The fee is due.", "The bank pays the fee twice: fee."),
+        )
+        self.assertEqual(term_index.chunks, [[0, 15], [17, 50]])
+        self.assertEqual(term_index.postings["fee"], [0, 1])
+        self.assertEqual(term_index.postings["bank"], [1])
+        self.assertEqual(term_index.total_tokens, 11)
+
+    def test_missing_index_is_built_on_load(self):
+        index = load_term_index(self.document)
+        text = self.document.extracted_text
+
+        self.assertTrue(DocumentTermIndex.objects.filter(document=self.document).exists())
+        self.assertEqual(
+            [text[start:end] for start, end in index["chunks"]],
+            [text],
+        )
+        self.assertEqual(index["postings"]["fee"], [0])
+
+
+class _QuietFakeOpenAI(FakeOpenAIHandler):
+    token_delay = 0
+    stats = Counter()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class _FakeOpenAIServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Streams the app stops reading end in a broken pipe
+        pass
+
+
+def _events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+@postgresql_only
+class ChatStreamTests(TestCase):
+    """
+    The SSE chat endpoint end to end, against fake_openai_server.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        server = _FakeOpenAIServer(("127.0.0.1", 0), _QuietFakeOpenAI)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(server.server_close)
+        cls.addClassCleanup(server.shutdown)
+
+        provider = override_settings(
+            LLM_PROVIDERS={
+                "default": {
+                    "MODEL": "gpt-4o-mini",
+                    "BASE_URL": f"http://127.0.0.1:{server.server_port}/v1",
+                    "API_KEY": "test",
+                    "TIMEOUT": 10,
+                    "MAX_RETRIES": 0,
+                    "STREAMING": True,
+                },
+            },
+            ANSWER_CACHE_ENABLED=False,
+        )
+        provider.enable()
+        cls.addClassCleanup(provider.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        self.org = Organization.objects.create(name="Stream")
+        self.user = User.objects.create_user("stream@example.com", "stream@example.com", "pw")
+        profile = self.user.profile
+        profile.organization = self.org
+        profile.save()
+        OrganizationMember.objects.create(user=self.user, organization=self.org)
+
+        text = "The licence fee for a bank is 500 units per year."
+        document = Document.objects.create(
+            uploaded_by=self.user,
+            organization=self.org,
+            file="documents/fees.txt",
+            title="Fees",
+            extracted_text=text,
+        )
+        DocumentChunk.objects.create(
+            document=document,
+            content=text,
+            embedding=local_embed_texts([text])[0],
+        )
+
+        self.session = ChatSession.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.async_client.cookies = self.client.cookies
+
+    async def test_events_arrive_in_order(self):
+        response = await self.async_client.post(
+            reverse("chat_stream", args=[self.session.id]),
+            {"query": "What is the licence fee for a bank?"},
+            secure=True,
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        body = b"".join([part async for part in response.streaming_content]).decode()
+        events = _events(body)
+        kinds = [kind for kind, _ in events]
+
+        self.assertEqual(kinds[0], "sources")
+        self.assertEqual(events[0][1]["documents"][0]["title"], "Fees")
+        self.assertEqual(kinds[-1], "done")
+        self.assertGreater(len(kinds), 2)
+        self.assertEqual(set(kinds[1:-1]), {"token"})
+
+        answer = "".join(data["delta"] for kind, data in events if kind == "token")
+        self.assertIn("Stand-in answer to: What is the licence fee for a bank?", answer)
+
+        message = await ChatMessage.objects.aget(pk=events[-1][1]["message_id"])
+        self.assertEqual(message.role, "assistant")
+        self.assertEqual(message.session_id, self.session.id)
+
+    async def test_disconnect_saves_the_partial_answer(self):
+        events = _answer_events(
+            self.session,
+            "What is the licence fee for a bank?",
+            user=self.user,
+            query_embedding=None,
+            active_document=None,
+            active_folder=None,
+            restrict_rag=False,
+            organization=self.org,
+            metrics={},
+            expires=time.monotonic() + 30,
+        )
+
+        self.assertTrue((await anext(events)).startswith("event: sources"))
+        first_token = await anext(events)
+        self.assertTrue(first_token.startswith("event: token"))
+
+        # The client goes away: the server closes the stream
+        await events.aclose()
+
+        messages = [
+            message
+            async for message in ChatMessage.objects.filter(
+                session=self.session, role="assistant"
+            )
+        ]
+        self.assertEqual(len(messages), 1)
+        # Saved with what was streamed so far
+        self.assertNotIn("Stand-in answer", messages[0].content)
+
+
+class PackContextTests(SimpleTestCase):
+    model = "gpt-4o-mini"
+
+    def sentences(self, count, word="fee"):
+        return " ".join(f"The {word} for item {i} is {i} units." for i in range(count))
+
+    def tokens(self, text):
+        return len(get_model_encoding(self.model).encode_ordinary(text))
+
+    def test_everything_fits(self):
+        chunks = [{"text": self.sentences(3), "id": 1}, {"text": self.sentences(2), "id": 2}]
+        metrics = {}
+        packed = pack_context(chunks, model=self.model, budget=1000, metrics=metrics)
+
+        self.assertEqual([c["id"] for c in packed], [1, 2])
+        self.assertEqual(packed[0]["tokens"], self.tokens(chunks[0]["text"]))
+        self.assertEqual(metrics["context"]["trimmed"] + metrics["context"]["dropped"], 0)
+        self.assertLessEqual(metrics["context"]["tokens"], 1000)
+
+    def test_overflow_is_trimmed_to_whole_sentences(self):
+        text = self.sentences(40)
+        budget = self.tokens(text) // 2
+        metrics = {}
+        packed = pack_context([{"text": text}], model=self.model, budget=budget, metrics=metrics)
+
+        self.assertEqual(metrics["context"]["trimmed"], 1)
+        self.assertTrue(text.startswith(packed[0]["text"]))
+        self.assertTrue(packed[0]["text"].endswith("units."))
+        self.assertLessEqual(packed[0]["tokens"] + SOURCE_OVERHEAD_TOKENS, budget)
+
+    def test_no_room_drops_but_later_short_chunks_fit(self):
+        long, short = self.sentences(60), "Short fact."
+        budget = self.tokens(self.sentences(20)) + 2 * SOURCE_OVERHEAD_TOKENS + 10
+        chunks = [{"text": self.sentences(20), "id": 1}, {"text": long, "id": 2}, {"text": short, "id": 3}]
+        metrics = {}
+        packed = pack_context(chunks, model=self.model, budget=budget, metrics=metrics)
+
+        self.assertEqual([c["id"] for c in packed], [1, 3])
+        self.assertEqual(metrics["context"]["dropped"], 1)
+
+    def test_budget_reserves_the_answer(self):
+        with override_settings(
+            MODEL_CONTEXT_WINDOWS={"small": 3000},
+            CONTEXT_SOURCE_TOKENS=4000,
+            CONTEXT_ANSWER_TOKENS=1500,
+        ):
+            self.assertEqual(context_budget("small", prompt_tokens=500), 1000)
+            self.assertEqual(context_budget("small", prompt_tokens=2000), 0)
+
+
+class WholeSecondFileCache(FileBasedCache):
+    """
+    File cache that truncates timeouts to whole seconds, as the Redis
+    and Memcached backends do.
+    """
+
+    def get_backend_timeout(self, timeout=DEFAULT_TIMEOUT):
+        if timeout not in (DEFAULT_TIMEOUT, None):
+            timeout = int(timeout)
+        return super().get_backend_timeout(timeout)
+
+
+class SingleFlightTests(SimpleTestCase):
+    key = "completion:test"
+
+    def shared_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        return override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "singleflight": {
+                    "BACKEND": "rag.tests.WholeSecondFileCache",
+                    "LOCATION": location,
+                },
+            },
+            SINGLE_FLIGHT_CACHE="singleflight",
+        )
+
+    def in_thread(self, target):
+        result = {}
+        thread = threading.Thread(target=lambda: result.setdefault("value", target()))
+        thread.start()
+        return thread, result
+
+    def test_cross_process_waiter_gets_the_leaders_result(self):
+        started, release = threading.Event(), threading.Event()
+        waiter_calls = []
+
+        def leader():
+            started.set()
+            release.wait(5)
+            return "leader"
+
+        def waiter():
+            waiter_calls.append(1)
+            return "waiter"
+
+        with self.shared_cache():
+            # _shared is the cross-process layer: each thread acts as
+            # its own process
+            leading, leader_result = self.in_thread(lambda: singleflight._shared(self.key, leader))
+            started.wait(5)
+            waiting, waiter_result = self.in_thread(lambda: singleflight._shared(self.key, waiter))
+            time.sleep(0.2)
+            release.set()
+            leading.join(5)
+            waiting.join(5)
+
+        self.assertEqual(leader_result["value"], "leader")
+        self.assertEqual(waiter_result["value"], "leader")
+        self.assertEqual(waiter_calls, [])
+
+    def test_waiter_giving_up_keeps_the_holders_lock(self):
+        with self.shared_cache():
+            cache = caches["singleflight"]
+            # Held by another process
+            cache.add(f"sf:lock:{self.key}", 1, 60)
+
+            with deadline(0.2):
+                self.assertEqual(singleflight._shared(self.key, lambda: "own"), "own")
+
+            self.assertIsNotNone(cache.get(f"sf:lock:{self.key}"))
+
+    def test_follower_wait_is_bounded_by_the_deadline(self):
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return "leader"
+
+        leading, _ = self.in_thread(lambda: singleflight.do(self.key, slow))
+        self.addCleanup(leading.join, 5)
+        self.addCleanup(release.set)
+        while self.key not in singleflight._calls:
+            time.sleep(0.01)
+
+        started = time.monotonic()
+        with deadline(0.2), self.assertRaises(DeadlineExceeded):
+            singleflight.do(self.key, lambda: "follower")
+        self.assertLess(time.monotonic() - started, 2)
+
+
+@override_settings(EMBEDDING_HEDGE_MIN_SAMPLES=1, EMBEDDING_HEDGE_MIN_DELAY=0.05)
+class HedgedTests(SimpleTestCase):
+    def setUp(self):
+        self.tracker = LatencyTracker()
+        self.tracker.add(0.01)  # hedge after EMBEDDING_HEDGE_MIN_DELAY
+        self.calls = []
+
+    def slots(self, free):
+        slots = threading.BoundedSemaphore(1)
+        if not free:
+            slots.acquire()
+        return mock.patch.object(resilience, "_hedge_slots", slots)
+
+    def slow(self):
+        self.calls.append(threading.current_thread())
+        time.sleep(0.2)
+        return "vector"
+
+    def test_busy_pool_runs_the_call_unhedged(self):
+        with self.slots(free=False):
+            self.assertEqual(resilience.hedged(self.slow, tracker=self.tracker), "vector")
+        self.assertEqual(self.calls, [threading.current_thread()])
+
+    def test_no_second_attempt_without_a_free_worker(self):
+        with self.slots(free=True):
+            self.assertEqual(resilience.hedged(self.slow, tracker=self.tracker), "vector")
+        self.assertEqual(len(self.calls), 1)
+        self.assertIsNot(self.calls[0], threading.current_thread())
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch("rag.resilience.time.monotonic", side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.breaker = CircuitBreaker(
+            "test", window=30, min_calls=4, error_rate=0.5, cooldown=10
+        )
+
+    def trip(self):
+        for ok in (True, True, False, False):
+            self.breaker.record(ok)
+
+    def test_opens_at_the_error_rate(self):
+        for ok in (True, True, False):
+            self.breaker.record(ok)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)  # below min_calls
+
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_old_outcomes_leave_the_window(self):
+        for _ in range(3):
+            self.breaker.record(False)
+        self.now += 31
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_one_probe_per_cooldown(self):
+        self.trip()
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        # The probe never reported: another one after the cooldown
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_success_closes(self):
+        self.trip()
+        self.now += 10
+        self.breaker.allow()
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_failure_reopens(self):
+        self.trip()
+        self.now += 10
+        self.breaker.allow()
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now += 5
+        self.assertFalse(self.breaker.allow())
+
+    def test_only_upstream_failures_count(self):
+        request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+        bad_request = openai.BadRequestError(
+            "bad", response=httpx.Response(400, request=request), body=None
+        )
+        for _ in range(4):
+            self.breaker.record_error(bad_request)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        for _ in range(4):
+            self.breaker.record_error(openai.APIConnectionError(request=request))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_timeout_after_the_deadline_is_not_counted(self):
+        request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+        with deadline(until=self.now), self.assertRaises(DeadlineExceeded):
+            self.breaker.record_error(openai.APITimeoutError(request=request))
+        self.assertEqual(len(self.breaker.outcomes), 0)
+
+
+@postgresql_only
+class CitationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("cite@example.com", "cite@example.com", "pw")
+        self.document = Document.objects.create(
+            uploaded_by=user,
+            file="documents/cite.txt",
+            extracted_text="The fee is due in March.",
+        )
+        self.chunk = DocumentChunk.objects.create(
+            document=self.document,
+            content="The fee is due in March.",
+            embedding=[0.0] * 1536,
+        )
+        session = ChatSession.objects.create(user=user)
+        self.message = ChatMessage.objects.create(
+            session=session, role="assistant", content="In March."
+        )
+
+    def retrieved(self):
+        return [
+            {
+                "chunk_id": self.chunk.id,
+                "document_id": self.document.id,
+                "text": self.chunk.content,
+                "score": 0.9,
+            },
+            {"document_id": self.document.id, "text": "Summary of the fee schedule."},
+        ]
+
+    def test_build_references_chunks_and_keeps_other_texts(self):
+        first, second = build_citations(self.message, self.retrieved())
+
+        self.assertEqual(
+            (first.chunk_id, first.rank, first.start, first.end, first.excerpt),
+            (self.chunk.id, 0, 0, 24, ""),
+        )
+        self.assertEqual(
+            (second.chunk_id, second.rank, second.excerpt),
+            (None, 1, "Summary of the fee schedule."),
+        )
+
+    def test_resolve_loads_texts_in_one_query(self):
+        save_citations(self.message, self.retrieved())
+        citations = list(self.message.citations.order_by("rank"))
+        citations[0].start, citations[0].end = 4, 7
+
+        with self.assertNumQueries(1):
+            resolve_citations(citations)
+        self.assertEqual(
+            [c.text for c in citations], ["fee", "Summary of the fee schedule."]
+        )
+
+
+@postgresql_only
+class BackfillCitationsTests(TestCase):
+    migration = importlib.import_module("rag.migrations.0008_backfill_citations")
+
+    def setUp(self):
+        user = User.objects.create_user("backfill@example.com", "backfill@example.com", "pw")
+        self.document = Document.objects.create(
+            uploaded_by=user,
+            file="documents/backfill.txt",
+            extracted_text="The fee is due in March.",
+        )
+        self.chunk = DocumentChunk.objects.create(
+            document=self.document,
+            content="The fee is due in March.",
+            embedding=[0.0] * 1536,
+        )
+        session = ChatSession.objects.create(user=user)
+        self.sources = {
+            "documents": [{"id": self.document.id}],
+            "chunks": ["The fee is due in March.", "A text no chunk has."],
+        }
+        self.message = ChatMessage.objects.create(
+            session=session, role="assistant", content="In March.", sources=self.sources
+        )
+
+    def test_forwards_replaces_copied_texts(self):
+        self.migration.forwards(apps, None)
+
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.sources, {"documents": [{"id": self.document.id}]})
+        self.assertEqual(
+            list(
+                Citation.objects.filter(message=self.message)
+                .order_by("rank")
+                .values_list("chunk_id", "document_id", "end", "excerpt")
+            ),
+            [
+                (self.chunk.id, self.document.id, 24, ""),
+                (None, self.document.id, 20, "A text no chunk has."),
+            ],
+        )
+
+    def test_backwards_restores_the_texts(self):
+        self.migration.forwards(apps, None)
+        self.migration.backwards(apps, None)
+
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.sources, self.sources)
+        self.assertFalse(Citation.objects.exists())
@@ -1,10 +1,13 @@
 from django.urls import path
 from .views import chat_view, delete_chat, export_answer_pdf, export_answer_docx
-from rag.views import chat_view, delete_chat, start_chat_with_context, export_chat_pdf, export_chat_docx, export_selected_messages_pdf, clear_all_chats
+from rag.views import chat_view, chat_messages, message_citations, chat_stream_view, delete_chat, start_chat_with_context, export_chat_pdf, export_chat_docx, export_selected_messages_pdf, export_status, export_download, clear_all_chats
 
 urlpatterns = [
     path("", chat_view, name="chat_view"),
     path("<int:session_id>/", chat_view, name="chat_session"),
+    path("<int:session_id>/stream/", chat_stream_view, name="chat_stream"),
+    path("<int:session_id>/messages/", chat_messages, name="chat_messages"),
+    path("message/<int:message_id>/citations/", message_citations, name="message_citations"),
     path("chat/<int:session_id>/", chat_view, name="chat_view"),
     path("<int:session_id>/delete/", delete_chat, name="delete_chat"),
     path("export/<int:session_id>/", export_chat_pdf, name="export_chat_pdf"),
@@ -25,5 +28,7 @@ urlpatterns = [
         export_selected_messages_pdf,
         name="export_selected_messages_pdf",
     ),
+    path("exports/<int:job_id>/", export_status, name="export_status"),
+    path("exports/<int:job_id>/download/", export_download, name="export_download"),
 
 ]
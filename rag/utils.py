@@ -1,10 +1,13 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.postgres.search import SearchQuery, SearchRank
 
 from documents.models import Document
-from accounts.services.quota import consume_tokens, QuotaExceeded
-from accounts.services.token_estimator import estimate_tokens
+from accounts.auth_context import auth_context
+from accounts.services.quota import QuotaExceeded
 
+from .context import context_budget, count_prompt_tokens, pack_context
+from .llm import get_provider
 from .models import ChatSession, ChatMessage
 from .prompts import REPORT_TEMPLATE, STYLE_PRESETS
 
@@ -79,20 +82,21 @@ def create_onboarding_chat(user):
 # 🔐 API QUOTA ENFORCEMENT
 # =====================================================
 
-def enforce_quota(*, user, text: str):
+def metered_complete(*, user, messages: list[dict], purpose: str, max_tokens=None):
     """
-    Estimate tokens and deduct from organization quota.
+    Metered completion against the organization quota (reserved up
+    front from exact prompt tokens plus `max_tokens`, default
+    CONTEXT_ANSWER_TOKENS, settled to reported usage).
     Superuser/global usage is ignored automatically.
     """
-    profile = user.profile
-    organization = profile.organization
-
-    estimated_tokens = estimate_tokens(text)
-
     try:
-        consume_tokens(
-            organization=organization,
-            tokens=estimated_tokens,
+        return get_provider().complete(
+            messages,
+            max_tokens=max_tokens or settings.CONTEXT_ANSWER_TOKENS,
+            temperature=0.2,
+            user=user,
+            organization=auth_context(user).member_organization,
+            purpose=purpose,
         )
     except QuotaExceeded:
         raise QuotaExceeded(
@@ -121,9 +125,6 @@ def retrieve_documents_for_chat(
     if not question:
         return Document.objects.none()
 
-    profile = user.profile
-    organization = profile.organization
-
     search_query = SearchQuery(question, search_type="websearch")
 
     # =========================
@@ -137,17 +138,17 @@ def retrieve_documents_for_chat(
             is_public=True,
         )
         |
-        # 🏢 Organization documents
-        models.Q(
-            organization=organization
-        )
-        |
         # 👤 Personal documents
         models.Q(
             uploaded_by=user
         )
     )
 
+    # 🏢 Organization documents (active membership, as documents.access)
+    organization_id = auth_context(user).member_organization_id
+    if organization_id is not None:
+        visibility_filter |= models.Q(organization_id=organization_id)
+
     qs = (
         Document.objects
         .annotate(rank=SearchRank("search_vector", search_query))
@@ -236,24 +237,20 @@ def chat_with_context(
     style_config = STYLE_PRESETS.get(style, STYLE_PRESETS["executive"])
 
     # =========================
-    # TOKEN LIMITS
-    # =========================
-    MAX_CHUNKS = 5
-    MAX_CHARS_PER_CHUNK = 2000
-    MAX_SOURCE_CHARS = 8000
-
+    # PREPARE SOURCE MATERIAL (TOKEN BUDGET)
     # =========================
-    # PREPARE SOURCE MATERIAL
-    # =========================
-    cleaned_chunks = []
-
-    for chunk in retrieved_chunks[:MAX_CHUNKS]:
-        text = (chunk.get("text") or "").strip()
-        if not text:
-            continue
-        cleaned_chunks.append(text[:MAX_CHARS_PER_CHUNK])
+    model = get_provider().model
+    packed = pack_context(
+        retrieved_chunks,
+        model=model,
+        budget=context_budget(
+            model,
+            prompt_tokens=count_prompt_tokens(question, REPORT_TEMPLATE, model=model),
+            answer_tokens=settings.REPORT_ANSWER_TOKENS,
+        ),
+    )
 
-    source_material = "\n\n".join(cleaned_chunks)[:MAX_SOURCE_CHARS]
+    source_material = "\n\n".join(c["text"] for c in packed)
 
     document_title = (
         retrieved_chunks[0].get("document_title", "")
@@ -261,14 +258,6 @@ def chat_with_context(
         else ""
     )
 
-    # =========================
-    # 🔐 ENFORCE API QUOTA
-    # =========================
-    enforce_quota(
-        user=user,
-        text=question + source_material
-    )
-
     # =========================
     # ROUTING
     # =========================
@@ -350,19 +339,17 @@ Prepared By:
 {prepared_by}
 """
 
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
     # =========================
-    # OPENAI CALL
+    # OPENAI CALL (METERED)
     # =========================
-    from openai import OpenAI
-    client = OpenAI()
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.2,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+    return metered_complete(
+        user=user,
+        messages=messages,
+        purpose="report",
+        max_tokens=settings.REPORT_ANSWER_TOKENS,
     )
-
-    return response.choices[0].message.content.strip()
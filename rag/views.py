@@ -1,26 +1,52 @@
+from django.conf import settings
 from django.db import transaction
 from django.urls import reverse
-from django.http import HttpResponse, HttpResponseForbidden
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+
+from django.http import (
+    Http404,
+    FileResponse,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce, Substr
+from django.contrib.auth import get_user
 from django.contrib.auth.decorators import login_required
-
-from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from io import BytesIO
-from bs4 import BeautifulSoup
-from docx import Document
+from django.contrib.auth.views import redirect_to_login
 
 import markdown
 
-from rag.models import ChatSession, ChatMessage, ChatContext
+from rag.models import ChatSession, ChatMessage, ChatContext, ExportJob
+from rag.citations import resolve_citations, save_citations
+from rag.exports import (
+    CONTENT_TYPES,
+    export_filename,
+    export_messages,
+    export_title,
+    render_export,
+    request_export,
+)
 from documents.models import Document as UserDocument
-from documents.utils import get_accessible_documents
+from documents.access import can_view, filter_viewable, get_accessible_documents
 from rag.utils import create_onboarding_chat
 from rag.retriever import retrieve_chunks
-from rag.rag_pipeline import rag_answer
-from accounts.models import OrganizationMember
-from documents.models import Folder
+from rag.embeddings import aembed_texts, embed_texts
+from rag.rag_pipeline import rag_answer, arag_answer_stream
+from rag.memory import acontextualize_question, contextualize_question
+from rag.resilience import DeadlineExceeded, ProviderUnavailable, deadline
+from accounts.auth_context import auth_context
+from accounts.services.quota import QuotaExceeded
+from accounts.utils import get_user_organization
+from documents.models import Folder, in_subtrees
 
 
 # =====================================================
@@ -28,26 +54,217 @@ from documents.models import Folder
 # =====================================================
 
 def check_ai_access(user):
-    if not user.is_authenticated:
-        return False, "Login required"
+    """
+    (allowed, error message). Uses the request's auth context, so the
+    middleware's check and this one share one lookup.
+    """
+    return auth_context(user).ai_access()
+
+
+# =====================================================
+# 🔎 CHAT HELPERS (shared by page + streaming views)
+# =====================================================
 
-    if user.is_superuser:
-        return True, None
+QUOTA_EXCEEDED_MESSAGE = (
+    "⚠️ Your organization has exceeded its API quota. "
+    "Please contact your administrator."
+)
+QUOTA_EXCEEDED_ANSWER = "## Answer\n\n" + QUOTA_EXCEEDED_MESSAGE
 
-    member = (
-        OrganizationMember.objects
-        .filter(user=user, is_active=True)
-        .select_related("organization")
-        .first()
+UNAVAILABLE_MESSAGE = (
+    "⚠️ The assistant is busy or unavailable right now. "
+    "Please try again in a moment."
+)
+UNAVAILABLE_ANSWER = "## Answer\n\n" + UNAVAILABLE_MESSAGE
+
+
+def _session_folder(request, user):
+    session_folder_id = request.session.get("active_folder_id")
+
+    if not session_folder_id:
+        return None
+
+    try:
+        return Folder.objects.get(
+            id=int(session_folder_id),
+            uploaded_by=user
+        )
+    except (Folder.DoesNotExist, ValueError):
+        return None
+
+
+def _retrieve_for_chat(
+    user,
+    query,
+    *,
+    active_document,
+    active_folder,
+    restrict_rag,
+    metrics,
+    query_embedding=None,
+):
+    if active_document:
+        return retrieve_chunks(
+            user=user,
+            query=query,
+            document_ids=[active_document.id],
+            k=5,
+            metrics=metrics,
+            query_embedding=query_embedding,
+        )
+
+    if restrict_rag and active_folder:
+        # The folder and all its subfolders
+        return retrieve_chunks(
+            user=user,
+            query=query,
+            folder_ids=[active_folder.id],
+            k=5,
+            metrics=metrics,
+            query_embedding=query_embedding,
+        )
+
+    return retrieve_chunks(
+        user=user,
+        query=query,
+        k=5,
+        metrics=metrics,
+        query_embedding=query_embedding,
     )
 
-    if not member:
-        return False, "AI access restricted"
 
-    if not member.organization or not member.organization.is_active:
-        return False, "Organization is inactive"
+def _embed_query_sync(query, metrics):
+    started = time.perf_counter()
+    embedding = embed_texts([query])[0]
+    metrics["embed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return embedding
+
+
+def _source_documents(retrieved):
+    source_docs = {}
+    for r in retrieved:
+        source_docs[r["document_id"]] = r["document_title"]
 
-    return True, None
+    return [
+        {"id": doc_id, "title": title}
+        for doc_id, title in source_docs.items()
+    ]
+
+
+def _render_answer(answer_md):
+    return markdown.markdown(
+        answer_md,
+        extensions=["extra", "sane_lists"]
+    )
+
+
+@transaction.atomic
+def _save_answer(session, answer_md, retrieved, *, active_folder, restrict_rag, metrics):
+    # Retrieved chunks are referenced by Citation rows, not copied
+    message = ChatMessage.objects.create(
+        session=session,
+        role="assistant",
+        content=_render_answer(answer_md),
+        sources={
+            "documents": _source_documents(retrieved),
+            "restricted_to_folder": active_folder.id if restrict_rag and active_folder else None,
+            "retrieval_metrics": metrics,
+        },
+    )
+    save_citations(message, retrieved)
+    return message
+
+
+def _sidebar_sessions(user):
+    """
+    The user's most recently active sessions (CHAT_SIDEBAR_SESSIONS),
+    each annotated with `last_message_at` and `last_message_preview`:
+    one query, however many sessions and messages there are.
+    """
+    latest = ChatMessage.objects.filter(session=OuterRef("pk")).order_by("-id")
+
+    return list(
+        ChatSession.objects.filter(user=user)
+        .annotate(
+            last_message_at=Subquery(latest.values("created_at")[:1]),
+            last_message_preview=Subquery(
+                latest.annotate(preview=Substr("content", 1, 300)).values("preview")[:1]
+            ),
+        )
+        .only("id", "title", "created_at")
+        .order_by(Coalesce("last_message_at", "created_at").desc(), "-id")
+        [:settings.CHAT_SIDEBAR_SESSIONS]
+    )
+
+
+def _message_page(session, *, before=None):
+    """
+    (messages, has_older): the CHAT_HISTORY_PAGE_SIZE messages of
+    `session` preceding message id `before` (default: the newest),
+    oldest first. Keyset pagination on id, one query per page.
+    """
+    size = settings.CHAT_HISTORY_PAGE_SIZE
+    page = session.messages.order_by("-id")
+    if before is not None:
+        page = page.filter(id__lt=before)
+
+    page = list(page[:size + 1])
+    return page[:size][::-1], len(page) > size
+
+
+def _answer_turn(
+    session,
+    query,
+    *,
+    user,
+    organization,
+    before_id,
+    active_document,
+    active_folder,
+    restrict_rag,
+    metrics,
+):
+    """
+    (answer_md, retrieved) for one page-view chat turn.
+    """
+    # Follow-ups ("and section 5?") become standalone questions
+    question = contextualize_question(
+        session,
+        query,
+        before_id=before_id,
+        user=user,
+        organization=organization,
+        metrics=metrics,
+    )
+
+    try:
+        query_embedding = _embed_query_sync(question, metrics)
+
+        retrieved = _retrieve_for_chat(
+            user,
+            question,
+            active_document=active_document,
+            active_folder=active_folder,
+            restrict_rag=restrict_rag,
+            metrics=metrics,
+            query_embedding=query_embedding,
+        )
+
+        answer_md = rag_answer(
+            question=question,
+            chunks=retrieved,
+            user=user,
+            organization=organization,
+            query_embedding=query_embedding,
+            metrics=metrics,
+        )
+    except QuotaExceeded:
+        return QUOTA_EXCEEDED_ANSWER, []
+    except (DeadlineExceeded, ProviderUnavailable) as e:
+        print(f"[CHAT] turn failed fast: {e}")
+        return UNAVAILABLE_ANSWER, []
+
+    return answer_md, retrieved
 
 
 # =====================================================
@@ -63,17 +280,17 @@ def chat_view(request, session_id=None):
     if not allowed:
         return HttpResponseForbidden(error)
 
-    create_onboarding_chat(user)
-
-    sessions = ChatSession.objects.filter(user=user).order_by("-created_at")
-
-    # Get or create session
+    # Get or create session. The sidebar is only loaded when needed:
+    # a user with a session id already has their onboarding chat.
+    sessions = None
     if session_id:
         session = get_object_or_404(ChatSession, id=session_id, user=user)
     else:
-        session = sessions.first() or ChatSession.objects.create(user=user)
-
-    messages = session.messages.order_by("created_at")
+        sessions = _sidebar_sessions(user)
+        if not sessions:
+            create_onboarding_chat(user)
+            sessions = _sidebar_sessions(user)
+        session = sessions[0] if sessions else ChatSession.objects.create(user=user)
 
    # =====================================================
 # 📁 FOLDER CONTEXT (PERSISTENT)
@@ -84,18 +301,8 @@ def chat_view(request, session_id=None):
     if folder_id:
         request.session["active_folder_id"] = folder_id
 
-    active_folder = None
-    session_folder_id = request.session.get("active_folder_id")
+    active_folder = _session_folder(request, user)
 
-    if session_folder_id:
-        try:
-            active_folder = Folder.objects.get(
-                id=int(session_folder_id),
-                uploaded_by=user
-            )
-        except (Folder.DoesNotExist, ValueError):
-            active_folder = None
-    
 
     # =====================================================
     # 📄 Document context
@@ -103,10 +310,9 @@ def chat_view(request, session_id=None):
     doc_id = request.GET.get("doc")
     active_document = None
 
-    if doc_id:
-        try:
-            active_document = get_accessible_documents(user).get(id=doc_id)
-        except Document.DoesNotExist:
+    if doc_id and doc_id.isdigit():
+        active_document = UserDocument.objects.filter(id=doc_id).first()
+        if active_document and not can_view(user, active_document):
             active_document = None
 
     # =====================================================
@@ -121,72 +327,35 @@ def chat_view(request, session_id=None):
         query = request.POST.get("query", "").strip()
 
         if query:
-            ChatMessage.objects.create(
+            user_message = ChatMessage.objects.create(
                 session=session,
                 role="user",
                 content=query,
             )
-
-            # ===============================
-            # RETRIEVAL LOGIC
-            # ===============================
-            if active_document:
-                retrieved = retrieve_chunks(
+            organization = get_user_organization(user)
+            retrieval_metrics = {}
+
+            # One time budget for memory, embedding, retrieval and answer
+            with deadline(settings.CHAT_DEADLINE):
+                answer_md, retrieved = _answer_turn(
+                    session,
+                    query,
                     user=user,
-                    query=query,
-                    document_ids=[active_document.id],
-                    k=5,
+                    organization=organization,
+                    before_id=user_message.id,
+                    active_document=active_document,
+                    active_folder=active_folder,
+                    restrict_rag=restrict_rag,
+                    metrics=retrieval_metrics,
                 )
 
-            elif restrict_rag and active_folder:
-                folder_docs = get_accessible_documents(user).filter(
-                    folder=active_folder
-                )
-
-                retrieved = retrieve_chunks(
-                    user=user,
-                    query=query,
-                    document_ids=list(folder_docs.values_list("id", flat=True)),
-                    k=5,
-                )
-
-            else:
-                retrieved = retrieve_chunks(
-                    user=user,
-                    query=query,
-                    k=5,
-                )
-
-            retrieved_texts = [r["text"] for r in retrieved]
-
-            answer_md = rag_answer(
-                question=query,
-                chunks=retrieved,
-            )
-
-            answer_html = markdown.markdown(
+            _save_answer(
+                session,
                 answer_md,
-                extensions=["extra", "sane_lists"]
-            )
-
-            source_docs = {}
-            for r in retrieved:
-                source_docs[r["document_id"]] = r["document_title"]
-
-            formatted_sources = [
-                {"id": doc_id, "title": title}
-                for doc_id, title in source_docs.items()
-            ]
-
-            ChatMessage.objects.create(
-                session=session,
-                role="assistant",
-                content=answer_html,
-                sources={
-                    "documents": formatted_sources,
-                    "chunks": retrieved_texts,
-                    "restricted_to_folder": active_folder.id if restrict_rag and active_folder else None,
-                },
+                retrieved,
+                active_folder=active_folder,
+                restrict_rag=restrict_rag,
+                metrics=retrieval_metrics,
             )
 
         return redirect("chat_session", session_id=session.id)
@@ -194,6 +363,11 @@ def chat_view(request, session_id=None):
     # =====================================================
     # RENDER
     # =====================================================
+    if sessions is None:
+        sessions = _sidebar_sessions(user)
+
+    messages, has_older = _message_page(session)
+
     return render(
         request,
         "chat/chat.html",
@@ -201,6 +375,7 @@ def chat_view(request, session_id=None):
             "sessions": sessions,
             "active_session": session,
             "messages": messages,
+            "has_older": has_older,
             "active_document": active_document,
             "active_folder": active_folder,
             "restrict_rag": restrict_rag,
@@ -209,6 +384,263 @@ def chat_view(request, session_id=None):
 
 
 
+# =====================================================
+# 📜 OLDER MESSAGES ("LOAD OLDER")
+# =====================================================
+
+@login_required
+def chat_messages(request, session_id):
+    """
+    JSON page of messages older than ?before=<message id>:
+    {"html", "has_older", "before"} (`before` for the next page).
+    """
+    allowed, error = check_ai_access(request.user)
+    if not allowed:
+        return HttpResponseForbidden(error)
+
+    session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+
+    before = request.GET.get("before")
+    if before is not None and not before.isdigit():
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    messages, has_older = _message_page(
+        session, before=int(before) if before else None
+    )
+
+    return JsonResponse({
+        "html": render_to_string(
+            "chat/_messages.html", {"messages": messages}, request=request
+        ),
+        "has_older": has_older,
+        "before": messages[0].id if messages else None,
+    })
+
+
+@login_required
+def message_citations(request, message_id):
+    """
+    JSON: the passages an answer was built from, best first
+    (chunk texts are loaded here, not stored with the message).
+    """
+    message = get_object_or_404(
+        ChatMessage, id=message_id, role="assistant", session__user=request.user
+    )
+
+    citations = resolve_citations(
+        list(message.citations.select_related("document").order_by("rank"))
+    )
+
+    return JsonResponse({
+        "citations": [
+            {
+                "rank": c.rank,
+                "document_id": c.document_id,
+                "document_title": c.document.display_name if c.document else None,
+                "score": c.score,
+                "text": c.text,
+            }
+            for c in citations
+        ],
+    })
+
+
+# =====================================================
+# 📡 STREAMING CHAT (SERVER-SENT EVENTS)
+# =====================================================
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _stream_scope(request, user, doc_id):
+    """
+    (active_document, active_folder, restrict_rag, organization)
+    for a streamed turn.
+    """
+    active_document = None
+    if doc_id and doc_id.isdigit():
+        active_document = UserDocument.objects.filter(id=doc_id).first()
+        if active_document and not can_view(user, active_document):
+            active_document = None
+
+    return (
+        active_document,
+        _session_folder(request, user),
+        request.session.get("restrict_rag", False),
+        get_user_organization(user),
+    )
+
+
+async def _embed_query(query, metrics):
+    started = time.perf_counter()
+    embedding = (await aembed_texts([query]))[0]
+    metrics["embed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return embedding
+
+
+async def _answer_events(
+    session,
+    query,
+    *,
+    user,
+    query_embedding,
+    active_document,
+    active_folder,
+    restrict_rag,
+    organization,
+    metrics,
+    expires,
+):
+    """
+    SSE stream: `sources` first, then one `token` per answer delta,
+    then `done` with the saved message id and rendered HTML.
+    The assistant message is saved once generation stops, also when
+    the client disconnects mid-answer. Retrieval and generation run
+    under the turn's deadline (`expires`, time.monotonic()).
+    """
+    with deadline(until=expires):
+        try:
+            retrieved = await sync_to_async(_retrieve_for_chat)(
+                user,
+                query,
+                active_document=active_document,
+                active_folder=active_folder,
+                restrict_rag=restrict_rag,
+                metrics=metrics,
+                query_embedding=query_embedding,
+            )
+        except Exception as e:
+            print(f"[CHAT STREAM] retrieval failed: {e}")
+            yield _sse("error", {"error": "Retrieval failed"})
+            return
+
+        yield _sse("sources", {"documents": _source_documents(retrieved)})
+
+        parts = []
+        message = None
+
+        try:
+            async for delta in arag_answer_stream(
+                question=query,
+                chunks=retrieved,
+                user=user,
+                organization=organization,
+                query_embedding=query_embedding,
+                metrics=metrics,
+            ):
+                parts.append(delta)
+                yield _sse("token", {"delta": delta})
+        except QuotaExceeded:
+            yield _sse("error", {"error": QUOTA_EXCEEDED_MESSAGE})
+        except Exception as e:
+            print(f"[CHAT STREAM] generation failed: {e}")
+            yield _sse("error", {"error": "Answer generation failed"})
+        finally:
+            if parts:
+                message = await sync_to_async(_save_answer)(
+                    session,
+                    "".join(parts),
+                    retrieved,
+                    active_folder=active_folder,
+                    restrict_rag=restrict_rag,
+                    metrics=metrics,
+                )
+
+        if message:
+            yield _sse("done", {"message_id": message.id, "html": message.content})
+
+
+async def chat_stream_view(request, session_id):
+    """
+    Async (ASGI) chat turn. While the model streams, the request holds
+    no worker thread; DB work runs via sync_to_async / async ORM.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    allowed, error = await sync_to_async(check_ai_access)(user)
+    if not allowed:
+        return HttpResponseForbidden(error)
+
+    query = request.POST.get("query", "").strip()
+    if not query:
+        return JsonResponse({"error": "Empty question"}, status=400)
+
+    doc_id = request.POST.get("doc") or request.GET.get("doc")
+    retrieval_metrics = {}
+
+    # One time budget for the whole turn, streamed answer included
+    expires = time.monotonic() + settings.CHAT_DEADLINE
+
+    with deadline(until=expires):
+        # Independent stages overlap: session + scope lookups (DB thread)
+        # run while the query embedding is in flight.
+        try:
+            session, scope, query_embedding = (
+                await asyncio.gather(
+                    ChatSession.objects.filter(id=session_id, user=user).afirst(),
+                    sync_to_async(_stream_scope)(request, user, doc_id),
+                    _embed_query(query, retrieval_metrics),
+                )
+            )
+        except (DeadlineExceeded, ProviderUnavailable) as e:
+            print(f"[CHAT STREAM] embedding failed fast: {e}")
+            return JsonResponse({"error": UNAVAILABLE_MESSAGE}, status=503)
+
+    if session is None:
+        raise Http404("Chat not found")
+
+    active_document, active_folder, restrict_rag, organization = scope
+
+    user_message = await ChatMessage.objects.acreate(
+        session=session,
+        role="user",
+        content=query,
+    )
+
+    # Follow-ups are rewritten from conversation memory; the embedding
+    # above is only reused when the question stands on its own.
+    with deadline(until=expires):
+        question = await acontextualize_question(
+            session,
+            query,
+            before_id=user_message.id,
+            user=user,
+            organization=organization,
+            metrics=retrieval_metrics,
+        )
+        if question != query:
+            try:
+                query_embedding = await _embed_query(question, retrieval_metrics)
+            except (DeadlineExceeded, ProviderUnavailable) as e:
+                # The raw question's embedding still retrieves something
+                print(f"[CHAT STREAM] re-embedding failed fast: {e}")
+
+    response = StreamingHttpResponse(
+        _answer_events(
+            session,
+            question,
+            user=user,
+            query_embedding=query_embedding,
+            active_document=active_document,
+            active_folder=active_folder,
+            restrict_rag=restrict_rag,
+            organization=organization,
+            metrics=retrieval_metrics,
+            expires=expires,
+        ),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
+
+
 # =====================================================
 # ❌ DELETE CHAT
 # =====================================================
@@ -235,15 +667,19 @@ def start_chat_with_context(request):
 
     session = ChatSession.objects.create(user=request.user)
 
-    documents = get_accessible_documents(request.user)
-
     if document_ids:
-        documents = documents.filter(id__in=document_ids)
+        documents = UserDocument.objects.filter(
+            id__in=filter_viewable(request.user, document_ids)
+        )
+    else:
+        documents = get_accessible_documents(request.user)
 
     if folder_ids:
-        documents = documents.filter(folder_id__in=folder_ids)
+        # Subfolders included
+        folders = Folder.objects.filter(id__in=[i for i in folder_ids if i.isdigit()])
+        documents = documents.filter(in_subtrees(folders))
 
-    for doc in documents.distinct():
+    for doc in documents:
         ChatContext.objects.get_or_create(
             session=session,
             document=doc
@@ -253,60 +689,72 @@ def start_chat_with_context(request):
 
 
 # =====================================================
-# 📄 EXPORT CHAT PDF
+# 📄 EXPORT CHAT (PDF / DOCX)
 # =====================================================
 
-@login_required
-def export_chat_pdf(request, session_id):
-    session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+def _export_chat(request, session, format, message_ids=None):
+    """
+    Small exports stream back directly; large ones become an
+    ExportJob and redirect to its status page.
+    """
     messages = session.messages.all()
+    if message_ids is not None:
+        messages = messages.filter(id__in=message_ids)
 
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="chat_{session.id}.pdf"'
-
-    pdf = canvas.Canvas(response)
-    y = 800
-
-    for msg in messages:
-        pdf.drawString(40, y, f"{msg.role.upper()}:")
-        y -= 20
-
-        for line in msg.content.split("\n"):
-            pdf.drawString(60, y, line[:120])
-            y -= 15
+    if messages.count() > settings.EXPORT_INLINE_MAX_MESSAGES:
+        job = request_export(
+            user=request.user,
+            session=session,
+            format=format,
+            message_ids=message_ids,
+        )
+        return redirect("export_status", job_id=job.id)
 
-        y -= 20
-        if y < 100:
-            pdf.showPage()
-            y = 800
+    rendered = render_export(
+        format,
+        title=export_title(session),
+        messages=export_messages(session, message_ids),
+    )
+    return FileResponse(
+        rendered,
+        as_attachment=True,
+        filename=export_filename(session, format, selected=message_ids is not None),
+        content_type=CONTENT_TYPES[format],
+    )
 
-    pdf.save()
-    return response
 
+@login_required
+def export_chat_pdf(request, session_id):
+    session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+    return _export_chat(request, session, ExportJob.PDF)
 
-# =====================================================
-# 📄 EXPORT CHAT DOCX
-# =====================================================
 
 @login_required
 def export_chat_docx(request, session_id):
     session = get_object_or_404(ChatSession, id=session_id, user=request.user)
-    messages = session.messages.all()
+    return _export_chat(request, session, ExportJob.DOCX)
 
-    doc = Document()
-    doc.add_heading(session.title or "Chat Export", level=1)
 
-    for msg in messages:
-        p = doc.add_paragraph()
-        p.add_run(msg.role.upper()).bold = True
-        doc.add_paragraph(msg.content)
+@login_required
+def export_status(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id, user=request.user)
+    return render(request, "chat/export_status.html", {"job": job})
+
 
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+@login_required
+def export_download(request, job_id):
+    job = get_object_or_404(
+        ExportJob, id=job_id, user=request.user, status=ExportJob.DONE
+    )
+    if not job.file:
+        raise Http404("Export file is gone")
+
+    return FileResponse(
+        job.file.open("rb"),
+        as_attachment=True,
+        filename=export_filename(job.session, job.format, selected=job.message_ids is not None),
+        content_type=CONTENT_TYPES[job.format],
     )
-    response["Content-Disposition"] = f'attachment; filename="chat_{session.id}.docx"'
-    doc.save(response)
-    return response
 
 
 # =====================================================
@@ -322,23 +770,15 @@ def export_answer_pdf(request, message_id):
         session__user=request.user
     )
 
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer)
-    styles = getSampleStyleSheet()
-    story = []
-
-    soup = BeautifulSoup(message.content, "html.parser")
-
-    for element in soup.find_all(["h2", "h3", "p", "li"]):
-        story.append(Paragraph(element.get_text(), styles["Normal"]))
-
-    doc.build(story)
-
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type="application/pdf")
-    response["Content-Disposition"] = "attachment; filename=answer.pdf"
-
-    return response
+    rendered = render_export(
+        ExportJob.PDF, title="Answer", messages=[message]
+    )
+    return FileResponse(
+        rendered,
+        as_attachment=True,
+        filename="answer.pdf",
+        content_type=CONTENT_TYPES[ExportJob.PDF],
+    )
 
 
 # =====================================================
@@ -354,18 +794,15 @@ def export_answer_docx(request, message_id):
         session__user=request.user
     )
 
-    doc = Document()
-    soup = BeautifulSoup(message.content, "html.parser")
-
-    for el in soup.find_all(["h2", "h3", "p", "li"]):
-        doc.add_paragraph(el.get_text())
-
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    rendered = render_export(
+        ExportJob.DOCX, title="Answer", messages=[message]
+    )
+    return FileResponse(
+        rendered,
+        as_attachment=True,
+        filename="answer.docx",
+        content_type=CONTENT_TYPES[ExportJob.DOCX],
     )
-    response["Content-Disposition"] = "attachment; filename=answer.docx"
-    doc.save(response)
-    return response
 
 
 # =====================================================
@@ -389,27 +826,5 @@ def clear_all_chats(request):
 @login_required
 def export_selected_messages_pdf(request, session_id):
     session = get_object_or_404(ChatSession, id=session_id, user=request.user)
-    ids = request.POST.getlist("message_ids")
-    messages = session.messages.filter(id__in=ids)
-
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = "attachment; filename=selected_messages.pdf"
-
-    pdf = canvas.Canvas(response)
-    y = 800
-
-    for msg in messages:
-        pdf.drawString(40, y, f"{msg.role.upper()}:")
-        y -= 18
-
-        for line in msg.content.split("\n"):
-            pdf.drawString(60, y, line[:120])
-            y -= 14
-
-        y -= 20
-        if y < 100:
-            pdf.showPage()
-            y = 800
-
-    pdf.save()
-    return response
+    ids = [int(i) for i in request.POST.getlist("message_ids") if i.isdigit()]
+    return _export_chat(request, session, ExportJob.PDF, message_ids=ids)
@@ -109,7 +109,10 @@ if os.getenv("USE_LOCAL_DB") == "True":
 else:
     DATABASES = {
         "default": dj_database_url.config(
-            conn_max_age=600,
+            # Served over ASGI: Django's persistent connections are
+            # per-thread and leak across the sync_to_async pool, so they
+            # are off by default (use a pooler such as PgBouncer).
+            conn_max_age=int(os.getenv("DB_CONN_MAX_AGE", 0)),
             ssl_require=True,
         )
     }
@@ -133,6 +136,13 @@ LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "document_list"
 LOGOUT_REDIRECT_URL = "/accounts/login/"
 
+# Per-user auth context snapshot (accounts.auth_context), cached across
+# requests only when this alias is a shared cache (Redis, Memcached,
+# database...): a LocMemCache alias is ignored, since signal
+# invalidation would only reach one process
+AUTH_CONTEXT_CACHE = os.getenv("AUTH_CONTEXT_CACHE", "default")
+AUTH_CONTEXT_TTL = 300                  # seconds
+
 # --------------------------------------------------
 # INTERNATIONALIZATION
 # --------------------------------------------------
@@ -160,11 +170,111 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # OPENAI / RAG SETTINGS
 # --------------------------------------------------
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Any OpenAI-compatible endpoint, e.g. `manage.py fake_openai_server` for offline dev
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 
 FAISS_INDEX_DIR = BASE_DIR / "faiss_indexes"
 EMBEDDING_MODEL = "text-embedding-3-small"
-CHAT_MODEL = "gpt-4o-mini"
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+
+# Chat completion providers (rag.llm.get_provider); every generation
+# site uses "default". Point BASE_URL at `manage.py fake_openai_server`
+# to load-test without real API calls.
+LLM_PROVIDERS = {
+    "default": {
+        "MODEL": CHAT_MODEL,
+        "BASE_URL": OPENAI_BASE_URL,
+        "API_KEY": OPENAI_API_KEY,
+        "TIMEOUT": float(os.getenv("LLM_TIMEOUT", 60)),        # seconds per request
+        "MAX_RETRIES": int(os.getenv("LLM_MAX_RETRIES", 2)),
+        "STREAMING": os.getenv("LLM_STREAMING", "True") == "True",
+    },
+}
+# Cheaper model used while the default provider's circuit breaker is open
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL") or None
+if LLM_FALLBACK_MODEL:
+    LLM_PROVIDERS["fallback"] = {**LLM_PROVIDERS["default"], "MODEL": LLM_FALLBACK_MODEL}
+    LLM_PROVIDERS["default"]["FALLBACK"] = "fallback"
 EMBEDDING_DIM = 1536
+# "openai" or "local" (deterministic hashed embedder, no network; dev/benchmarks)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+# Token-based chunking (rag.chunking.iter_chunks)
+CHUNK_ENCODING = "cl100k_base"          # tokenizer of text-embedding-3-*
+CHUNK_MAX_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+
+# Rebuild a FAISS namespace once this share of its vectors is dead
+FAISS_COMPACTION_THRESHOLD = float(os.getenv("FAISS_COMPACTION_THRESHOLD", 0.2))
+
+# Accessible documents one retrieval call searches at most
+RETRIEVAL_MAX_DOCUMENTS = int(os.getenv("RETRIEVAL_MAX_DOCUMENTS", 50))  # 0 = no cap
+
+# Post-retrieval diversification (MMR)
+RETRIEVAL_MMR_ENABLED = os.getenv("RETRIEVAL_MMR_ENABLED", "True") == "True"
+RETRIEVAL_MMR_FETCH_MULTIPLIER = 4      # candidates fetched = k * multiplier
+RETRIEVAL_MMR_LAMBDA = 0.7              # 1.0 = relevance only, 0.0 = diversity only
+RETRIEVAL_DEDUP_THRESHOLD = 0.95        # cosine similarity treated as duplicate
+
+# Lexical rerank (BM25 over the top vector candidates)
+RETRIEVAL_BM25_ENABLED = os.getenv("RETRIEVAL_BM25_ENABLED", "False") == "True"
+RETRIEVAL_RERANK_CANDIDATES = 100
+RETRIEVAL_BM25_WEIGHT = 0.3             # share of the blended score from BM25
+
+# Two-stage search: Hamming on binary-quantized vectors, then exact rescoring
+RETRIEVAL_QUANTIZED_SEARCH = os.getenv("RETRIEVAL_QUANTIZED_SEARCH", "False") == "True"
+RETRIEVAL_QUANTIZED_CANDIDATES = 300
+
+# Token-budgeted prompt context (rag.context.pack_context)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4.1-mini": 1_047_576,
+    "gpt-3.5-turbo": 16_385,
+}
+MODEL_CONTEXT_WINDOW_DEFAULT = 16_385
+CONTEXT_SOURCE_TOKENS = int(os.getenv("CONTEXT_SOURCE_TOKENS", 4000))  # cap on sources per prompt
+CONTEXT_ANSWER_TOKENS = 1500            # reserved for the completion (max_tokens, quota reservation)
+REPORT_ANSWER_TOKENS = int(os.getenv("REPORT_ANSWER_TOKENS", 8192))  # same, for generated reports
+
+# Conversation memory (rag.memory): recent turns verbatim + rolling summary
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", 3))   # 0 disables follow-up rewriting
+CHAT_MEMORY_MESSAGE_TOKENS = 300        # each remembered message is clipped to this
+CHAT_MEMORY_SUMMARY_TOKENS = 250        # cap on ChatSession.summary
+
+# Chat page: keyset-paginated history, bounded sidebar
+CHAT_HISTORY_PAGE_SIZE = 30             # messages per page ("load older" fetches the next)
+CHAT_SIDEBAR_SESSIONS = 50              # most recently active sessions listed
+
+# Chat exports (rag.exports): small ones stream, large ones run as ExportJobs
+EXPORT_INLINE_MAX_MESSAGES = 200        # larger exports are rendered in the background
+EXPORT_ARTIFACT_TTL = 24 * 3600         # seconds a rendered export is kept and reused
+EXPORT_SPOOL_BYTES = 5 * 1024 * 1024    # in-memory render buffer before spilling to disk
+# "thread": render right after the request; "command": `manage.py run_exports` worker
+EXPORT_WORKER = os.getenv("EXPORT_WORKER", "thread")
+
+# Coalesce identical in-flight LLM / embedding calls (rag.singleflight)
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "True") == "True"
+SINGLE_FLIGHT_CACHE = os.getenv("SINGLE_FLIGHT_CACHE") or None  # shared cache alias: across processes
+SINGLE_FLIGHT_TIMEOUT = 60              # seconds to wait for another process's call
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05      # seconds
+
+# Request deadlines, hedged embeddings, circuit breaking (rag.resilience)
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", 60))   # seconds per chat turn, all stages
+EMBEDDING_HEDGE_ENABLED = os.getenv("EMBEDDING_HEDGE_ENABLED", "True") == "True"
+EMBEDDING_HEDGE_PERCENTILE = 95         # second attempt after this latency percentile
+EMBEDDING_HEDGE_MIN_SAMPLES = 20        # no hedging until this many latencies were seen
+EMBEDDING_HEDGE_MIN_DELAY = 0.05        # seconds
+EMBEDDING_HEDGE_WORKERS = int(os.getenv("EMBEDDING_HEDGE_WORKERS", 8))  # threads for hedged attempts, per process
+LLM_BREAKER_WINDOW = 30                 # seconds of outcomes the error rate is measured over
+LLM_BREAKER_MIN_CALLS = 10              # no tripping on fewer calls than this
+LLM_BREAKER_ERROR_RATE = 0.5            # share of upstream failures that opens the circuit
+LLM_BREAKER_COOLDOWN = 30               # seconds open before a probe call
+
+# Per-organization answer cache (rag.answer_cache)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "True") == "True"
+ANSWER_CACHE_TTL = 7 * 24 * 3600             # seconds
+ANSWER_CACHE_PARAPHRASE_DISTANCE = 0.05      # cosine; 0 disables paraphrase lookup
 
 # --------------------------------------------------
 # UPLOAD LIMITS